@@ -0,0 +1,317 @@
+"""Local voice agent: microphone in, speakers out, every stage running at once.
+
+    python agent.py                          # microphone and speakers
+    python agent.py question.wav --out reply.wav
+
+Capture, STT, LLM streaming, TTS and playback are concurrent asyncio stages
+joined by queues: a sentence is synthesized while the one before it plays,
+and the microphone keeps listening while the assistant talks. Speaking over
+a reply (barge-in) cancels its generation and playback. Without echo
+cancellation the assistant can interrupt itself through the speakers; use
+headphones or AGENT_BARGE_IN=false.
+
+Sources are async iterables of 16 kHz mono float32 blocks and sinks have
+async play(pcm, sample_rate) / stop(), so the whole loop runs headless
+against WAV files.
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+import uuid
+import wave
+from typing import AsyncIterable, AsyncIterator, Iterable, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+import inference
+import llm
+import sessions
+import stt
+import tts
+from audio import read_wav_pcm
+from capture import MicSource, WavFileSource
+from prompts import get_urgency_assessment, EMERGENCY_AUDIO_RESPONSE, FALLBACK_REPLY
+from streaming import aiter_sentences, normalize_for_speech
+from vad import SAMPLE_RATE, EnergyEndpointer
+
+load_dotenv()
+
+# ---------------- CONFIG ----------------
+AGENT_BARGE_IN = os.getenv("AGENT_BARGE_IN", "true").lower() in ("1", "true", "yes")
+# Synthesized sentences waiting to be played; bounds how far TTS runs ahead
+AGENT_AUDIO_QUEUE = int(os.getenv("AGENT_AUDIO_QUEUE", "2"))
+# Playback is written in slices this long so a barge-in stops it promptly
+PLAYBACK_SLICE_SECONDS = 0.05
+# Silence appended to a file source so the last turn is ended
+TRAILING_SILENCE_SECONDS = 1.5
+
+
+# ---------------- SOURCES ----------------
+async def mic_blocks(source: Optional[MicSource] = None) -> AsyncIterator[np.ndarray]:
+    """Microphone blocks; sounddevice's blocking reads stay on a capture thread"""
+    async for block in _threaded(source or MicSource()):
+        yield block
+
+
+async def _threaded(blocks: Iterable[np.ndarray]) -> AsyncIterator[np.ndarray]:
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def pump():
+        for block in blocks:
+            loop.call_soon_threadsafe(queue.put_nowait, block)
+
+    threading.Thread(target=pump, daemon=True, name="capture").start()
+    while True:
+        yield await queue.get()
+
+
+async def file_blocks(path: str, realtime: bool = True) -> AsyncIterator[np.ndarray]:
+    """A WAV file as if spoken into the microphone, followed by trailing silence"""
+    source = WavFileSource(path)
+    silence = np.zeros(int(TRAILING_SILENCE_SECONDS * SAMPLE_RATE), dtype=np.float32)
+    audio = np.concatenate([source.audio, silence])
+    for start in range(0, len(audio), source.block):
+        yield audio[start:start + source.block]
+        await asyncio.sleep(source.block / SAMPLE_RATE if realtime else 0)
+
+
+# ---------------- SINKS ----------------
+class SpeakerSink:
+    """Plays reply audio on the default output device"""
+
+    def __init__(self):
+        self._stream = None
+        self._sample_rate = None
+
+    def _open(self, sample_rate: int):
+        import sounddevice as sd
+
+        if self._sample_rate != sample_rate:
+            self.close()
+            self._stream = sd.OutputStream(samplerate=sample_rate, channels=1, dtype="int16")
+            self._stream.start()
+            self._sample_rate = sample_rate
+        return self._stream
+
+    async def play(self, pcm: bytes, sample_rate: int):
+        stream = self._open(sample_rate)
+        samples = np.frombuffer(pcm, dtype="<i2")
+        step = int(PLAYBACK_SLICE_SECONDS * sample_rate)
+        for start in range(0, len(samples), step):
+            await asyncio.to_thread(stream.write, samples[start:start + step])
+
+    def stop(self):
+        if self._stream is not None:
+            # Drop whatever is still buffered in the device
+            self._stream.abort()
+            self._stream.start()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+            self._sample_rate = None
+
+
+class WavSink:
+    """Collects reply audio (and optionally writes it to a WAV file) instead of playing it.
+
+    With realtime=True play() takes as long as the audio lasts, like a
+    speaker would, so barge-in can be exercised headless.
+    """
+
+    def __init__(self, path: Optional[str] = None, realtime: bool = False):
+        self.path = path
+        self.realtime = realtime
+        self.played = bytearray()
+        self.sample_rate: Optional[int] = None
+        self.stops = 0
+
+    async def play(self, pcm: bytes, sample_rate: int):
+        self.sample_rate = sample_rate
+        step = int(PLAYBACK_SLICE_SECONDS * sample_rate) * 2
+        for start in range(0, len(pcm), step):
+            chunk = pcm[start:start + step]
+            if self.realtime:
+                await asyncio.sleep(len(chunk) / 2 / sample_rate)
+            self.played.extend(chunk)
+
+    def stop(self):
+        self.stops += 1
+
+    def close(self):
+        if self.path and self.sample_rate:
+            with wave.open(self.path, "wb") as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(self.sample_rate)
+                wf.writeframes(bytes(self.played))
+
+
+# ---------------- AGENT ----------------
+class Agent:
+    """One local conversation: utterances from source, replies to sink.
+
+    Capture runs for the whole session; each finished utterance starts a
+    reply task that transcribes it, then streams LLM sentences → Piper PCM
+    → playback through two queues, so all three overlap.
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterable[np.ndarray],
+        sink,
+        endpointer: Optional[EnergyEndpointer] = None,
+        barge_in: bool = AGENT_BARGE_IN
+    ):
+        self.source = source
+        self.sink = sink
+        self.endpointer = endpointer or EnergyEndpointer()
+        self.barge_in = barge_in
+        # Kept in memory only: the context carries over between turns
+        self.conversation = sessions.Conversation(uuid.uuid4().hex, "local")
+        self.utterances: asyncio.Queue = asyncio.Queue()
+        self.reply_task: Optional[asyncio.Task] = None
+        self.transcripts = []
+        self.interruptions = 0
+
+    async def run(self):
+        """Converse until the source runs out and the last reply has finished"""
+        capturing = asyncio.create_task(self._capture())
+        try:
+            while (utterance := await self.utterances.get()) is not None:
+                self.reply_task = asyncio.create_task(self.respond(utterance))
+                await asyncio.wait({self.reply_task})
+        finally:
+            capturing.cancel()
+            if self.reply_task is not None:
+                self.reply_task.cancel()
+
+    async def _capture(self):
+        async for block in self.source:
+            for event, utterance in self.endpointer.feed(block):
+                if event == "start":
+                    self.interrupt()
+                    print("\n🎤 Listening...")
+                else:
+                    await self.utterances.put(utterance)
+        tail = self.endpointer.flush()
+        if tail is not None:
+            await self.utterances.put(tail)
+        await self.utterances.put(None)
+
+    def interrupt(self):
+        """🛑 Barge-in: the user talking over a reply cancels it"""
+        if not self.barge_in or self.reply_task is None or self.reply_task.done():
+            return
+        self.reply_task.cancel()
+        self.sink.stop()
+        self.interruptions += 1
+        print("🛑 Interrupted")
+
+    # ---------------- TURN HANDLING ----------------
+    async def respond(self, utterance: np.ndarray):
+        try:
+            await self._respond(utterance)
+        except* inference.InferenceRejected as e:
+            print(f"❌ Busy: {e.exceptions[0]}")
+        except* llm.LLMError as e:
+            print(f"❌ LLM error: {e.exceptions[0]}")
+        except* Exception as e:
+            print(f"❌ Error: {e.exceptions[0]}")
+
+    async def _respond(self, utterance: np.ndarray):
+        start = time.perf_counter()
+        user_text = (await stt.transcribe_array(utterance)).strip()
+        if not user_text:
+            print("⚠️ Didn't catch that. Speak again.")
+            return
+        self.transcripts.append(user_text)
+        print(f"🧑 You: {user_text} ({time.perf_counter() - start:.2f}s)")
+
+        # 🚨 Emergencies get the pre-rendered clip, not the LLM
+        if get_urgency_assessment(user_text)["level"] == "emergency":
+            print(f"🤖 AI: {EMERGENCY_AUDIO_RESPONSE}")
+            audio = await tts.canned_or_synthesize(EMERGENCY_AUDIO_RESPONSE, priority=inference.PRIORITY_EMERGENCY)
+            pcm = read_wav_pcm(audio) if audio else None
+            if pcm is not None:
+                await self.sink.play(bytes(pcm[0]), pcm[1])
+            elif tts.PIPER_AVAILABLE:
+                # An ElevenLabs clip is MP3, which the sink can't play; say it with Piper
+                spoken = normalize_for_speech(EMERGENCY_AUDIO_RESPONSE)
+                for data, sample_rate in await tts.piper_pcm(spoken, priority=inference.PRIORITY_EMERGENCY):
+                    await self.sink.play(data, sample_rate)
+            else:
+                print("⚠️ Emergency clip is not WAV and Piper is unavailable; nothing to play")
+            return
+
+        sentences: asyncio.Queue = asyncio.Queue()
+        speech: asyncio.Queue = asyncio.Queue(maxsize=AGENT_AUDIO_QUEUE)
+        async with asyncio.TaskGroup() as stages:
+            stages.create_task(self._think(user_text, sentences))
+            stages.create_task(self._speak(sentences, speech))
+            stages.create_task(self._play(speech))
+
+    async def _think(self, user_text: str, sentences: asyncio.Queue):
+        """🤖 LLM tokens → sentences"""
+        spoke = False
+        tokens = llm.stream_tokens(user_text, **self.conversation.llm_options())
+        async for sentence in aiter_sentences(tokens):
+            print(f"🤖 AI: {sentence}")
+            await sentences.put(sentence)
+            spoke = True
+        if not spoke:
+            print(f"🤖 AI: {FALLBACK_REPLY}")
+            await sentences.put(FALLBACK_REPLY)
+        # On an error the task group cancels the other stages instead
+        await sentences.put(None)
+
+    async def _speak(self, sentences: asyncio.Queue, speech: asyncio.Queue):
+        """🔊 Sentences → Piper PCM, running ahead of playback by AGENT_AUDIO_QUEUE sentences"""
+        while (sentence := await sentences.get()) is not None:
+            if not tts.PIPER_AVAILABLE:
+                continue
+            for pcm, sample_rate in await tts.piper_pcm(normalize_for_speech(sentence)):
+                await speech.put((pcm, sample_rate))
+        await speech.put(None)
+
+    async def _play(self, speech: asyncio.Queue):
+        while (item := await speech.get()) is not None:
+            await self.sink.play(*item)
+
+
+# ---------------- MAIN ----------------
+async def converse(source: AsyncIterable[np.ndarray], sink):
+    # Load Whisper and Piper before listening, so the first turn isn't slow
+    await asyncio.gather(asyncio.to_thread(stt.warm_up), asyncio.to_thread(tts.warm_up))
+    print("🤖 Voice AI READY (Ctrl+C to stop)")
+    try:
+        await Agent(source, sink).run()
+    finally:
+        await llm.aclose()
+        inference.pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav", nargs="?", help="replay this file instead of listening on the microphone")
+    parser.add_argument("--out", help="write reply audio to this WAV file instead of playing it")
+    parser.add_argument("--fast", action="store_true", help="replay the file as fast as possible")
+    args = parser.parse_args()
+
+    source = file_blocks(args.wav, realtime=not args.fast) if args.wav else mic_blocks()
+    sink = WavSink(args.out) if args.out else SpeakerSink()
+    try:
+        asyncio.run(converse(source, sink))
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+    finally:
+        sink.close()
+
+
+if __name__ == "__main__":
+    main()
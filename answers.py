@@ -0,0 +1,89 @@
+import json
+import os
+import re
+import struct
+import time
+import unicodedata
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+
+import llm
+import metrics
+import tts
+from cache import TieredCache, content_key
+from prompts import HEALTH_SYSTEM_PROMPT
+
+load_dotenv()
+
+# ---------------- CONFIG ----------------
+# Opt-in: a cached answer is a fixed reply to a whole class of transcripts
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+
+# Changing the system prompt changes every answer, so it is part of the key
+PROMPT_VERSION = content_key(HEALTH_SYSTEM_PROMPT)[:16]
+
+answer_cache = TieredCache("answer", max_bytes=ANSWER_CACHE_MAX_BYTES, ttl=ANSWER_CACHE_TTL)
+
+# ---------------- NORMALIZATION ----------------
+# Disfluencies Whisper transcribes wherever they occur
+FILLER_WORDS = {"um", "umm", "uh", "uhh", "uhm", "er", "erm", "ah", "hmm", "mm"}
+# Openers and sign-offs, dropped only at the start / end of the question
+# ("well" elsewhere may matter: "I don't feel well")
+LEADING_WORDS = {"so", "well", "okay", "ok", "hey", "hi", "hello", "please"}
+TRAILING_WORDS = {"please", "thanks"}
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_THANK_YOU = re.compile(r"\bthank you\b")
+
+
+def normalize_question(text: str) -> str:
+    """Lower-case and strip punctuation and filler words so rephrasings share a key"""
+    text = _PUNCTUATION.sub("", unicodedata.normalize("NFKC", text).lower())
+    text = _THANK_YOU.sub("thanks", text)
+    words = [w for w in text.split() if w not in FILLER_WORDS]
+    while words and words[0] in LEADING_WORDS:
+        words.pop(0)
+    while words and words[-1] in TRAILING_WORDS:
+        words.pop()
+    return " ".join(words)
+
+
+def answer_key(user_text: str, model: str = llm.OLLAMA_MODEL) -> str:
+    return content_key(normalize_question(user_text), model, PROMPT_VERSION, tts.voice_identity())
+
+
+# ---------------- ENTRIES ----------------
+# Stored as: header length, JSON header (reply text), then the audio
+_HEADER_LENGTH = struct.Struct("!I")
+
+
+def _pack(reply: str, audio: bytes) -> bytes:
+    header = json.dumps({"reply": reply}).encode()
+    return _HEADER_LENGTH.pack(len(header)) + header + audio
+
+
+def _unpack(entry: bytes) -> Tuple[str, bytes]:
+    (length,) = _HEADER_LENGTH.unpack_from(entry)
+    header = json.loads(entry[_HEADER_LENGTH.size:_HEADER_LENGTH.size + length])
+    return header["reply"], entry[_HEADER_LENGTH.size + length:]
+
+
+async def lookup(user_text: str) -> Optional[Tuple[str, bytes]]:
+    """(reply, audio) for a question answered before, or None"""
+    if not ANSWER_CACHE_ENABLED or not normalize_question(user_text):
+        return None
+    start = time.perf_counter()
+    entry = await answer_cache.aget(answer_key(user_text))
+    metrics.observe_stage("answer_cache", time.perf_counter() - start, cache="hit" if entry else "miss")
+    return _unpack(entry) if entry else None
+
+
+async def store(user_text: str, reply: str, audio: bytes):
+    if ANSWER_CACHE_ENABLED and normalize_question(user_text):
+        await answer_cache.aset(answer_key(user_text), _pack(reply, audio))
+
+
+def stats() -> Optional[dict]:
+    return answer_cache.stats() if ANSWER_CACHE_ENABLED else None
@@ -0,0 +1,356 @@
+import importlib.util
+import io
+import os
+import struct
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Whisper works on 16 kHz mono float32 in [-1, 1]
+WHISPER_SAMPLE_RATE = 16000
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Content types for headerless 16-bit little-endian PCM at 16 kHz mono
+RAW_PCM_CONTENT_TYPES = ("audio/l16", "audio/pcm", "audio/x-raw")
+
+
+def pcm16_to_float32(data) -> np.ndarray:
+    """int16 PCM bytes/buffer → float32 in [-1, 1] (one allocation, no intermediate copy)"""
+    samples = np.frombuffer(data, dtype="<i2")
+    return np.multiply(samples, np.float32(1 / 32768), dtype=np.float32)
+
+
+def _to_float32(raw: memoryview, fmt: int, sample_width: int) -> Optional[np.ndarray]:
+    if fmt == _WAVE_FORMAT_IEEE_FLOAT and sample_width == 4:
+        # Already the layout Whisper wants: a read-only view over the upload
+        return np.frombuffer(raw, dtype="<f4")
+    if fmt != _WAVE_FORMAT_PCM:
+        return None
+    if sample_width == 2:
+        return pcm16_to_float32(raw)
+    if sample_width == 4:
+        return np.multiply(np.frombuffer(raw, dtype="<i4"), np.float32(1 / 2147483648), dtype=np.float32)
+    if sample_width == 1:
+        samples = np.frombuffer(raw, dtype=np.uint8)
+        return np.subtract(samples, np.float32(128), dtype=np.float32) / np.float32(128)
+    return None
+
+
+def resample(audio: np.ndarray, sample_rate: int, target_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """Linear-interpolation resample; plenty for speech going into Whisper"""
+    if sample_rate == target_rate or len(audio) == 0:
+        return audio
+    duration = len(audio) / sample_rate
+    target_len = int(round(duration * target_rate))
+    positions = np.linspace(0, len(audio) - 1, target_len, dtype=np.float64)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def decode_wav(data: bytes) -> Optional[np.ndarray]:
+    """Decode WAV bytes to 16 kHz mono float32.
+
+    Returns None for anything that isn't uncompressed PCM/float WAV so the
+    caller can fall back to ffmpeg-backed decoding.
+    """
+    view = memoryview(data)
+    if len(view) < 12 or bytes(view[0:4]) != b"RIFF" or bytes(view[8:12]) != b"WAVE":
+        return None
+
+    fmt = channels = sample_rate = sample_width = None
+    pos = 12
+    while pos + 8 <= len(view):
+        chunk_id = bytes(view[pos:pos + 4])
+        chunk_size = struct.unpack_from("<I", view, pos + 4)[0]
+        body = pos + 8
+
+        if chunk_id == b"fmt " and chunk_size >= 16:
+            fmt, channels, sample_rate = struct.unpack_from("<HHI", view, body)
+            sample_width = struct.unpack_from("<H", view, body + 14)[0] // 8
+            if fmt == _WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                fmt = struct.unpack_from("<H", view, body + 24)[0]
+
+        elif chunk_id == b"data":
+            if fmt is None or not channels or not sample_width:
+                return None
+            # Streamed WAVs declare 0xFFFFFFFF; trust the bytes we actually have
+            end = min(body + chunk_size, len(view))
+            block_align = channels * sample_width
+            end -= (end - body) % block_align
+
+            audio = _to_float32(view[body:end], fmt, sample_width)
+            if audio is None:
+                return None
+            if channels > 1:
+                audio = audio.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+            return resample(audio, sample_rate)
+
+        pos = body + chunk_size + (chunk_size & 1)
+
+    return None
+
+
+def decode_audio(data: bytes, content_type: Optional[str] = None) -> Optional[np.ndarray]:
+    """In-memory decode of an upload; None means "use the file-path fallback" """
+    if content_type and content_type.lower().startswith(RAW_PCM_CONTENT_TYPES):
+        return pcm16_to_float32(data[:len(data) - len(data) % 2])
+    return decode_wav(data)
+
+
+# ---------------- ENCODING ----------------
+# Reply audio can go out compressed: libsndfile (via soundfile) has Opus and
+# MP3 encoders and writes to any file-like object, so chunks are encoded as
+# they are synthesized without an ffmpeg process
+SOUNDFILE_AVAILABLE = importlib.util.find_spec("soundfile") is not None
+# libsndfile's 0..1 compression level (lower means higher bitrate); unset
+# keeps its defaults (~40 kbps Opus, VBR MP3)
+AUDIO_COMPRESSION_LEVEL = os.getenv("AUDIO_COMPRESSION_LEVEL")
+
+# "Unknown length" marker for RIFF/data chunk sizes; players read until EOF
+STREAMING_SIZE = 0xFFFFFFFF
+
+MEDIA_TYPES = {
+    "wav": "audio/wav",
+    "ogg": "audio/ogg; codecs=opus",
+    "mp3": "audio/mpeg"
+}
+_ACCEPT_FORMATS = {
+    "audio/wav": "wav", "audio/wave": "wav", "audio/x-wav": "wav",
+    "audio/ogg": "ogg", "audio/opus": "ogg",
+    "audio/mpeg": "mp3", "audio/mp3": "mp3"
+}
+# soundfile format, subtype
+_SOUNDFILE_FORMATS = {"ogg": ("OGG", "OPUS"), "mp3": ("MP3", "MPEG_LAYER_III")}
+# Opus only takes these rates; Piper's 22.05 kHz is resampled up
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def wav_header(sample_rate: int, data_size: int = STREAMING_SIZE, channels: int = 1, sample_width: int = 2) -> bytes:
+    """44-byte PCM WAV header; the default size marks a stream of unknown length"""
+    block_align = channels * sample_width
+    riff_size = STREAMING_SIZE if data_size == STREAMING_SIZE else 36 + data_size
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, sample_width * 8,
+        b"data", data_size
+    )
+
+
+def crossfade_join(chunks: List[bytes], sample_rate: int, crossfade_ms: float) -> bytes:
+    """Concatenate 16-bit mono PCM chunks, overlapping each join with a linear crossfade"""
+    if len(chunks) < 2 or crossfade_ms <= 0:
+        return b"".join(chunks)
+    fade = int(sample_rate * crossfade_ms / 1000)
+    pieces = []
+    previous = np.frombuffer(chunks[0], dtype="<i2")
+    for chunk in chunks[1:]:
+        current = np.frombuffer(chunk, dtype="<i2")
+        n = min(fade, len(previous), len(current))
+        if n == 0:
+            pieces.append(previous)
+            previous = current
+            continue
+        ramp = np.linspace(0, 1, n, dtype=np.float32)
+        mixed = previous[-n:] * (1 - ramp) + current[:n] * ramp
+        pieces.append(previous[:-n])
+        pieces.append(np.clip(np.round(mixed), -32768, 32767).astype("<i2"))
+        previous = current[n:]
+    pieces.append(previous)
+    return np.concatenate(pieces).tobytes()
+
+
+def media_type_of(data: bytes) -> str:
+    """Media type of a complete reply from tts.text_to_speech: Piper WAV or ElevenLabs MP3"""
+    return MEDIA_TYPES["wav"] if data[:4] == b"RIFF" else MEDIA_TYPES["mp3"]
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """Pick wav/ogg/mp3 from an Accept header by q-value; wav if nothing better is acceptable"""
+    if not accept:
+        return "wav"
+    best, best_q = "wav", 0.0
+    for item in accept.split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        audio_format = _ACCEPT_FORMATS.get(media_type.lower())
+        if audio_format is None or (audio_format != "wav" and not SOUNDFILE_AVAILABLE):
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = audio_format, q
+    return best
+
+
+class _AppendSink(io.RawIOBase):
+    """Write-only file for libsndfile whose bytes are handed out as they arrive.
+
+    Encoders only append, except that the MP3 writer starts with an empty
+    Xing/Info frame and seeks back on close to fill it in. Sent bytes can't
+    change, and an empty one makes decoders stop early, so that frame is
+    never sent (streams don't need it) and later rewrites are dropped.
+    """
+
+    def __init__(self):
+        self.pending = bytearray()
+        self.started = False
+        self.sent = 0
+        self.size = 0
+        self.pos = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: self.size}[whence]
+        self.pos = base + offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        return b""
+
+    def write(self, data):
+        length = len(data)
+        if not self.started:
+            self.started = True
+            head = bytes(data[:64])
+            if b"Xing" in head or b"Info" in head:
+                self.pos = self.size = self.sent = length
+                return length
+        start = max(self.pos, self.sent)
+        skip = start - self.pos
+        if skip < length:
+            offset = start - self.sent
+            self.pending[offset:offset + length - skip] = memoryview(data)[skip:]
+        self.pos += length
+        self.size = max(self.size, self.pos)
+        return length
+
+    def drain(self) -> bytes:
+        data = bytes(self.pending)
+        self.sent += len(data)
+        self.pending.clear()
+        return data
+
+
+class _Resampler:
+    """Streaming linear-interpolation resampler that keeps phase across chunks"""
+
+    def __init__(self, source_rate: int, target_rate: int):
+        self.step = source_rate / target_rate
+        self.position = 0.0
+        self.previous = None
+
+    def feed(self, samples: np.ndarray) -> np.ndarray:
+        if self.previous is not None:
+            samples = np.concatenate((self.previous, samples))
+        if len(samples) < 2:
+            self.previous = samples
+            return samples[:0]
+        positions = np.arange(self.position, len(samples) - 1, self.step)
+        out = np.interp(positions, np.arange(len(samples)), samples)
+        # Carry the last sample so the next chunk interpolates across the seam
+        next_position = positions[-1] + self.step if len(positions) else self.position
+        self.position = next_position - (len(samples) - 1)
+        self.previous = samples[-1:]
+        return out
+
+
+class StreamEncoder:
+    """Encode 16-bit mono PCM chunks to wav/ogg/mp3 as they arrive.
+
+    feed() returns whatever encoded bytes are ready (possibly none yet);
+    close() flushes the rest. WAV passes the PCM through behind a
+    streaming header.
+    """
+
+    def __init__(self, audio_format: str = "wav"):
+        if audio_format not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported audio format {audio_format!r}")
+        self.format = audio_format
+        self.media_type = MEDIA_TYPES[audio_format]
+        self.sample_rate: Optional[int] = None
+        self._file = None
+        self._sink: Optional[_AppendSink] = None
+        self._resampler: Optional[_Resampler] = None
+
+    def _open(self, sample_rate: int):
+        import soundfile
+
+        target_rate = sample_rate
+        if self.format == "ogg" and sample_rate not in OPUS_SAMPLE_RATES:
+            target_rate = next((rate for rate in OPUS_SAMPLE_RATES if rate >= sample_rate), 48000)
+            self._resampler = _Resampler(sample_rate, target_rate)
+
+        container, subtype = _SOUNDFILE_FORMATS[self.format]
+        options = {}
+        if AUDIO_COMPRESSION_LEVEL:
+            options["compression_level"] = float(AUDIO_COMPRESSION_LEVEL)
+        self._sink = _AppendSink()
+        self._file = soundfile.SoundFile(
+            self._sink, mode="w", samplerate=target_rate, channels=1, format=container, subtype=subtype, **options
+        )
+
+    def feed(self, pcm: bytes, sample_rate: int) -> bytes:
+        if self.sample_rate is None:
+            self.sample_rate = sample_rate
+            if self.format == "wav":
+                return wav_header(sample_rate) + pcm
+            self._open(sample_rate)
+        elif sample_rate != self.sample_rate:
+            raise ValueError("Sample rate changed mid-stream")
+
+        if self.format == "wav":
+            return pcm
+
+        samples = np.frombuffer(pcm, dtype="<i2")
+        if self._resampler is not None:
+            samples = self._resampler.feed(samples.astype(np.float32)).astype(np.int16)
+        self._file.write(samples)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        if self._file is None:
+            return b""
+        self._file.close()
+        self._file = None
+        return self._sink.drain()
+
+
+def read_wav_pcm(data: bytes) -> Optional[Tuple[memoryview, int]]:
+    """(16-bit mono PCM view, sample rate) of a WAV as written by this service, or None"""
+    view = memoryview(data)
+    if len(view) < 44 or bytes(view[0:4]) != b"RIFF" or bytes(view[36:40]) != b"data":
+        return None
+    channels, sample_rate = struct.unpack_from("<HI", view, 22)
+    sample_width = struct.unpack_from("<H", view, 34)[0] // 8
+    if channels != 1 or sample_width != 2:
+        return None
+    return view[44:], sample_rate
+
+
+def encode_wav(data: bytes, audio_format: str) -> Tuple[bytes, str]:
+    """Re-encode a complete WAV (e.g. from a cache) as audio_format; returns (bytes, media type).
+
+    WAV, or anything that isn't a WAV this service wrote (ElevenLabs MP3),
+    comes back untouched.
+    """
+    pcm = read_wav_pcm(data) if audio_format != "wav" else None
+    if pcm is None:
+        return data, media_type_of(data)
+    encoder = StreamEncoder(audio_format)
+    return encoder.feed(*pcm) + encoder.close(), encoder.media_type
@@ -1,11 +1,17 @@
+import asyncio
 import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from pydantic import BaseModel
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
+from cache import TieredCache, content_key
+from database import get_async_db
 from models import User
 import os
 from dotenv import load_dotenv
@@ -35,6 +41,21 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# ---------------- AUTH CACHE ----------------
+# Users behind a token's subject, so an authenticated request skips the
+# users query. Committed ORM updates invalidate right away; the short TTL
+# bounds how long other processes' memory tiers may serve a stale record
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_MAX_BYTES = int(os.getenv("AUTH_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+# Columns kept in the cache; never the password hash
+USER_CACHE_FIELDS = ("id", "email", "full_name", "phone", "is_active")
+# bcrypt burns ~0.3 s of CPU per hash/verify; it runs on these threads so
+# a login never stalls the event loop (or the default executor)
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "2"))
+
+user_cache = TieredCache("auth-user", max_bytes=AUTH_CACHE_MAX_BYTES, ttl=AUTH_CACHE_TTL)
+_hash_pool = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="bcrypt")
+
 if PASSLIB_AVAILABLE:
     pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 else:
@@ -71,14 +92,78 @@ def get_password_hash(password):
         return hashlib.sha256(password.encode()).hexdigest()
     return pwd_context.hash(password)
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(User).filter(User.email == email).first()
+async def averify_password(plain_password, hashed_password):
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, verify_password, plain_password, hashed_password)
+
+async def aauthenticate_user(db: AsyncSession, email: str, password: str):
+    """The user if the password matches, else False; bcrypt runs off the event loop"""
+    read_at = user_cache.deletions
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await averify_password(password, user.hashed_password):
         return False
+    await cache_user(user, read_at)
     return user
 
+# ---------------- USER CACHE ----------------
+def _user_key(email: str) -> str:
+    # Hashed so emails don't show up in Redis key listings
+    return content_key(email)
+
+async def cache_user(user: User, read_at: Optional[int] = None):
+    """Cache user; pass read_at=user_cache.deletions from before it was read,
+    so a row read while a change was being committed isn't cached"""
+    record = {field: getattr(user, field) for field in USER_CACHE_FIELDS}
+    await user_cache.aset(_user_key(user.email), json.dumps(record).encode(), unless_deleted_since=read_at)
+
+async def cached_user(email: str) -> Optional[User]:
+    """The cached record as a detached User (no relationships or password hash), or None"""
+    value = await user_cache.aget(_user_key(email))
+    if value is None:
+        return None
+    return User(**json.loads(value))
+
+def invalidate_user(email: Optional[str] = None):
+    """Forget one user (all of them without an email); never blocks the event loop"""
+    if email is None:
+        user_cache.delete_soon()
+    else:
+        user_cache.delete_soon(_user_key(email))
+
+# Changed users are collected per flush and invalidated once committed: a
+# request that reads the row before the commit would cache the old version
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    changed = set()
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, User):
+            # Also the old address if the email itself changed
+            changed.update({obj.email, *inspect(obj).attrs.email.history.deleted})
+    changed.discard(None)
+    if changed:
+        session.info.setdefault("changed_user_emails", set()).update(changed)
+
+@event.listens_for(Session, "do_orm_execute")
+def _bulk_user_change(orm_execute_state):
+    # update(User)/delete(User) statements don't say which users they hit
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and User.__mapper__ in orm_execute_state.all_mappers:
+        orm_execute_state.session.info["all_users_changed"] = True
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    changed = session.info.pop("changed_user_emails", None)
+    if session.info.pop("all_users_changed", False):
+        invalidate_user()
+    elif changed:
+        for email in changed:
+            invalidate_user(email)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop("changed_user_emails", None)
+    session.info.pop("all_users_changed", None)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     if not JOSE_AVAILABLE:
         raise HTTPException(status_code=500, detail="JWT authentication not available")
@@ -91,7 +176,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     if not JOSE_AVAILABLE:
         raise HTTPException(status_code=500, detail="JWT authentication not available")
 
@@ -108,8 +193,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = TokenData(email=email)
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email == token_data.email).first()
+    user = await cached_user(token_data.email)
     if user is None:
+        read_at = user_cache.deletions
+        user = (await db.execute(select(User).where(User.email == token_data.email))).scalars().first()
+        if user is None:
+            raise credentials_exception
+        await cache_user(user, read_at)
+    if user.is_active is False:
         raise credentials_exception
     return user
 
@@ -0,0 +1,192 @@
+"""Write-behind batching for high-volume inserts, such as one HealthLog row per voice turn.
+
+add() only appends to an in-memory buffer, so logging costs microseconds on
+the request path instead of a commit. A background task writes the buffer
+as bulk INSERTs once it holds LOG_BATCH_SIZE rows or LOG_FLUSH_SECONDS
+have passed, and once more on shutdown. When the database is unreachable
+rows are kept and retried; past LOG_MAX_BUFFER rows the oldest are dropped
+(and counted) rather than growing without bound. When it rejects a batch
+(a constraint or a value that won't serialize), the batch is retried in
+halves so only the offending rows are dropped (counted as rejected).
+"""
+import asyncio
+import os
+import time
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import exc, insert
+
+import database
+import metrics
+
+load_dotenv()
+
+# ---------------- CONFIG ----------------
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "1.0"))
+LOG_MAX_BUFFER = int(os.getenv("LOG_MAX_BUFFER", "10000"))
+
+
+def _rejects_rows(error: Exception) -> bool:
+    # Errors caused by what was inserted rather than by the database being
+    # unreachable; StatementError alone wraps failures to bind a value
+    if isinstance(error, (exc.IntegrityError, exc.DataError)):
+        return True
+    return isinstance(error, exc.StatementError) and not isinstance(error, exc.DBAPIError)
+
+
+class BatchWriter:
+    """Buffers rows (dicts of column values) for model and inserts them in batches"""
+
+    def __init__(
+        self,
+        model,
+        batch_size: int = LOG_BATCH_SIZE,
+        flush_seconds: float = LOG_FLUSH_SECONDS,
+        max_buffer: int = LOG_MAX_BUFFER,
+        session_factory=None,
+        derived=None
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max_buffer
+        # An async_sessionmaker; defaults to the app's database on first flush
+        self.session_factory = session_factory
+        # derived(rows, dialect_name) -> more (statement, params) to run in the same transaction
+        self.derived = derived
+        self._rows: List[dict] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flushing = asyncio.Lock()
+
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failures = 0
+
+    @property
+    def buffered(self) -> int:
+        return len(self._rows)
+
+    def add(self, row: dict):
+        """Queue one row; never blocks and never touches the database"""
+        self._rows.append(row)
+        self._trim()
+        if self._wake is not None and len(self._rows) >= self.batch_size:
+            self._wake.set()
+
+    # ---------------- BACKGROUND FLUSH ----------------
+    def start(self):
+        """Start flushing in the background on the running event loop"""
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._flushing = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def close(self):
+        """Stop the background task and write whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wake = None
+        await self.flush()
+
+    async def flush(self):
+        """Insert everything buffered so far, batch_size rows per INSERT"""
+        async with self._flushing:
+            rows, self._rows = self._rows, []
+            while rows:
+                batch, rows = rows[:self.batch_size], rows[self.batch_size:]
+                unwritten = await self._write(batch)
+                if unwritten:
+                    # Keep them for the next flush, ahead of rows added meanwhile
+                    self._rows[:0] = unwritten + rows
+                    self._trim()
+                    return
+
+    async def _write(self, rows: List[dict]) -> List[dict]:
+        """Insert rows, splitting around any the database rejects; returns those an outage left unwritten"""
+        start = time.perf_counter()
+        try:
+            await self._insert(rows)
+        except Exception as e:
+            metrics.observe_stage("log_flush", time.perf_counter() - start, "error")
+            self.failures += 1
+            if not _rejects_rows(e):
+                print(f"⚠️ Batch insert of {len(rows)} {self.model.__tablename__} rows failed: {e}")
+                return rows
+            if len(rows) == 1:
+                self.rejected += 1
+                print(f"⚠️ Dropped a {self.model.__tablename__} row the database rejected: {e}")
+                return []
+            half = len(rows) // 2
+            unwritten = await self._write(rows[:half])
+            if unwritten:
+                return unwritten + rows[half:]
+            return await self._write(rows[half:])
+        metrics.observe_stage("log_flush", time.perf_counter() - start)
+        self.written += len(rows)
+        return []
+
+    def _trim(self):
+        overflow = len(self._rows) - self.max_buffer
+        if overflow > 0:
+            del self._rows[:overflow]
+            self.dropped += overflow
+
+    async def _insert(self, rows: List[dict]):
+        # One executemany INSERT per batch (per set of columns given, since
+        # it is compiled once from the first row); drivers send it as
+        # multi-row VALUES or one pipelined prepared statement
+        by_columns = {}
+        for row in rows:
+            by_columns.setdefault(tuple(sorted(row)), []).append(row)
+        writes = [(insert(self.model), group) for group in by_columns.values()]
+
+        session_factory = self.session_factory or database.get_async_sessionmaker()
+        if session_factory is not None:
+            async with session_factory() as db:
+                for statement, params in writes + self._derived(rows, db.bind.dialect.name):
+                    await db.execute(statement, params)
+                await db.commit()
+            return
+
+        # No async driver: same statements on a sync session, off the event loop
+        sync_factory = database.get_sessionmaker()
+        if sync_factory is None:
+            raise RuntimeError("Database not available")
+
+        def insert_sync():
+            with sync_factory() as db:
+                for statement, params in writes + self._derived(rows, db.get_bind().dialect.name):
+                    db.execute(statement, params)
+                db.commit()
+
+        await asyncio.to_thread(insert_sync)
+
+    def _derived(self, rows: List[dict], dialect: str) -> list:
+        return self.derived(rows, dialect) if self.derived is not None else []
+
+    def stats(self) -> dict:
+        return {
+            "buffered": self.buffered,
+            "written": self.written,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "failures": self.failures
+        }
@@ -0,0 +1,202 @@
+"""Authenticated requests/sec with and without the user cache, and what logins do to them.
+
+Serves a bare endpoint behind auth.get_current_user in process (no network,
+no models) and drives it with many bearer tokens for distinct users:
+
+- "no-cache": every request decodes the JWT and queries users
+- "cache":    repeat requests are answered from auth.user_cache
+
+Then runs the same load while users log in through /token, once with bcrypt
+on the event loop (as before) and once on the bcrypt pool, and reports the
+latency authenticated requests see meanwhile:
+
+    python -m benchmarks.bench_auth --users 200 --requests 5000 --concurrency 32
+    python -m benchmarks.bench_auth --database-url postgresql+asyncpg://user:pw@localhost/bench
+
+The default SQLite file is local, so the query saved per request is cheap
+here; against Postgres over the network the gap widens.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import auth
+import database
+from benchmarks.load_test import RESULTS_DIR, _git_commit, percentiles
+from cache import TieredCache
+from models import Base, User
+
+PASSWORD = "correct horse battery staple"
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/me")
+    async def me(user: User = Depends(auth.get_current_user)):
+        return {"id": user.id}
+
+    @app.post("/token")
+    async def login(form: OAuth2PasswordRequestForm = Depends(), db=Depends(database.get_async_db)):
+        user = await auth.aauthenticate_user(db, form.username, form.password)
+        return {"ok": bool(user)}
+
+    return app
+
+
+async def _seed(url: str, users: int):
+    engine = create_async_engine(url, **database.engine_options(url))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    hashed = auth.get_password_hash(PASSWORD)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        db.add_all(
+            User(email=f"user{i}@example.com", hashed_password=hashed, full_name=f"User {i}", phone="+1")
+            for i in range(users)
+        )
+        await db.commit()
+    return engine, session_factory
+
+
+async def _drive(client: httpx.AsyncClient, tokens, requests: int, concurrency: int):
+    latencies = []
+    remaining = iter(range(requests))
+    rng = random.Random(3)
+
+    async def worker():
+        for _ in remaining:
+            headers = {"Authorization": f"Bearer {rng.choice(tokens)}"}
+            start = time.perf_counter()
+            response = await client.get("/me", headers=headers)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+async def _logins(client: httpx.AsyncClient, count: int):
+    async def one(i):
+        form = {"username": f"user{i}@example.com", "password": PASSWORD}
+        (await client.post("/token", data=form)).raise_for_status()
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+
+
+def _cache(enabled: bool) -> TieredCache:
+    # max_bytes=0 stores nothing, so every lookup misses
+    cache = TieredCache("auth-bench", max_bytes=auth.AUTH_CACHE_MAX_BYTES if enabled else 0, ttl=auth.AUTH_CACHE_TTL)
+    cache.redis = None
+    return cache
+
+
+async def _run(args) -> list:
+    url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'auth.db')}"
+    engine, session_factory = await _seed(url, args.users)
+    queries = []
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *a: queries.append(1))
+
+    async def get_db():
+        async with session_factory() as db:
+            yield db
+
+    app = _app()
+    app.dependency_overrides[database.get_async_db] = get_db
+    tokens = [auth.create_access_token({"sub": f"user{i}@example.com"}) for i in range(args.users)]
+    rows = []
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for mode in ("no-cache", "cache"):
+                auth.user_cache = _cache(mode == "cache")
+                # Warm-up: one request per user, so "cache" measures the steady state
+                for token in tokens:
+                    await client.get("/me", headers={"Authorization": f"Bearer {token}"})
+                queries.clear()
+                latencies, wall = await _drive(client, tokens, args.requests, args.concurrency)
+                rows.append({
+                    "mode": mode,
+                    "rps": round(args.requests / wall, 1),
+                    "queries_per_request": round(len(queries) / args.requests, 3),
+                    **percentiles(latencies)
+                })
+
+            offloaded = auth.averify_password
+
+            async def inline(plain, hashed):
+                return auth.verify_password(plain, hashed)
+
+            for mode, verify in (("logins, bcrypt inline", inline), ("logins, bcrypt pool", offloaded)):
+                auth.averify_password = verify
+                auth.user_cache = _cache(True)
+                start = time.perf_counter()
+                (latencies, _), _ = await asyncio.gather(
+                    _drive(client, tokens, args.requests, args.concurrency),
+                    _logins(client, args.logins)
+                )
+                rows.append({
+                    "mode": mode,
+                    "rps": round(args.requests / (time.perf_counter() - start), 1),
+                    "queries_per_request": None,
+                    **percentiles(latencies)
+                })
+            auth.averify_password = offloaded
+    finally:
+        await engine.dispose()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--logins", type=int, default=8, help="logins run alongside the load in the login rows")
+    parser.add_argument("--database-url", help="async SQLAlchemy URL (default: a temporary SQLite file); its tables are recreated")
+    parser.add_argument("--out", help="result file (default: benchmarks/results/auth-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    if not auth.JOSE_AVAILABLE:
+        raise SystemExit("python-jose is not installed")
+    print(f"🔐 {'bcrypt' if auth.PASSLIB_AVAILABLE else 'sha256 fallback (passlib not installed)'}, {os.cpu_count()} CPU(s)")
+
+    rows = asyncio.run(_run(args))
+    print(f"{'mode':>22} {'req/s':>8} {'queries':>8} {'p50':>8} {'p99':>8}")
+    for row in rows:
+        queries = "-" if row["queries_per_request"] is None else f"{row['queries_per_request']:.2f}"
+        print(f"{row['mode']:>22} {row['rps']:>8.0f} {queries:>8} {row['p50_ms']:>6.1f}ms {row['p99_ms']:>6.1f}ms")
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "cpus": os.cpu_count(),
+            "database": "sqlite" if not args.database_url else args.database_url.split("://", 1)[0],
+            "bcrypt": auth.PASSLIB_AVAILABLE,
+            "config": {key: getattr(args, key) for key in ("users", "requests", "concurrency", "logins")}
+        },
+        "runs": rows
+    }
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"auth-{report['meta']['commit'] or 'nogit'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Trend + threshold-alert latency vs. history length: scanning HealthLog vs. reading rollups.
+
+Builds a synthetic multi-year dataset of daily check-ins (heart rate, blood
+pressure, blood sugar) through the same write path the app uses, readings
+and rollups included. For users with 30 days, 1 year and --years of history,
+it then times one 7-day trend plus today's threshold check three ways:
+
+- "scan":   every daily_check row of the user, JSON parsed in Python (before)
+- "index":  only the window's rows, via the (user_id, log_type, created_at) index
+- "rollup": the daily buckets, monitoring.trend + monitoring.check_thresholds
+
+    python -m benchmarks.bench_monitoring --users 20 --years 3 --readings-per-day 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import monitoring
+from benchmarks.load_test import RESULTS_DIR, _git_commit, percentiles
+from models import Base, HealthLog, User
+
+NOW = datetime(2024, 6, 30, 20, 0)
+METRIC = "heart_rate"
+BATCH = 500
+
+
+def _check_in(rng: random.Random, user_id: int, moment: datetime) -> dict:
+    systolic = rng.gauss(125, 12)
+    return {
+        "user_id": user_id,
+        "log_type": "daily_check",
+        "data": {
+            "heart_rate": round(rng.gauss(75, 12)),
+            "blood_pressure": f"{systolic:.0f}/{systolic * 0.65:.0f}",
+            "blood_sugar": round(rng.gauss(105, 20)),
+            "mood": rng.choice(["good", "tired", "ok"])
+        },
+        "urgency_level": "low",
+        "created_at": moment
+    }
+
+
+async def _build(session_factory, histories, readings_per_day: int) -> float:
+    """Insert every user's history in batches, with readings and rollups; returns rows/s"""
+    rng = random.Random(5)
+    async with session_factory() as db:
+        db.add_all(User(id=user_id, email=f"user{user_id}@example.com") for user_id in histories)
+        await db.commit()
+
+    rows, total, start = [], 0, time.perf_counter()
+
+    async def write(batch):
+        async with session_factory() as db:
+            await db.execute(insert(HealthLog), batch)
+            for statement, params in monitoring.derived_statements(batch, db.bind.dialect.name):
+                await db.execute(statement, params)
+            await db.commit()
+
+    for user_id, days in histories.items():
+        for day in range(days, -1, -1):
+            for n in range(readings_per_day):
+                moment = NOW - timedelta(days=day, hours=n * 24 / readings_per_day)
+                rows.append(_check_in(rng, user_id, moment))
+                if len(rows) == BATCH:
+                    await write(rows)
+                    total += len(rows)
+                    rows = []
+    if rows:
+        await write(rows)
+        total += len(rows)
+    return total / (time.perf_counter() - start)
+
+
+def _summarize(rows):
+    """7-day daily averages of METRIC plus today's threshold alerts, from raw logs"""
+    low, high = monitoring.ALERT_THRESHOLDS[METRIC]
+    since = monitoring.bucket_start(NOW, "day") - timedelta(days=6)
+    today = monitoring.bucket_start(NOW, "day")
+    days, alerts = {}, []
+    for data, created_at in rows:
+        if created_at < since:
+            continue
+        value = monitoring.extract_metrics(data if isinstance(data, dict) else json.loads(data)).get(METRIC)
+        if value is None:
+            continue
+        days.setdefault(created_at.date(), []).append(value)
+        if created_at >= today and (value < low or value > high):
+            alerts.append(value)
+    return {day: sum(values) / len(values) for day, values in days.items()}, alerts
+
+
+async def _scan(db, user_id: int, indexed: bool):
+    query = select(HealthLog.data, HealthLog.created_at).where(
+        HealthLog.user_id == user_id, HealthLog.log_type == "daily_check"
+    )
+    if indexed:
+        query = query.where(HealthLog.created_at >= monitoring.bucket_start(NOW, "day") - timedelta(days=6))
+    return _summarize((await db.execute(query)).all())
+
+
+async def _rollup(db, user_id: int):
+    return await monitoring.trend(db, user_id, METRIC, days=7, now=NOW), await monitoring.check_thresholds(db, user_id, now=NOW)
+
+
+async def _time(session_factory, fn, rounds: int) -> dict:
+    latencies = []
+    async with session_factory() as db:
+        await fn(db)
+        for _ in range(rounds):
+            start = time.perf_counter()
+            await fn(db)
+            latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+
+async def _run(args):
+    path = os.path.join(tempfile.mkdtemp(), "monitoring.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    # The users being measured, plus background users so the tables aren't one user's
+    measured = {1: 30, 2: 365, 3: int(args.years * 365)}
+    histories = {**measured, **{user_id: int(args.years * 365) for user_id in range(4, args.users + 1)}}
+    ingest = await _build(session_factory, histories, args.readings_per_day)
+
+    rows = []
+    for user_id, days in measured.items():
+        for method in ("scan", "index", "rollup"):
+            if method == "rollup":
+                fn = lambda db, user_id=user_id: _rollup(db, user_id)
+            else:
+                fn = lambda db, user_id=user_id, indexed=method == "index": _scan(db, user_id, indexed)
+            rows.append({
+                "history_days": days,
+                "logs": days * args.readings_per_day,
+                "method": method,
+                **await _time(session_factory, fn, args.rounds)
+            })
+    await engine.dispose()
+    return ingest, os.path.getsize(path), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--readings-per-day", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--out", help="result file (default: benchmarks/results/monitoring-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    ingest, db_bytes, rows = asyncio.run(_run(args))
+    print(f"📝 ingest {ingest:.0f} logs/s (with readings and rollups), database {db_bytes / 1e6:.0f} MB")
+    print(f"{'history':>8} {'logs':>7} {'method':>7} {'p50':>10} {'p95':>10}")
+    for row in rows:
+        print(f"{row['history_days']:>7}d {row['logs']:>7} {row['method']:>7} {row['p50_ms']:>8.2f}ms {row['p95_ms']:>8.2f}ms")
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "cpus": os.cpu_count(),
+            "database": "sqlite",
+            "ingest_logs_per_s": round(ingest, 1),
+            "config": {key: getattr(args, key) for key in ("users", "years", "readings_per_day", "rounds")}
+        },
+        "runs": rows
+    }
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"monitoring-{report['meta']['commit'] or 'nogit'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {out}")
+
+
+if __name__ == "__main__":
+    main()
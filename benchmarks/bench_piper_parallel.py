@@ -0,0 +1,129 @@
+"""Piper wall time vs. reply length and worker processes.
+
+Synthesizes replies of 1..N sentences once serially (one voice, one call per
+sentence, as the API did before PIPER_PROCESSES) and once per process count
+through piper_pool.PiperProcessPool, and reports the speedup:
+
+    python -m benchmarks.bench_piper_parallel --sentences 1 2 4 8 16 --processes 1 2 4
+
+Uses Piper and en_US-lessac-medium.onnx when both are present; otherwise a
+fake voice that burns --synth-cost CPU seconds per character (CPU, not
+sleep, so the speedup is bounded by the cores this machine really has).
+"""
+import argparse
+import functools
+import importlib.util
+import json
+import os
+import time
+from types import SimpleNamespace
+
+from benchmarks.load_test import RESULTS_DIR, ROOT, _git_commit
+from benchmarks.stubs import REPLY
+
+import piper_pool
+from streaming import speech_sentences
+
+SAMPLE_RATE = 22050
+
+
+class FakeVoice:
+    """Stand-in for PiperVoice that costs CPU time in proportion to the text"""
+
+    def __init__(self, seconds_per_char: float):
+        self.seconds_per_char = seconds_per_char
+
+    def synthesize(self, text):
+        deadline = time.process_time() + self.seconds_per_char * len(text)
+        while time.process_time() < deadline:
+            pass
+        yield SimpleNamespace(
+            audio_int16_bytes=b"\x00\x00" * int(SAMPLE_RATE * 0.06 * len(text)), sample_rate=SAMPLE_RATE
+        )
+
+
+def _reply(sentences: int) -> str:
+    """A health answer of the given number of sentences, built from the stub reply"""
+    base = speech_sentences(REPLY)
+    return " ".join(base[i % len(base)] for i in range(sentences))
+
+
+def _serial(voice, sentences) -> float:
+    start = time.perf_counter()
+    for sentence in sentences:
+        for _ in voice.synthesize(sentence):
+            pass
+    return time.perf_counter() - start
+
+
+def _parallel(pool: piper_pool.PiperProcessPool, sentences, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        pool.synthesize(sentences)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sentences", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--processes", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--fake-models", action="store_true", help="fake Piper even if installed")
+    parser.add_argument("--synth-cost", type=float, default=0.002, help="fake Piper CPU seconds per character")
+    parser.add_argument("--out", help="result file (default: benchmarks/results/piper-parallel-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    model = os.path.join(ROOT, "en_US-lessac-medium.onnx")
+    fake = args.fake_models or not (os.path.exists(model) and importlib.util.find_spec("piper"))
+    load_voice = functools.partial(FakeVoice, args.synth_cost) if fake else functools.partial(piper_pool.load_piper_voice, model)
+    print(f"🔊 {'fake Piper' if fake else 'Piper'}, {os.cpu_count()} CPU(s)")
+
+    voice = load_voice()
+    replies = {n: speech_sentences(_reply(n)) for n in args.sentences}
+    serial = {n: min(_serial(voice, sentences) for _ in range(args.rounds)) for n, sentences in replies.items()}
+    rows = []
+    for processes in args.processes:
+        pool = piper_pool.PiperProcessPool(processes, load_voice)
+        pool.warm_up()
+        try:
+            for n, sentences in replies.items():
+                parallel = _parallel(pool, sentences, args.rounds)
+                rows.append({
+                    "processes": processes,
+                    "sentences": n,
+                    "chars": sum(len(s) for s in sentences),
+                    "serial_s": round(serial[n], 4),
+                    "parallel_s": round(parallel, 4),
+                    "speedup": round(serial[n] / parallel, 2)
+                })
+        finally:
+            pool.shutdown()
+
+    print(f"{'procs':>6} {'sentences':>10} {'chars':>6} {'serial':>9} {'parallel':>9} {'speedup':>8}")
+    for row in rows:
+        print(
+            f"{row['processes']:>6} {row['sentences']:>10} {row['chars']:>6} "
+            f"{row['serial_s'] * 1000:>7.0f}ms {row['parallel_s'] * 1000:>7.0f}ms {row['speedup']:>7.2f}x"
+        )
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "cpus": os.cpu_count(),
+            "fake_piper": fake,
+            "config": {key: getattr(args, key) for key in ("rounds", "synth_cost")}
+        },
+        "runs": rows
+    }
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"piper-parallel-{report['meta']['commit'] or 'nogit'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {out}")
+
+
+if __name__ == "__main__":
+    main()
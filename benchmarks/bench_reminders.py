@@ -0,0 +1,131 @@
+"""Medication reminder scheduling cost: min-heap vs. parsing and scanning every schedule per tick.
+
+Generates --medications synthetic schedules (1-3 reminder times on the
+quarter hour, across a few timezones) and runs a simulated day with minute
+ticks, in memory, so only the scheduling is measured:
+
+- "heap": reminders.ReminderScheduler loaded once, then pop_due per tick
+- "scan": every tick, each reminder_time string is parsed and compared with
+  the current local minute (what a cron job over the medications table does);
+  too slow to run for a whole day, so --scan-ticks ticks are timed
+
+    python -m benchmarks.bench_reminders --medications 1000000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.load_test import RESULTS_DIR, _git_commit, percentiles
+from reminders import ReminderScheduler, Schedule, _zone, parse_reminder_times
+
+START = datetime(2024, 3, 9, 0, 0, tzinfo=timezone.utc)
+ZONES = ("UTC", "America/New_York", "Europe/London", "Asia/Kolkata")
+
+
+def _medications(count: int):
+    rng = random.Random(7)
+    for medication_id in range(1, count + 1):
+        times = sorted({f"{rng.randrange(6, 23):02d}:{rng.choice((0, 15, 30, 45)):02d}" for _ in range(rng.randint(1, 3))})
+        yield medication_id, ",".join(times), rng.choice(ZONES)
+
+
+def _heap_day(medications, ticks: int, tick_seconds: int):
+    start = time.perf_counter()
+    scheduler = ReminderScheduler()
+    # The worker's load() gets next_fire_at from the table; here it is computed
+    scheduler.load(((m, Schedule(parse_reminder_times(t), zone, None, None), None) for m, t, zone in medications), START)
+    load_seconds = time.perf_counter() - start
+
+    fired, latencies = 0, []
+    for tick in range(1, ticks + 1):
+        now = START + timedelta(seconds=tick * tick_seconds)
+        start = time.perf_counter()
+        while True:
+            due, missed = scheduler.pop_due(now, limit=500)
+            fired += len(due) + len(missed)
+            if len(due) + len(missed) < 500:
+                break
+        latencies.append(time.perf_counter() - start)
+    return load_seconds, fired, latencies
+
+
+def _scan_tick(medications, now: datetime) -> int:
+    fired = 0
+    minutes = {}
+    for _, times, zone in medications:
+        local = minutes.get(zone)
+        if local is None:
+            local = minutes[zone] = now.astimezone(_zone(zone)).strftime("%H:%M")
+        if local in [part.strip() for part in times.split(",")]:
+            fired += 1
+    return fired
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--medications", type=int, default=1_000_000)
+    parser.add_argument("--tick-seconds", type=int, default=60)
+    parser.add_argument("--scan-ticks", type=int, default=5)
+    parser.add_argument("--out", help="result file (default: benchmarks/results/reminders-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    medications = list(_medications(args.medications))
+    ticks = 24 * 3600 // args.tick_seconds
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    load_seconds, fired, heap_latencies = _heap_day(medications, ticks, args.tick_seconds)
+    heap_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    heap_total = sum(heap_latencies)
+
+    scan_latencies = []
+    for tick in range(args.scan_ticks):
+        start = time.perf_counter()
+        _scan_tick(medications, START + timedelta(hours=8, minutes=tick))
+        scan_latencies.append(time.perf_counter() - start)
+
+    rows = [
+        {
+            "method": "heap",
+            "ticks": ticks,
+            "fired": fired,
+            "load_s": round(load_seconds, 2),
+            "day_cpu_s": round(heap_total, 2),
+            "us_per_fire": round(heap_total / max(fired, 1) * 1e6, 2),
+            "peak_rss_growth_mb": round(heap_kb / 1024, 1),
+            **percentiles(heap_latencies)
+        },
+        {
+            "method": "scan",
+            "ticks": args.scan_ticks,
+            "day_cpu_s": round(sum(scan_latencies) / len(scan_latencies) * ticks, 1),
+            **percentiles(scan_latencies)
+        }
+    ]
+    print(f"💊 {args.medications} medications, {ticks} ticks of {args.tick_seconds}s, {fired} reminders fired")
+    print(f"heap: load {load_seconds:.2f}s, {heap_total:.2f}s CPU for the day, {rows[0]['us_per_fire']}us/fire, "
+          f"tick p50 {rows[0]['p50_ms']:.2f}ms p99 {rows[0]['p99_ms']:.2f}ms, +{rows[0]['peak_rss_growth_mb']} MB")
+    print(f"scan: tick p50 {rows[1]['p50_ms']:.0f}ms, ~{rows[1]['day_cpu_s']}s CPU for the day (extrapolated)")
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "cpus": os.cpu_count(),
+            "config": {key: getattr(args, key) for key in ("medications", "tick_seconds", "scan_ticks")}
+        },
+        "runs": rows
+    }
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"reminders-{report['meta']['commit'] or 'nogit'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""API process cold start: import cost of main and time until /health answers.
+
+Each run is a fresh interpreter. "serving" is the first HTTP response from
+/health (any status); "ready" is the first 200, i.e. models loaded and
+warmed, which never happens if Whisper/Piper aren't installed:
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import():
+    """(wall seconds, cumulative µs of main and of each module main imports directly)"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    wall = time.perf_counter() - start
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        # One space of indent is a top-level import (main), three its direct imports
+        if match and len(match.group(3)) in (1, 3):
+            cumulative[match.group(4)] = int(match.group(2))
+    return wall, cumulative
+
+
+def measure_cold_start(timeout: float):
+    """(seconds until /health answers, seconds until it answers 200 or None)"""
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    serving = ready = None
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                status = httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code
+            except httpx.HTTPError:
+                time.sleep(0.02)
+                continue
+            now = time.perf_counter() - start
+            serving = serving or now
+            if status == 200:
+                ready = now
+                break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return serving, ready
+
+
+def _median(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ready-timeout", type=float, default=10, help="give up waiting for a 200 after this long")
+    parser.add_argument("--top", type=int, default=12, help="heaviest direct imports of main to list")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    starts = [measure_cold_start(args.ready_timeout) for _ in range(args.runs)]
+
+    print(f"import main: wall {_median(w for w, _ in imports):.3f}s, "
+          f"importtime {_median(c.get('main') for _, c in imports) / 1e6:.3f}s (median of {args.runs})")
+
+    heaviest = {}
+    for _, cumulative in imports:
+        for module, us in cumulative.items():
+            heaviest.setdefault(module, []).append(us)
+    print(f"\n{'module':<40} {'cumulative (ms)':>16}")
+    heaviest.pop("main", None)
+    for module, values in sorted(heaviest.items(), key=lambda item: -statistics.median(item[1]))[:args.top]:
+        print(f"{module:<40} {statistics.median(values) / 1000:>16.1f}")
+
+    serving = _median(s for s, _ in starts)
+    ready = _median(r for _, r in starts)
+    print(f"\ncold start: serving after {serving:.3f}s, "
+          + (f"ready after {ready:.3f}s" if ready is not None else f"not ready within {args.ready_timeout:g}s"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Whisper throughput (requests/sec) vs. micro-batch window.
+
+Fires bursts of concurrent transcriptions of input.wav through
+stt.BatchedTranscriber, the same path /voice-chat uses, for each window.
+Needs faster-whisper and its model:
+
+    python -m benchmarks.bench_stt_batch --concurrency 16 --windows 0,10,25,50
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from audio import decode_wav
+
+AUDIO_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "input.wav")
+
+
+async def _burst(transcriber, audio, concurrency: int, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(transcriber(audio) for _ in range(concurrency)))
+    return concurrency * rounds / (time.perf_counter() - start)
+
+
+async def _run(args):
+    import stt
+
+    if not stt.WHISPER_AVAILABLE:
+        raise SystemExit("faster-whisper is not installed")
+
+    with open(AUDIO_FILE, "rb") as f:
+        audio = decode_wav(f.read())
+
+    # Warm-up so model load and first-call allocation don't skew the first row
+    stt.speech_to_text(audio)
+
+    print(f"{'window (ms)':>12} {'req/s':>8} {'avg batch':>10}")
+    for window in args.windows:
+        if window == 0:
+            # Unbatched baseline: each request is its own pool job
+            async def transcriber(clip):
+                return await stt.inference.pool.run(stt.speech_to_text, clip)
+            rps = await _burst(transcriber, audio, args.concurrency, args.rounds)
+            print(f"{0:>12g} {rps:>8.2f} {1:>10.1f}")
+            continue
+
+        batcher = stt.BatchedTranscriber(window_ms=window, max_batch=args.max_batch)
+        rps = await _burst(batcher.transcribe, audio, args.concurrency, args.rounds)
+        print(f"{window:>12g} {rps:>8.2f} {batcher.requests / batcher.batches:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument(
+        "--windows", type=lambda v: [float(w) for w in v.split(",")], default=[0, 10, 25, 50]
+    )
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
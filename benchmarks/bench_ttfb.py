@@ -0,0 +1,100 @@
+"""Time-to-first-byte of /voice-chat vs. /voice-chat/stream.
+
+Runs the API in-process against a stub Ollama. STT and Piper are replaced by
+fixed-cost fakes so the numbers only reflect how the stages are pipelined:
+
+    python -m benchmarks.bench_ttfb --requests 5 --token-delay 0.03
+"""
+import argparse
+import os
+import socket
+import statistics
+import threading
+import time
+
+import httpx
+
+from benchmarks.serve import fake_piper_chunks
+from benchmarks.stubs import start_stub_ollama
+
+AUDIO_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "input.wav")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _install_fakes(synth_seconds_per_char: float):
+    import main
+    import tts
+
+    async def fake_transcribe(*args):
+        return "How much water should I drink?"
+
+    main.verify_key = lambda key: True
+    main.transcribe_upload = fake_transcribe
+    tts.USE_ELEVENLABS = False
+    tts.PIPER_AVAILABLE = True
+    tts.piper_pcm_chunks = fake_piper_chunks(synth_seconds_per_char)
+    return main.app
+
+
+def _start_api(app):
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def _measure(url: str):
+    with open(AUDIO_FILE, "rb") as f:
+        audio = f.read()
+
+    start = time.perf_counter()
+    ttfb = None
+    with httpx.stream(
+        "POST",
+        url,
+        headers={"x-api-key": "bench"},
+        files={"audio_file": ("input.wav", audio, "audio/wav")},
+        timeout=120
+    ) as response:
+        response.raise_for_status()
+        for chunk in response.iter_bytes(chunk_size=4096):
+            if chunk and ttfb is None:
+                ttfb = time.perf_counter() - start
+    return ttfb, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--token-delay", type=float, default=0.03, help="stub Ollama seconds per token")
+    parser.add_argument("--synth-cost", type=float, default=0.002, help="fake Piper seconds per character")
+    args = parser.parse_args()
+
+    stub, ollama_url = start_stub_ollama(token_delay=args.token_delay)
+    os.environ["OLLAMA_URL"] = ollama_url
+
+    app = _install_fakes(args.synth_cost)
+    api, base_url = _start_api(app)
+
+    print(f"{'endpoint':<20} {'ttfb p50 (s)':>14} {'total p50 (s)':>14}")
+    for path in ("/voice-chat", "/voice-chat/stream"):
+        runs = [_measure(base_url + path) for _ in range(args.requests)]
+        ttfb = statistics.median(r[0] for r in runs)
+        total = statistics.median(r[1] for r in runs)
+        print(f"{path:<20} {ttfb:>14.3f} {total:>14.3f}")
+
+    api.should_exit = True
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
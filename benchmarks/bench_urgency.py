@@ -0,0 +1,91 @@
+"""Urgency matching: per-keyword substring loop vs. the compiled matcher.
+
+The legacy loop costs one scan per keyword, so the table also pads the
+keyword list with synthetic terms to show how each approach scales:
+
+    python -m benchmarks.bench_urgency --transcripts 20000
+"""
+import argparse
+import random
+import time
+
+from prompts import EMERGENCY_KEYWORDS, MEDIUM_URGENCY_INDICATORS
+from urgency import UrgencyMatcher, UrgencyStream
+
+FILLER = (
+    "i have been feeling a bit tired lately and my throat is sore in the mornings "
+    "i drink water and rest but i wanted to ask what else i could do for it"
+).split()
+
+
+def _legacy_matcher(emergency_keywords):
+    """The original get_urgency_assessment scan: one substring search per keyword"""
+    def level(text: str) -> str:
+        lower = text.lower()
+        for keyword in emergency_keywords:
+            if keyword in lower:
+                return "emergency"
+        if any(indicator in lower for indicator in MEDIUM_URGENCY_INDICATORS):
+            return "medium"
+        return "low"
+    return level
+
+
+def _synthetic_keywords(count: int, seed: int = 11):
+    rng = random.Random(seed)
+    word = lambda: "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9)))
+    return [f"{word()} {word()}" for _ in range(count)]
+
+
+def _transcripts(count: int, words: int, seed: int = 7):
+    rng = random.Random(seed)
+    keywords = EMERGENCY_KEYWORDS + MEDIUM_URGENCY_INDICATORS
+    out = []
+    for i in range(count):
+        text = [rng.choice(FILLER) for _ in range(words)]
+        # One in five transcripts mentions a keyword somewhere
+        if i % 5 == 0:
+            text.insert(rng.randrange(len(text)), rng.choice(keywords))
+        out.append(" ".join(text))
+    return out
+
+
+def _time(fn, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcripts", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=40)
+    parser.add_argument(
+        "--extra-keywords", type=lambda v: [int(n) for n in v.split(",")], default=[0, 100, 500]
+    )
+    args = parser.parse_args()
+
+    texts = _transcripts(args.transcripts, args.words)
+
+    print(f"{'keywords':>8} {'legacy us':>10} {'trie us':>8} {'streamed us':>12}")
+    for extra in args.extra_keywords:
+        emergency = EMERGENCY_KEYWORDS + _synthetic_keywords(extra)
+        matcher = UrgencyMatcher(emergency, MEDIUM_URGENCY_INDICATORS)
+
+        def streamed(text):
+            # Partial STT results arrive a few words at a time
+            stream = UrgencyStream(matcher)
+            words = text.split()
+            for i in range(0, len(words), 4):
+                stream.feed(" ".join(words[i:i + 4]))
+            return stream.level
+
+        keywords = len(emergency) + len(MEDIUM_URGENCY_INDICATORS)
+        print(
+            f"{keywords:>8} {_time(_legacy_matcher(emergency), texts):>10.2f} "
+            f"{_time(matcher.level, texts):>8.2f} {_time(streamed, texts):>12.2f}"
+        )
+
+if __name__ == "__main__":
+    main()
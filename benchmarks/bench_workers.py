@@ -0,0 +1,224 @@
+"""Memory and throughput of N uvicorn workers, with and without the model server.
+
+For each worker count, runs the API as `uvicorn --workers N` twice: once
+with every worker loading its own Whisper/Piper ("in-process") and once with
+the workers as thin clients of a single model_server.py ("sidecar"). Reports
+the total PSS of the whole process tree (PSS splits shared pages between the
+processes mapping them, so the sum isn't inflated by copy-on-write sharing)
+and /voice-chat throughput and latency:
+
+    python -m benchmarks.bench_workers --workers 1 2 4 8 --requests 64
+
+Whisper/Piper are faked when not installed (see benchmarks.serve); the
+memory numbers then only show per-process interpreter overhead, not model
+weights, so run it where the models are installed for numbers that matter.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+import httpx
+
+from benchmarks.load_test import RESULTS_DIR, ROOT, _free_port, _git_commit, drive, load_clips, summarize
+from benchmarks.stubs import start_stub_ollama
+
+
+# ---------------- MEMORY ----------------
+def _children(pid: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # ppid is the second field after the parenthesised command name
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+def _pss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def tree_pss_mb(pids: List[int]) -> dict:
+    """Total PSS of the given processes and all their descendants"""
+    seen, stack = [], list(pids)
+    while stack:
+        pid = stack.pop()
+        seen.append(pid)
+        stack.extend(_children(pid))
+    return {"processes": len(seen), "pss_mb": round(sum(_pss_mb(pid) for pid in seen), 1)}
+
+
+# ---------------- SERVERS ----------------
+def _wait_until_serving(base_url: str, processes: List[subprocess.Popen], socket_path: Optional[str], timeout: float = 120):
+    # /health stays 503 with faked models, so wait for /metrics (and the socket)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if any(p.poll() is not None for p in processes):
+            raise SystemExit("Server exited during startup")
+        try:
+            httpx.get(base_url + "/metrics", timeout=2)
+            if socket_path is None or os.path.exists(socket_path):
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Server not serving within {timeout:g}s")
+
+
+def start(workers: int, sidecar: bool, args, env: dict, socket_path: str):
+    """Start uvicorn (and the model server); returns (processes, base_url)"""
+    env = dict(env)
+    cost = ["--stt-cost", str(args.stt_cost), "--synth-cost", str(args.synth_cost)]
+    fake = ["--fake-models"] if args.fake_models else []
+    processes = []
+
+    if sidecar:
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.serve", "--model-server", socket_path, *cost, *fake],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL
+        ))
+        env["MODEL_SERVER_SOCKET"] = socket_path
+    else:
+        env["MODEL_SERVER_SOCKET"] = ""
+
+    env.update(
+        BENCH_FAKE_MODELS="1" if args.fake_models else "0",
+        BENCH_STT_COST=str(args.stt_cost),
+        BENCH_SYNTH_COST=str(args.synth_cost)
+    )
+    port = _free_port()
+    processes.append(subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "--factory", "benchmarks.serve:create_app",
+            "--workers", str(workers), "--port", str(port), "--log-level", "warning"
+        ],
+        cwd=ROOT, env=env
+    ))
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_serving(base_url, processes, socket_path if sidecar else None)
+    except BaseException:
+        stop(processes)
+        raise
+    return processes, base_url
+
+
+def stop(processes: List[subprocess.Popen]):
+    for process in reversed(processes):
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run_one(workers: int, sidecar: bool, args, env: dict, clips: dict, socket_path: str) -> dict:
+    processes, base_url = start(workers, sidecar, args, env, socket_path)
+    try:
+        url = base_url + "/voice-chat"
+        asyncio.run(drive(url, "bench", clips, workers, workers * 2, args.timeout))
+        idle = tree_pss_mb([p.pid for p in processes])
+        results, wall = asyncio.run(drive(url, "bench", clips, args.concurrency, args.requests, args.timeout))
+        loaded = tree_pss_mb([p.pid for p in processes])
+    finally:
+        stop(processes)
+
+    summary = summarize(results, wall)
+    return {
+        "workers": workers,
+        "mode": "sidecar" if sidecar else "in-process",
+        "processes": loaded["processes"],
+        "idle_pss_mb": idle["pss_mb"],
+        "loaded_pss_mb": loaded["pss_mb"],
+        "throughput_rps": summary["throughput_rps"],
+        "ok": summary["ok"],
+        "requests": summary["requests"],
+        "p50_ms": summary["end_to_end"]["p50_ms"],
+        "p95_ms": summary["end_to_end"]["p95_ms"]
+    }
+
+
+def print_report(rows: List[dict]):
+    print(f"\n{'workers':>7} {'mode':<11} {'procs':>5} {'PSS idle':>9} {'PSS load':>9} {'rps':>7} {'p50':>7} {'p95':>7}")
+    for row in rows:
+        print(
+            f"{row['workers']:>7} {row['mode']:<11} {row['processes']:>5} {row['idle_pss_mb']:>8.0f}M "
+            f"{row['loaded_pss_mb']:>8.0f}M {row['throughput_rps'] or 0:>7.2f} {row['p50_ms'] or 0:>7.0f} {row['p95_ms'] or 0:>7.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--modes", nargs="+", choices=["in-process", "sidecar"], default=["in-process", "sidecar"])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--fake-models", action="store_true", help="fake Whisper and Piper even if installed")
+    parser.add_argument("--token-delay", type=float, default=0.03, help="stub Ollama seconds per token")
+    parser.add_argument("--stt-cost", type=float, default=0.1, help="fake Whisper seconds per second of audio")
+    parser.add_argument("--synth-cost", type=float, default=0.002, help="fake Piper seconds per character")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--out", help="result file (default: benchmarks/results/workers-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    clips = load_clips([])
+    env = dict(os.environ)
+    env.pop("ELEVENLABS_API_KEY", None)
+    ollama, env["OLLAMA_URL"] = start_stub_ollama(token_delay=args.token_delay, unique=True)
+
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            socket_path = os.path.join(tmp, "models.sock")
+            for workers in args.workers:
+                for mode in args.modes:
+                    print(f"⏱️  {workers} worker(s), {mode}...", flush=True)
+                    rows.append(run_one(workers, mode == "sidecar", args, env, clips, socket_path))
+    finally:
+        ollama.shutdown()
+
+    print_report(rows)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "cpus": os.cpu_count(),
+            "config": {
+                key: getattr(args, key) for key in (
+                    "concurrency", "requests", "fake_models", "token_delay", "stt_cost", "synth_cost"
+                )
+            }
+        },
+        "runs": rows
+    }
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"workers-{report['meta']['commit'] or 'nogit'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+"""End-to-end load test of the voice endpoints, with results saved as JSON.
+
+Starts stub Ollama/ElevenLabs servers and the API in a subprocess
+(benchmarks.serve, which fakes Whisper/Piper when they aren't installed),
+then drives each endpoint with the fixture clips at the given concurrency.
+Reports end-to-end and time-to-first-byte p50/p95/p99, throughput, per-stage
+latency from /metrics and the server's RSS:
+
+    python -m benchmarks.load_test --concurrency 8 --requests 64
+    python -m benchmarks.load_test --compare benchmarks/results/<earlier run>.json
+
+--url points it at an already running server instead (per-stage numbers
+still come from its /metrics; pass --server-pid to sample its RSS). With
+--compare, the exit status is 1 if any endpoint's p95 got more than
+--max-regression slower or its throughput dropped by as much.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import wave
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from benchmarks.stubs import start_stub_elevenlabs, start_stub_ollama
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DEFAULT_ENDPOINTS = ["/voice-chat", "/voice-chat/stream"]
+
+
+# ---------------- FIXTURES ----------------
+def _wav_bytes(samples: np.ndarray, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(samples.shape[1] if samples.ndim == 2 else 1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def load_clips(paths: List[str]) -> Dict[str, bytes]:
+    """The given WAV files; by default input.wav plus an 8 kHz stereo copy of it,
+    so the resample/downmix decode path is exercised too"""
+    if paths:
+        clips = {}
+        for path in paths:
+            with open(path, "rb") as f:
+                clips[os.path.basename(path)] = f.read()
+        return clips
+
+    with open(os.path.join(ROOT, "input.wav"), "rb") as f:
+        original = f.read()
+    with wave.open(io.BytesIO(original)) as wav_file:
+        rate = wav_file.getframerate()
+        mono = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype="<i2")
+        if wav_file.getnchannels() > 1:
+            mono = mono[::wav_file.getnchannels()]
+    positions = np.arange(0, len(mono), rate / 8000)
+    narrow = np.interp(positions, np.arange(len(mono)), mono).astype(np.int16)
+    return {
+        "input.wav": original,
+        "input_8k_stereo.wav": _wav_bytes(np.stack([narrow, narrow], axis=1), 8000)
+    }
+
+
+# ---------------- SERVER ----------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, env: dict):
+    """Start benchmarks.serve; returns (process, base_url, faked model list)"""
+    port = _free_port()
+    command = [
+        sys.executable, "-m", "benchmarks.serve", "--port", str(port),
+        "--stt-cost", str(args.stt_cost), "--synth-cost", str(args.synth_cost)
+    ]
+    if args.fake_models:
+        command.append("--fake-models")
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True)
+
+    # First line names the faked models; it is printed before uvicorn starts
+    faked_line = process.stdout.readline().strip()
+    faked = re.findall(r"'(\w+)'", faked_line)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("API server exited during startup")
+        try:
+            httpx.get(base_url + "/metrics", timeout=1)
+            return process, base_url, faked
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise SystemExit("API server did not start within 60s")
+
+
+class RssSampler:
+    """Samples a process's resident set size from /proc in a background thread"""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.path = f"/proc/{pid}/statm"
+        self.interval = interval
+        self.samples: List[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _read_mb(self) -> Optional[float]:
+        try:
+            with open(self.path) as f:
+                pages = int(f.read().split()[1])
+        except (OSError, ValueError, IndexError):
+            return None
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = self._read_mb()
+            if rss is not None:
+                self.samples.append(rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self) -> Optional[dict]:
+        if not self.samples:
+            return None
+        return {"start_mb": round(self.samples[0], 1), "peak_mb": round(max(self.samples), 1), "end_mb": round(self.samples[-1], 1)}
+
+
+# ---------------- METRICS ----------------
+_SAMPLE = re.compile(r'^voice_stage_seconds_bucket\{(.*)\} (\S+)$')
+_LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+
+def scrape_stage_buckets(client: httpx.Client, base_url: str) -> Dict[str, Dict[float, float]]:
+    """Cumulative bucket counts per stage series, keyed like 'stt backend=faster-whisper model=tiny'"""
+    series: Dict[str, Dict[float, float]] = defaultdict(dict)
+    for line in client.get(base_url + "/metrics").text.splitlines():
+        match = _SAMPLE.match(line)
+        if not match:
+            continue
+        labels = dict(_LABEL.findall(match.group(1)))
+        le = float(labels.pop("le").replace("+Inf", "inf"))
+        stage = labels.pop("stage")
+        labels.pop("outcome", None)
+        key = " ".join([stage] + [f"{name}={value}" for name, value in sorted(labels.items())])
+        series[key][le] = float(match.group(2))
+    return series
+
+
+def histogram_quantile(q: float, buckets: Dict[float, float]) -> Optional[float]:
+    """Quantile from cumulative buckets, interpolating linearly within a bucket (as Prometheus does)"""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]]
+    if total <= 0:
+        return None
+    rank = q * total
+    lower_bound, lower_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound  # beyond the last finite bucket; the best we can say
+            if count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def stage_latency(before: Dict[str, Dict[float, float]], after: Dict[str, Dict[float, float]]) -> dict:
+    """p50/p95/p99 per stage over the observations made between two scrapes"""
+    stages = {}
+    for key, buckets in sorted(after.items()):
+        delta = {le: count - before.get(key, {}).get(le, 0) for le, count in buckets.items()}
+        count = delta.get(float("inf"), 0)
+        if count <= 0:
+            continue
+        stages[key] = {
+            "count": int(count),
+            **{f"p{int(q * 100)}_ms": _ms(histogram_quantile(q, delta)) for q in (0.5, 0.95, 0.99)}
+        }
+    return stages
+
+
+# ---------------- LOAD ----------------
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    array = np.array(values)
+    return {
+        "p50_ms": _ms(float(np.percentile(array, 50))),
+        "p95_ms": _ms(float(np.percentile(array, 95))),
+        "p99_ms": _ms(float(np.percentile(array, 99))),
+        "mean_ms": _ms(float(array.mean()))
+    }
+
+
+async def _one_request(client: httpx.AsyncClient, url: str, headers: dict, name: str, clip: bytes) -> dict:
+    start = time.perf_counter()
+    ttfb = None
+    size = 0
+    try:
+        async with client.stream(
+            "POST", url,
+            headers=headers,
+            files={"audio_file": (name, clip, "audio/wav")}
+        ) as response:
+            async for chunk in response.aiter_bytes():
+                if chunk and ttfb is None:
+                    ttfb = time.perf_counter() - start
+                size += len(chunk)
+            status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return {"status": status, "total": time.perf_counter() - start, "ttfb": ttfb, "bytes": size}
+
+
+async def drive(
+    url: str,
+    api_key: str,
+    clips: Dict[str, bytes],
+    concurrency: int,
+    requests: int,
+    timeout: float,
+    accept: Optional[str] = None
+):
+    """Send `requests` uploads with `concurrency` in flight; returns (results, wall seconds)"""
+    names = list(clips)
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(names[i % len(names)])
+    results = []
+    headers = {"x-api-key": api_key}
+    if accept:
+        headers["accept"] = accept
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def worker():
+            while not queue.empty():
+                name = queue.get_nowait()
+                results.append(await _one_request(client, url, headers, name, clips[name]))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    return results, wall
+
+
+def summarize(results: List[dict], wall: float) -> dict:
+    ok = [r for r in results if r["status"] == 200]
+    statuses = defaultdict(int)
+    for r in results:
+        statuses[str(r["status"])] += 1
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "statuses": dict(statuses),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else None,
+        "wall_seconds": round(wall, 3),
+        "mean_response_bytes": round(sum(r["bytes"] for r in ok) / len(ok)) if ok else None,
+        "end_to_end": percentiles([r["total"] for r in ok]),
+        "ttfb": percentiles([r["ttfb"] for r in ok if r["ttfb"] is not None])
+    }
+
+
+# ---------------- REPORT ----------------
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict):
+    print(f"\n{'endpoint':<20} {'ok/req':>8} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'ttfb p50':>9}  (ms)")
+    for endpoint, result in report["endpoints"].items():
+        e2e, ttfb = result["end_to_end"], result["ttfb"]
+        print(
+            f"{endpoint:<20} {result['ok']:>3}/{result['requests']:<4} {result['throughput_rps'] or 0:>7.2f} "
+            f"{e2e['p50_ms'] or 0:>8.0f} {e2e['p95_ms'] or 0:>8.0f} {e2e['p99_ms'] or 0:>8.0f} {ttfb['p50_ms'] or 0:>9.0f}"
+        )
+        if result.get("mean_response_bytes"):
+            print(f"    mean response: {result['mean_response_bytes'] / 1024:.1f} KiB")
+        for stage, latency in result["stages"].items():
+            print(f"    {stage:<52} n={latency['count']:<5} p50={latency['p50_ms']}  p95={latency['p95_ms']}")
+        if result.get("rss"):
+            print(f"    server RSS: {result['rss']}")
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> bool:
+    """Print per-endpoint deltas against a baseline run; False if any regressed past the limit"""
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    passed = True
+    for endpoint, result in report["endpoints"].items():
+        previous = baseline["endpoints"].get(endpoint)
+        if previous is None:
+            continue
+        for label, now, before, worse in (
+            ("p95", result["end_to_end"]["p95_ms"], previous["end_to_end"]["p95_ms"], lambda change: change > max_regression),
+            ("rps", result["throughput_rps"], previous["throughput_rps"], lambda change: change < -max_regression)
+        ):
+            if not now or not before:
+                continue
+            change = (now - before) / before
+            flag = "REGRESSION" if worse(change) else ""
+            passed = passed and not flag
+            print(f"  {endpoint:<20} {label}: {before:>9.1f} -> {now:>9.1f} ({change:+.1%}) {flag}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=32, help="per endpoint")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed requests per endpoint")
+    parser.add_argument("--endpoints", type=lambda v: v.split(","), default=DEFAULT_ENDPOINTS)
+    parser.add_argument("--clips", nargs="*", default=[], help="WAV files (default: input.wav + an 8 kHz stereo copy)")
+    parser.add_argument("--url", help="benchmark a running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="with --url: sample this process's RSS")
+    parser.add_argument("--api-key", default="bench")
+    parser.add_argument("--tts", choices=["piper", "elevenlabs"], default="piper")
+    parser.add_argument("--fake-models", action="store_true", help="fake Whisper and Piper even if installed")
+    parser.add_argument("--token-delay", type=float, default=0.03, help="stub Ollama seconds per token")
+    parser.add_argument("--repeat-replies", action="store_true", help="same LLM reply every time, so TTS hits its cache")
+    parser.add_argument("--accept", help="Accept header for reply audio, e.g. audio/ogg or audio/mpeg")
+    parser.add_argument("--answer-cache", action="store_true", help="enable the server's answer cache (ANSWER_CACHE_ENABLED)")
+    parser.add_argument("--stt-cost", type=float, default=0.1, help="fake Whisper seconds per second of audio")
+    parser.add_argument("--synth-cost", type=float, default=0.002, help="fake Piper seconds per character")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--out", help="result file (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier result file to diff against")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    args = parser.parse_args()
+
+    clips = load_clips(args.clips)
+    stubs = []
+    process = None
+    faked: List[str] = []
+
+    if args.url:
+        base_url, pid = args.url.rstrip("/"), args.server_pid
+    else:
+        env = dict(os.environ)
+        ollama, env["OLLAMA_URL"] = start_stub_ollama(token_delay=args.token_delay, unique=not args.repeat_replies)
+        stubs.append(ollama)
+        if args.tts == "elevenlabs":
+            elevenlabs, env["ELEVENLABS_URL"] = start_stub_elevenlabs()
+            env["ELEVENLABS_API_KEY"] = "bench"
+            stubs.append(elevenlabs)
+        else:
+            env.pop("ELEVENLABS_API_KEY", None)
+        env["ANSWER_CACHE_ENABLED"] = "true" if args.answer_cache else "false"
+        process, base_url, faked = start_server(args, env)
+        pid = process.pid
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "url": args.url,
+            "faked_models": faked,
+            "config": {
+                key: getattr(args, key) for key in (
+                    "concurrency", "requests", "warmup", "accept", "tts", "token_delay", "repeat_replies", "answer_cache",
+                    "stt_cost", "synth_cost"
+                )
+            },
+            "clips": {name: len(data) for name, data in clips.items()}
+        },
+        "endpoints": {}
+    }
+
+    try:
+        with httpx.Client(timeout=10) as scraper:
+            for endpoint in args.endpoints:
+                url = base_url + endpoint
+                if args.warmup:
+                    asyncio.run(drive(url, args.api_key, clips, 1, args.warmup, args.timeout, args.accept))
+
+                before = scrape_stage_buckets(scraper, base_url)
+                with RssSampler(pid) if pid else contextlib.nullcontext() as sampler:
+                    results, wall = asyncio.run(
+                        drive(url, args.api_key, clips, args.concurrency, args.requests, args.timeout, args.accept)
+                    )
+                after = scrape_stage_buckets(scraper, base_url)
+
+                summary = summarize(results, wall)
+                summary["stages"] = stage_latency(before, after)
+                summary["rss"] = sampler.summary() if sampler else None
+                report["endpoints"][endpoint] = summary
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        for stub in stubs:
+            stub.shutdown()
+
+    print_report(report)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{report['meta']['commit'] or 'nogit'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Run the API for a load test, faking whichever local models are missing.
+
+Started as a subprocess by benchmarks.load_test so the server's latency and
+RSS aren't mixed up with the load generator's. Ollama and ElevenLabs are
+reached through OLLAMA_URL / ELEVENLABS_URL, which the driver points at its
+stubs. When faster-whisper or Piper isn't installed (or --fake-models is
+given) they are replaced at the lowest level, so decoding, batching, the
+inference pool and caching still run for real:
+
+    python -m benchmarks.serve --port 8001 --fake-models
+
+--model-server SOCKET runs model_server.py (with the same fakes) instead of
+the API. For several uvicorn workers, point MODEL_SERVER_SOCKET at it (or
+leave it unset for in-process models) and use the app factory, which reads
+its fakes from BENCH_FAKE_MODELS / BENCH_STT_COST / BENCH_SYNTH_COST:
+
+    uvicorn --factory benchmarks.serve:create_app --workers 4 --port 8001
+"""
+import argparse
+import os
+import time
+
+SAMPLE_RATE = 22050
+WHISPER_SAMPLE_RATE = 16000
+
+
+def fake_piper_chunks(synth_seconds_per_char: float):
+    """Stand-in for tts.piper_pcm_chunks with a fixed cost per character"""
+    def piper_pcm_chunks(text):
+        time.sleep(synth_seconds_per_char * len(text))
+        # ~60 ms of silence per character, roughly Piper's speaking rate
+        yield b"\x00\x00" * int(SAMPLE_RATE * 0.06 * len(text)), SAMPLE_RATE
+    return piper_pcm_chunks
+
+
+def fake_speech_to_text(seconds_per_audio_second: float, text: str = "How much water should I drink?"):
+    """Stand-in for stt.speech_to_text whose cost scales with clip length"""
+    def speech_to_text(audio):
+        duration = len(audio) / WHISPER_SAMPLE_RATE if not isinstance(audio, str) else 3.0
+        time.sleep(seconds_per_audio_second * duration)
+        return text
+    return speech_to_text
+
+
+def install_fakes(fake_models: bool, stt_cost: float, synth_cost: float) -> dict:
+    """Swap in fake models where needed; returns which backends are fake"""
+    import stt
+    import tts
+    import main
+
+    main.verify_key = lambda key: True
+    faked = {}
+    if fake_models or not stt.WHISPER_AVAILABLE:
+        stt.speech_to_text = fake_speech_to_text(stt_cost)
+        faked["stt"] = True
+    if fake_models or not tts.PIPER_AVAILABLE:
+        tts.PIPER_AVAILABLE = True
+        tts.piper_pcm_chunks = fake_piper_chunks(synth_cost)
+        faked["piper"] = True
+    return faked
+
+
+def create_app():
+    """App factory for `uvicorn --factory --workers N`; each worker installs its own fakes"""
+    install_fakes(
+        os.getenv("BENCH_FAKE_MODELS") == "1",
+        float(os.getenv("BENCH_STT_COST", "0.1")),
+        float(os.getenv("BENCH_SYNTH_COST", "0.002"))
+    )
+    import main as api
+    return api.app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--fake-models", action="store_true", help="fake Whisper and Piper even if installed")
+    parser.add_argument("--stt-cost", type=float, default=0.1, help="fake Whisper seconds per second of audio")
+    parser.add_argument("--synth-cost", type=float, default=0.002, help="fake Piper seconds per character")
+    parser.add_argument("--model-server", metavar="SOCKET", help="run the model server on SOCKET instead of the API")
+    args = parser.parse_args()
+
+    if args.model_server:
+        # Must come before stt/tts are imported (see model_server.py)
+        import asyncio
+        import model_server
+
+        faked = install_fakes(args.fake_models, args.stt_cost, args.synth_cost)
+        print(f"Faked models: {sorted(faked) or 'none'}", flush=True)
+        asyncio.run(model_server.serve(args.model_server))
+        return
+
+    import uvicorn
+
+    faked = install_fakes(args.fake_models, args.stt_cost, args.synth_cost)
+    print(f"Faked models: {sorted(faked) or 'none'}", flush=True)
+
+    import main as api
+    uvicorn.run(api.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
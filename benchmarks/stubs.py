@@ -0,0 +1,118 @@
+"""Local stand-ins for Ollama and ElevenLabs, for benchmarks and tests.
+
+The Ollama stub emits a canned health answer word by word with a fixed
+delay per token, either as an NDJSON stream or as a single JSON body
+(optionally numbered so no two replies are alike), and hands back a fake
+`context` that grows each turn like Ollama's. The ElevenLabs stub
+answers text-to-speech calls with fake MP3 bytes after a fixed base
+latency plus a per-character cost.
+"""
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = (
+    "Drinking enough water helps your body regulate temperature. "
+    "Most adults need around eight glasses a day, more if it is hot or you exercise. "
+    "Sip water regularly rather than drinking a lot at once. "
+    "Watch for signs of dehydration such as dark urine, dizziness or a dry mouth. "
+    "If you feel unwell for more than a few days, please consult a doctor."
+)
+
+
+def _tokens(text):
+    words = text.split(" ")
+    return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+
+def _read_json(handler: BaseHTTPRequestHandler) -> dict:
+    length = int(handler.headers.get("Content-Length", 0))
+    return json.loads(handler.rfile.read(length) or b"{}")
+
+
+def make_ollama_handler(token_delay: float, reply: str = REPLY, unique: bool = False):
+    counter = itertools.count(1)
+
+    class StubOllamaHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = _read_json(self)
+            # A numbered last sentence makes every reply a TTS cache miss
+            text = f"{reply} This is answer number {next(counter)}." if unique else reply
+            tokens = _tokens(text)
+            # One "token" per word: what Ollama would prefill (system prompt
+            # only without a context) and the context to resume from
+            prompt_tokens = len((body.get("prompt", "") + " " + body.get("system", "")).split())
+            context = list(body.get("context") or []) + list(range(prompt_tokens + len(tokens)))
+            done = {"response": "", "done": True, "prompt_eval_count": prompt_tokens, "context": context}
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+
+            if body.get("stream", True):
+                for token in tokens:
+                    time.sleep(token_delay)
+                    self.wfile.write(json.dumps({"response": token, "done": False}).encode() + b"\n")
+                    self.wfile.flush()
+                self.wfile.write(json.dumps(done).encode() + b"\n")
+            else:
+                time.sleep(token_delay * len(tokens))
+                # Real Ollama reports these in nanoseconds; the first token "arrives" after one delay
+                self.wfile.write(json.dumps({
+                    **done,
+                    "response": text,
+                    "load_duration": 0,
+                    "prompt_eval_duration": int(token_delay * 1e9),
+                    "total_duration": int(token_delay * len(tokens) * 1e9)
+                }).encode())
+
+        def log_message(self, *args):
+            pass
+
+    return StubOllamaHandler
+
+
+def make_elevenlabs_handler(latency: float, seconds_per_char: float):
+    class StubElevenLabsHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            text = _read_json(self).get("text", "")
+            time.sleep(latency + seconds_per_char * len(text))
+            # An ID3 tag and silent-looking frames; only the size is realistic (~128 kbps)
+            audio = b"ID3" + b"\xff\xfb\x90\x00" * (len(text) * 240)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.send_header("Content-Length", str(len(audio)))
+            self.end_headers()
+            self.wfile.write(audio)
+
+        def log_message(self, *args):
+            pass
+
+    return StubElevenLabsHandler
+
+
+def _serve(handler, host: str, port: int):
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_stub_ollama(token_delay: float = 0.03, unique: bool = False, host: str = "127.0.0.1", port: int = 0):
+    """Start the Ollama stub in a daemon thread; returns (server, generate_url)"""
+    server = _serve(make_ollama_handler(token_delay, unique=unique), host, port)
+    return server, f"http://{host}:{server.server_address[1]}/api/generate"
+
+
+def start_stub_elevenlabs(
+    latency: float = 0.15,
+    seconds_per_char: float = 0.001,
+    host: str = "127.0.0.1",
+    port: int = 0
+):
+    """Start the ElevenLabs stub in a daemon thread; returns (server, text_to_speech_url)"""
+    server = _serve(make_elevenlabs_handler(latency, seconds_per_char), host, port)
+    return server, f"http://{host}:{server.server_address[1]}/v1/text-to-speech"
@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from database import get_redis
+
+# Stands for "not looked up yet": a cache may be built before Redis is usable
+_UNSET = object()
+
+# After a Redis error, skip the Redis tier for this long instead of
+# paying a failed round trip on every lookup
+REDIS_RETRY_SECONDS = 30
+
+# delete_soon() key meaning every key of the cache
+_ALL = object()
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and unicode variants so equivalent text shares a key"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def content_key(*parts) -> str:
+    """Stable hash of the parts that determine a cached artifact"""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+class TieredCache:
+    """Size-bounded in-process LRU in front of Redis.
+
+    The memory tier evicts least-recently-used entries once their total size
+    exceeds max_bytes; both tiers expire entries after ttl seconds. Redis is
+    optional and any Redis failure degrades to a memory-only cache.
+    """
+
+    def __init__(self, namespace: str, max_bytes: int, ttl: int, redis_client=None):
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # Resolved on first use so building a cache doesn't import/connect Redis
+        self._redis = redis_client if redis_client is not None else _UNSET
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._redis_down_until = 0.0
+        # Keys (or _ALL) whose Redis delete is still running: read as misses
+        # meanwhile, so a stale Redis copy can't come back into memory
+        self._deleting: Dict[object, int] = {}
+        self._background: Set = set()
+        # Bumped by every delete; see aset(unless_deleted_since=...)
+        self.deletions = 0
+
+        self.bytes = 0
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ---------------- MEMORY TIER ----------------
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _memory_set(self, key: str, value: bytes, ttl: int):
+        # One entry may not take more than a quarter of the budget
+        if len(value) > self.max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self.bytes += len(value)
+            while self.bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: str):
+        value, _ = self._entries.pop(key)
+        self.bytes -= len(value)
+
+    # ---------------- REDIS TIER ----------------
+    @property
+    def redis(self):
+        if self._redis is _UNSET:
+            self._redis = get_redis()
+        return self._redis
+
+    @redis.setter
+    def redis(self, client):
+        self._redis = client
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _redis_usable(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, e: Exception):
+        print(f"{self.namespace} cache: Redis unavailable ({e}) - using memory only")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    def _redis_get(self, key: str) -> Optional[bytes]:
+        if not self._redis_usable():
+            return None
+        try:
+            return self.redis.get(self._redis_key(key))
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+
+    def _redis_set(self, key: str, value: bytes, ttl: int):
+        if not self._redis_usable():
+            return
+        try:
+            self.redis.setex(self._redis_key(key), ttl, value)
+        except Exception as e:
+            self._redis_failed(e)
+
+    def _redis_delete(self, key):
+        if not self._redis_usable():
+            return
+        try:
+            if key is _ALL:
+                for redis_key in self.redis.scan_iter(match=f"{self.namespace}:*", count=500):
+                    self.redis.delete(redis_key)
+            else:
+                self.redis.delete(self._redis_key(key))
+        except Exception as e:
+            self._redis_failed(e)
+
+    def _being_deleted(self, key: str) -> bool:
+        return bool(self._deleting) and (key in self._deleting or _ALL in self._deleting)
+
+    # ---------------- PUBLIC API ----------------
+    def get(self, key: str) -> Optional[bytes]:
+        if self._being_deleted(key):
+            self.misses += 1
+            return None
+        value = self._memory_get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+
+        value = self._redis_get(key)
+        if value is not None:
+            self.redis_hits += 1
+            self._memory_set(key, value, self.ttl)
+            return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None):
+        ttl = ttl or self.ttl
+        self._memory_set(key, value, ttl)
+        self._redis_set(key, value, ttl)
+
+    def delete(self, key: str):
+        """Forget key in both tiers (e.g. once the data it was built from changed)"""
+        self.deletions += 1
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+        self._redis_delete(key)
+
+    def delete_soon(self, key=_ALL):
+        """delete() for callers that can't await, such as ORM events under an AsyncSession.
+
+        The memory tier is dropped right away; on an event loop the Redis
+        delete runs on a thread, and the key reads as a miss until it is
+        done. Without a key, the whole cache is forgotten.
+        """
+        self.deletions += 1
+        with self._lock:
+            for cached in list(self._entries) if key is _ALL else [key]:
+                if cached in self._entries:
+                    self._drop(cached)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._redis_delete(key)
+            return
+        if not self._redis_usable():
+            return
+        self._deleting[key] = self._deleting.get(key, 0) + 1
+
+        def done(future):
+            self._background.discard(future)
+            self._deleting[key] -= 1
+            if not self._deleting[key]:
+                del self._deleting[key]
+
+        future = loop.run_in_executor(None, self._redis_delete, key)
+        self._background.add(future)
+        future.add_done_callback(done)
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        """get() that only leaves the event loop for the Redis round trip"""
+        if self._being_deleted(key):
+            self.misses += 1
+            return None
+        value = self._memory_get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if not self._redis_usable():
+            self.misses += 1
+            return None
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: bytes, ttl: Optional[int] = None, unless_deleted_since: Optional[int] = None):
+        """set() off the event loop; skipped if anything was deleted since `deletions` was unless_deleted_since"""
+        if unless_deleted_since is not None and unless_deleted_since != self.deletions:
+            return
+        if self._being_deleted(key):
+            return
+        ttl = ttl or self.ttl
+        self._memory_set(key, value, ttl)
+        if self._redis_usable():
+            await asyncio.to_thread(self._redis_set, key, value, ttl)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.redis_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "memory_hits": self.memory_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.memory_hits + self.redis_hits) / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,69 @@
+"""Audio capture for the local voice loop: microphone or WAV file in, 16 kHz blocks out.
+
+The sounddevice callback only copies each block into a preallocated ring
+and the reader hands out 16 kHz float32 blocks from it; agent.py runs them
+through the same EnergyEndpointer /ws/voice uses, so utterances reach
+Whisper without touching the disk.
+"""
+import threading
+import time
+from typing import Iterator
+
+import numpy as np
+
+from audio import decode_wav
+from vad import SAMPLE_RATE, RingBuffer
+
+BLOCK_MS = 30
+# How much unread microphone audio the ring holds before the oldest is dropped
+RING_SECONDS = 30
+
+
+class MicSource:
+    """Iterate over microphone blocks (16 kHz mono float32) as they are captured"""
+
+    def __init__(self, block_ms: int = BLOCK_MS, ring_seconds: float = RING_SECONDS):
+        self.block = SAMPLE_RATE * block_ms // 1000
+        self.ring = RingBuffer(int(ring_seconds * SAMPLE_RATE))
+        self._ready = threading.Condition()
+
+    def _callback(self, indata, frames, time_info, status):
+        # Audio thread: copy into the ring and wake the reader, nothing else
+        with self._ready:
+            self.ring.write(indata[:, 0])
+            self._ready.notify()
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        import sounddevice as sd
+
+        with sd.InputStream(
+            samplerate=SAMPLE_RATE,
+            channels=1,
+            dtype="float32",
+            blocksize=self.block,
+            callback=self._callback
+        ):
+            while True:
+                with self._ready:
+                    self._ready.wait_for(lambda: self.ring.available >= self.block)
+                    block = self.ring.read()
+                yield block
+
+
+class WavFileSource:
+    """Iterate over a WAV file in mic-sized blocks, optionally at real-time pace"""
+
+    def __init__(self, path: str, block_ms: int = BLOCK_MS, realtime: bool = False):
+        with open(path, "rb") as f:
+            self.audio = decode_wav(f.read())
+        if self.audio is None:
+            raise ValueError(f"{path} is not a PCM/float WAV file")
+        self.block = SAMPLE_RATE * block_ms // 1000
+        self.realtime = realtime
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for start in range(0, len(self.audio), self.block):
+            if self.realtime:
+                time.sleep(self.block / SAMPLE_RATE)
+            yield self.audio[start:start + self.block]
+
@@ -0,0 +1,24 @@
+import os
+
+# Tests never touch a real database; set before database.py reads it
+os.environ["DATABASE_URL"] = "sqlite://"
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models import Base
+
+
+@pytest.fixture
+def db():
+    """Fresh in-memory SQLite database with every table created"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
@@ -0,0 +1,150 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+T = TypeVar("T")
+
+# ---------------- CONFIG ----------------
+# CTranslate2 (Whisper) and onnxruntime (Piper) release the GIL while they
+# compute, so threads give real parallelism and share one copy of each model
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 1)))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "32"))
+INFERENCE_MAX_WAIT = float(os.getenv("INFERENCE_MAX_WAIT", "10"))
+
+# Lower runs first
+PRIORITY_EMERGENCY = 0
+PRIORITY_NORMAL = 1
+
+
+class InferenceRejected(Exception):
+    """The node is saturated; the request should be retried later"""
+    status_code = 503
+
+    def __init__(self, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class QueueFull(InferenceRejected):
+    """Admission queue is at capacity"""
+    status_code = 429
+
+
+class AdmissionTimeout(InferenceRejected):
+    """Waited longer than max_wait for a free worker"""
+    status_code = 503
+
+
+class InferencePool:
+    """Bounded, prioritized admission in front of a worker pool for STT/TTS.
+
+    At most `workers` jobs run at once and at most `queue_size` wait behind
+    them; anything beyond that is rejected immediately instead of piling up.
+    Emergency jobs are served first and never rejected for a full queue.
+    """
+
+    def __init__(
+        self,
+        workers: int = INFERENCE_WORKERS,
+        queue_size: int = INFERENCE_QUEUE_SIZE,
+        max_wait: float = INFERENCE_MAX_WAIT
+    ):
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.running = 0
+        self.queued = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        return self._executor
+
+    @property
+    def saturated(self) -> bool:
+        return self.queued >= self.queue_size
+
+    async def _acquire(self, priority: int, max_wait: float):
+        if self.running < self.workers and self.queued == 0:
+            self.running += 1
+            return
+
+        if priority > PRIORITY_EMERGENCY and self.saturated:
+            raise QueueFull("Inference queue full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self.queued += 1
+
+        try:
+            await asyncio.wait({future}, timeout=max_wait)
+        except asyncio.CancelledError:
+            if future.done():
+                # A slot was handed over just as the caller went away; pass it on
+                self._release()
+            else:
+                future.cancel()
+                self.queued -= 1
+            raise
+
+        if not future.done():
+            # _release skips cancelled waiters
+            future.cancel()
+            self.queued -= 1
+            raise AdmissionTimeout(f"No inference worker free within {max_wait:g}s")
+
+    def _release(self):
+        self.running -= 1
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.queued -= 1
+            self.running += 1
+            future.set_result(None)
+            break
+
+    async def run(
+        self,
+        fn: Callable[..., T],
+        *args,
+        priority: int = PRIORITY_NORMAL,
+        max_wait: Optional[float] = None,
+        **kwargs
+    ) -> T:
+        """Run fn(*args, **kwargs) on a worker once admitted"""
+        await self._acquire(priority, self.max_wait if max_wait is None else max_wait)
+        loop = asyncio.get_running_loop()
+        try:
+            job = self.executor.submit(functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        # A cancelled caller doesn't stop a job already on a thread; the slot
+        # is freed when the job actually finishes, not when the caller leaves
+        job.add_done_callback(lambda _: self._release_soon(loop))
+        return await asyncio.wrap_future(job, loop=loop)
+
+    def _release_soon(self, loop: asyncio.AbstractEventLoop):
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._release)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pool = InferencePool()
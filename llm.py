@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+import random
+import time
+import weakref
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "phi")
+
+# ---------------- CONFIG ----------------
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.25"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+# How long Ollama keeps the model loaded after a call (its keep_alive)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+
+class LLMError(Exception):
+    """Ollama could not produce a reply"""
+
+
+class LLMTimeout(LLMError):
+    """The per-call deadline expired before Ollama answered"""
+
+
+# ---------------- CONNECTION POOL ----------------
+# httpx connections belong to the event loop that opened them, so keep one
+# pooled client per loop (the API's loop, plus the background loop below)
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_SECONDS
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        )
+        _clients[loop] = client
+    return client
+
+
+async def aclose():
+    """Close the pooled client for the running loop (call on app shutdown)"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _retryable(exc: Exception) -> bool:
+    if isinstance(exc, httpx.TransportError):
+        return True
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code >= 500
+
+
+async def _backoff(attempt: int, deadline: float):
+    """Sleep with full jitter, never past the deadline"""
+    loop = asyncio.get_running_loop()
+    delay = random.uniform(0, LLM_RETRY_BACKOFF * (2 ** attempt))
+    await asyncio.sleep(max(0.0, min(delay, deadline - loop.time())))
+
+
+def _remaining(deadline: float) -> float:
+    remaining = deadline - asyncio.get_running_loop().time()
+    if remaining <= 0:
+        raise LLMTimeout("LLM deadline exceeded")
+    return remaining
+
+
+# ---------------- GENERATE ----------------
+def _payload(prompt: str, model: str, stream: bool, system: Optional[str], context: Optional[List[int]]) -> dict:
+    payload = {"model": model, "prompt": prompt, "stream": stream, "keep_alive": OLLAMA_KEEP_ALIVE}
+    if system is not None:
+        payload["system"] = system
+    if context:
+        # Tokens of the conversation so far, as Ollama returned them; its KV
+        # cache already holds them, so only the new prompt is prefilled
+        payload["context"] = context
+    return payload
+
+
+def _finished(body: dict, model: str, on_context: Optional[Callable[[List[int]], None]]):
+    """Handle Ollama's final chunk: prefill time and the context for the next turn"""
+    if body.get("prompt_eval_duration"):
+        metrics.observe_stage("llm_prefill", body["prompt_eval_duration"] / 1e9, backend="ollama", model=model)
+    if on_context is not None and body.get("context"):
+        on_context(body["context"])
+
+
+async def generate(
+    prompt: str,
+    model: str = OLLAMA_MODEL,
+    timeout: float = LLM_TIMEOUT,
+    retries: int = LLM_MAX_RETRIES,
+    system: Optional[str] = None,
+    context: Optional[List[int]] = None,
+    on_context: Optional[Callable[[List[int]], None]] = None
+) -> str:
+    """Return Ollama's full reply for prompt, retrying transient failures until the deadline.
+
+    on_context receives the conversation's new context for the next turn.
+    """
+    with metrics.timed("llm_total", backend="ollama", model=model):
+        body = await _generate(_payload(prompt, model, False, system, context), timeout, retries)
+
+    _finished(body, model, on_context)
+
+    # A non-streamed reply has no first token to time; Ollama's own
+    # model-load + prompt-eval durations are when it would have arrived
+    ttft_ns = body.get("load_duration", 0) + body.get("prompt_eval_duration", 0)
+    if ttft_ns:
+        metrics.observe_stage("llm_ttft", ttft_ns / 1e9, backend="ollama", model=model)
+    return body.get("response", "")
+
+
+async def _generate(payload: dict, timeout: float, retries: int) -> dict:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    for attempt in range(retries + 1):
+        try:
+            response = await asyncio.wait_for(
+                get_client().post(OLLAMA_URL, json=payload),
+                _remaining(deadline)
+            )
+            response.raise_for_status()
+            return response.json()
+        except asyncio.TimeoutError:
+            raise LLMTimeout("LLM deadline exceeded")
+        except (httpx.HTTPError, ValueError) as e:
+            if attempt == retries or not _retryable(e):
+                raise LLMError(str(e)) from e
+            await _backoff(attempt, deadline)
+
+    raise LLMError("LLM retries exhausted")
+
+
+async def stream_tokens(
+    prompt: str,
+    model: str = OLLAMA_MODEL,
+    timeout: float = LLM_TIMEOUT,
+    retries: int = LLM_MAX_RETRIES,
+    system: Optional[str] = None,
+    context: Optional[List[int]] = None,
+    on_context: Optional[Callable[[List[int]], None]] = None
+) -> AsyncIterator[str]:
+    """Yield response tokens from Ollama's NDJSON stream as they arrive.
+
+    Transient failures are retried only until the first token has been
+    yielded; after that a replay would duplicate output. Closing the
+    generator (e.g. the client disconnected) closes the Ollama request.
+    on_context is called with the final chunk's context, if the stream
+    gets that far.
+    """
+    # Wall time to the last token; it includes time the consumer spends
+    # between tokens, since Ollama is read at the consumer's pace
+    payload = _payload(prompt, model, True, system, context)
+    with metrics.timed("llm_total", backend="ollama", model=model):
+        async with aclosing(_stream_tokens(payload, timeout, retries, on_context)) as tokens:
+            async for token in tokens:
+                yield token
+
+
+async def _stream_tokens(
+    payload: dict,
+    timeout: float,
+    retries: int,
+    on_context: Optional[Callable[[List[int]], None]]
+) -> AsyncIterator[str]:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    model = payload["model"]
+    started = False
+    start = time.perf_counter()
+
+    for attempt in range(retries + 1):
+        try:
+            async with get_client().stream("POST", OLLAMA_URL, json=payload) as response:
+                response.raise_for_status()
+                lines = response.aiter_lines()
+
+                while True:
+                    try:
+                        line = await asyncio.wait_for(lines.__anext__(), _remaining(deadline))
+                    except StopAsyncIteration:
+                        return
+
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    token = chunk.get("response")
+                    if token:
+                        if not started:
+                            metrics.observe_stage("llm_ttft", time.perf_counter() - start, backend="ollama", model=model)
+                            started = True
+                        yield token
+                    if chunk.get("done"):
+                        _finished(chunk, model, on_context)
+                        return
+        except asyncio.TimeoutError:
+            raise LLMTimeout("LLM deadline exceeded")
+        except (httpx.HTTPError, ValueError) as e:
+            if started or attempt == retries or not _retryable(e):
+                raise LLMError(str(e)) from e
+            await _backoff(attempt, deadline)
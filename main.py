@@ -1,77 +1,499 @@
-from fastapi import FastAPI, UploadFile, File, Header, HTTPException
-from fastapi.responses import Response
-import shutil
-import requests
-import os
+from fastapi import FastAPI, UploadFile, File, Header, HTTPException, Request, BackgroundTasks, WebSocket, Depends
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import time
 
-from stt import speech_to_text
+import tts
+import llm
+import answers
+import inference
+import metrics
+import model_client
+import stt
+from stt import transcribe_upload
 from tts import text_to_speech
-from auth import verify_key
+from auth import ACCESS_TOKEN_EXPIRE_MINUTES, Token, aauthenticate_user, create_access_token, get_current_user, verify_key
+from streaming import aiter_sentences, asentences, aspeak_sentences
+from audio import MEDIA_TYPES, encode_wav, media_type_of, negotiate_format
+from prompts import get_urgency_assessment, get_emergency_response, CANNED_RESPONSES, EMERGENCY_AUDIO_RESPONSE, HEALTH_SYSTEM_PROMPT
+from models import HealthLog, Medication, User
+from voice_session import VoiceSession
+from batch_writer import BatchWriter
+import database
+import monitoring
+import reminders  # keeps Medication.next_fire_at current on writes
+import sessions
 
-app = FastAPI(title="Voice AI")
+# How often a pending LLM call checks whether its client is still there
+DISCONNECT_POLL_SECONDS = 0.5
 
-OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
+
+async def warm_up(app: FastAPI):
+    """Load models in parallel, run a dummy inference on each, then prerender canned audio"""
+    start = time.perf_counter()
+    try:
+        if model_client.enabled():
+            # Models live in model_server.py; just wait for it to be warm
+            await asyncio.gather(model_client.wait_until_ready(), asyncio.to_thread(database.get_redis))
+        else:
+            await asyncio.gather(
+                asyncio.to_thread(stt.warm_up),
+                asyncio.to_thread(tts.warm_up),
+                asyncio.to_thread(database.get_redis)
+            )
+        await tts.prewarm(CANNED_RESPONSES)
+    except Exception as e:
+        app.state.warm_up_error = str(e)
+        print(f"❌ Warm-up failed: {e}")
+        return
+    app.state.models_warm = True
+    print(f"✅ Models warm in {time.perf_counter() - start:.1f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in the background: the port opens right away and /health
+    # reports not-ready until warm-up is done
+    app.state.models_warm = False
+    app.state.warm_up_error = None
+    warming = asyncio.create_task(warm_up(app))
+    health_logs.start()
+    yield
+    warming.cancel()
+    await health_logs.close()
+    await database.dispose()
+    await llm.aclose()
+    await model_client.aclose()
+    inference.pool.shutdown()
+    if tts.piper_processes is not None:
+        tts.piper_processes.shutdown()
+
+
+app = FastAPI(title="Voice AI", lifespan=lifespan)
+
+# 📝 Health logs are written behind: buffered here, inserted in batches
+# together with their readings and rollups
+health_logs = BatchWriter(HealthLog, derived=monitoring.derived_statements)
+
+metrics.register(metrics.Gauge("inference_running", "STT/TTS jobs running on the inference pool", lambda: inference.pool.running))
+metrics.register(metrics.Gauge("inference_queued", "STT/TTS jobs waiting for an inference worker", lambda: inference.pool.queued))
+metrics.register(metrics.Gauge("tts_cache_bytes", "Bytes of synthesized audio in the in-process cache", lambda: tts.audio_cache.bytes))
+metrics.register(metrics.Gauge("health_log_buffered", "HealthLog rows waiting to be inserted", lambda: health_logs.buffered))
+
+
+@app.exception_handler(inference.InferenceRejected)
+async def inference_rejected(request: Request, exc: inference.InferenceRejected):
+    # Fail fast so clients/load balancers retry elsewhere instead of piling up
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(model_client.ModelServerError)
+async def model_server_failed(request: Request, exc: model_client.ModelServerError):
+    # Timed out, still warming up or failed the job: the server is unusable for now
+    return JSONResponse(status_code=503, content={"detail": "Model server unavailable"})
+
+
+async def run_until_disconnect(request: Request, awaitable):
+    """Await awaitable, cancelling it if the client disconnects first"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        task.cancel()
+
+
+class _TimedWrite:
+    """Times how long the response body takes to reach the client"""
+
+    async def __call__(self, scope, receive, send):
+        with metrics.timed("response_write", endpoint=scope["path"]):
+            await super().__call__(scope, receive, send)
+
+
+class TimedResponse(_TimedWrite, Response):
+    pass
+
+
+class TimedStreamingResponse(_TimedWrite, StreamingResponse):
+    pass
+
+
+async def _prepend(first: bytes, rest):
+    yield first
+    async for chunk in rest:
+        yield chunk
+
+
+def health_log_row(user_id: Optional[int], user_input: str, ai_response: str, urgency: str) -> dict:
+    """Column values of the HealthLog row for one voice turn"""
+    return {
+        "user_id": user_id,
+        "log_type": "voice_interaction",
+        "data": {
+            "user_input": user_input,
+            "ai_response": ai_response,
+            "urgency_level": urgency
+        },
+        "urgency_level": urgency,
+        # Stamped now: the row may only be inserted a second later
+        "created_at": datetime.utcnow()
+    }
+
+
+def log_health_interaction(
+    db: Session,
+    user_id: Optional[int],
+    user_input: str,
+    ai_response: str,
+    urgency: str
+) -> HealthLog:
+    """Record one voice turn as a HealthLog row, committing right away"""
+    log = HealthLog(**health_log_row(user_id, user_input, ai_response, urgency))
+    db.add(log)
+    db.commit()
+    return log
+
+
+def get_user_context(user_id: int, db: Session, limit: int = 10) -> str:
+    """Recent health logs and medications, as plain text for the LLM prompt"""
+    logs = (
+        db.query(HealthLog)
+        .filter(HealthLog.user_id == user_id)
+        .order_by(HealthLog.created_at.desc(), HealthLog.id.desc())
+        .limit(limit)
+        .all()
+    )
+    medications = db.query(Medication).filter(Medication.user_id == user_id).all()
+
+    lines = []
+    for log in logs:
+        details = ", ".join(f"{key}: {value}" for key, value in (log.data or {}).items())
+        lines.append(f"- {log.log_type}: {details}")
+    for medication in medications:
+        lines.append(f"- takes {medication.name} {medication.dosage or ''} {medication.frequency or ''}".rstrip())
+
+    if not lines:
+        return ""
+    return "Recent health history:\n" + "\n".join(lines)
+
+
+def _write_health_log(user_text: str, ai_reply: str, urgency: str):
+    health_logs.add(health_log_row(None, user_text, ai_reply, urgency))
+
+
+async def _logged_sentences(sentences, user_text: str, urgency: str):
+    """Pass a streamed reply through, logging it in full once the LLM is done"""
+    reply = []
+    async for sentence in sentences:
+        reply.append(sentence)
+        yield sentence
+    _write_health_log(user_text, " ".join(reply), urgency)
+
+
+async def _follow_up_emergency(user_text: str):
+    """Runs after the emergency clip was sent: get the LLM's reply for the record and log it"""
+    try:
+        ai_reply = await llm.generate(user_text, system=HEALTH_SYSTEM_PROMPT)
+    except llm.LLMError:
+        ai_reply = get_emergency_response(user_text)
+    _write_health_log(user_text, ai_reply, "emergency")
+
+
+async def emergency_fast_path(user_text: str, background_tasks: BackgroundTasks, session_id: Optional[str] = None) -> Response:
+    """🚨 Answer an emergency with pre-rendered audio instead of waiting on LLM + TTS"""
+    audio_bytes = await tts.canned_or_synthesize(EMERGENCY_AUDIO_RESPONSE, priority=inference.PRIORITY_EMERGENCY)
+    if not audio_bytes:
+        raise HTTPException(status_code=500, detail="TTS failed")
+
+    background_tasks.add_task(_follow_up_emergency, user_text)
+    headers = {"X-Urgency-Level": "emergency"}
+    if session_id:
+        headers["X-Session-Id"] = session_id
+    return TimedResponse(
+        content=audio_bytes,
+        media_type=media_type_of(audio_bytes),
+        headers=headers
+    )
 
 
 @app.get("/health")
-def health_check():
-    return {"status": "healthy"}
+async def health_check():
+    """Readiness: models loaded and warmed up, and the inference queue has room"""
+    inference_state = {
+        "running": inference.pool.running,
+        "queued": inference.pool.queued,
+        "queue_size": inference.pool.queue_size
+    }
+    stt_model_loaded = stt.model is not None
+    inference_queue_ok = not inference.pool.saturated
+    if model_client.enabled():
+        try:
+            server = await model_client.health()
+            stt_model_loaded = server["whisper_loaded"]
+            inference_queue_ok = not server["saturated"]
+            inference_state = {k: server[k] for k in inference_state}
+        except Exception as e:
+            stt_model_loaded = inference_queue_ok = False
+            inference_state["error"] = str(e)
+
+    checks = {
+        "models_warm": getattr(app.state, "models_warm", False),
+        "stt_model_loaded": stt_model_loaded,
+        "tts_available": tts.PIPER_AVAILABLE or tts.USE_ELEVENLABS,
+        "inference_queue_ok": inference_queue_ok
+    }
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "healthy" if ready else "unavailable",
+            "checks": checks,
+            "inference": inference_state,
+            "warm_up_error": getattr(app.state, "warm_up_error", None),
+            "tts_cache": tts.cache_stats(),
+            "tts_backends": tts.backend_snapshot(),
+            "answer_cache": answers.stats(),
+            "health_logs": health_logs.stats()
+        }
+    )
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/token", response_model=Token)
+async def login(form: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_async_db)):
+    """🔐 Email + password for a bearer token; bcrypt runs off the event loop"""
+    user = await aauthenticate_user(db, form.username, form.password)
+    if not user:
+        raise HTTPException(
+            status_code=401,
+            detail="Incorrect email or password",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    access_token = create_access_token({"sub": user.email}, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+@app.post("/health-logs", status_code=202)
+async def add_health_log(entry: monitoring.HealthLogIn, user: User = Depends(get_current_user)):
+    """📝 A check-in or reading; stored within LOG_FLUSH_SECONDS"""
+    health_logs.add({
+        "user_id": user.id,
+        "log_type": entry.log_type,
+        "data": entry.data,
+        "notes": entry.notes,
+        "created_at": datetime.utcnow()
+    })
+    return {"status": "accepted", "readings": monitoring.extract_metrics(entry.data)}
+
+
+@app.get("/monitoring/trend")
+async def metric_trend(
+    metric: str,
+    days: int = 7,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """📈 Daily averages of one reading, from the rollups"""
+    return await monitoring.trend(db, user.id, metric, days)
+
+
+@app.get("/monitoring/alerts")
+async def metric_alerts(user: User = Depends(get_current_user), db: AsyncSession = Depends(database.get_async_db)):
+    """🚨 Readings outside their safe range today"""
+    return {"alerts": await monitoring.check_thresholds(db, user.id)}
 
 
 @app.post("/voice-chat")
 async def voice_chat(
+    request: Request,
+    background_tasks: BackgroundTasks,
     x_api_key: str = Header(...),
+    x_session_id: Optional[str] = Header(None),
     audio_file: UploadFile = File(...)
 ):
+    """Send X-Session-Id (returned on every reply) to continue a conversation.
+
+    Accept: audio/ogg or audio/mpeg gets Opus or MP3 instead of WAV.
+    """
     # 🔐 API key check
     if not verify_key(x_api_key):
         raise HTTPException(status_code=403, detail="Invalid API key")
 
-    # 💾 Save uploaded audio
-    audio_path = f"/tmp/{audio_file.filename}"
-    with open(audio_path, "wb") as f:
-        shutil.copyfileobj(audio_file.file, f)
-
-    # 🎤 Speech → Text
-    user_text = speech_to_text(audio_path)
+    # 🎤 Speech → Text (decoded in memory, no /tmp round trip)
+    with metrics.timed("upload_read"):
+        upload_bytes = await audio_file.read()
+    user_text = await transcribe_upload(upload_bytes, audio_file.filename, audio_file.content_type)
 
     if not user_text:
         raise HTTPException(status_code=400, detail="Could not transcribe audio")
 
-    # 🤖 Text → LLM
-    response = requests.post(
-        OLLAMA_URL,
-        json={
-            "model": "phi",
-            "prompt": f"""
-You are a helpful and responsible AI assistant.
-
-Health rules:
-- You may give general health information and precautions
-- You may give home-care and lifestyle advice
-- Do NOT diagnose diseases
-- Always advise consulting a doctor if symptoms persist or worsen
-
-User: {user_text}
-""",
-            "stream": False
-        },
-        timeout=120
-    )
+    # 🚨 Emergencies skip the LLM entirely
+    with metrics.timed("urgency"):
+        urgency = get_urgency_assessment(user_text)["level"]
+    if urgency == "emergency":
+        return await emergency_fast_path(user_text, background_tasks, x_session_id)
 
-    if response.status_code != 200:
+    conversation = await sessions.load(x_session_id, owner=x_api_key)
+    audio_format = negotiate_format(request.headers.get("accept"))
+
+    # 💾 A question asked before gets its stored answer and audio, skipping
+    # LLM and TTS; only for a conversation's first turn, since later answers
+    # depend on what was said before
+    standalone = conversation.context is None
+    if standalone:
+        cached = await answers.lookup(user_text)
+        if cached is not None:
+            _write_health_log(user_text, cached[0], urgency)
+            content, media_type = encode_wav(cached[1], audio_format)
+            return TimedResponse(
+                content=content,
+                media_type=media_type,
+                headers={"X-Session-Id": conversation.session_id, "X-Answer-Cache": "hit"}
+            )
+
+    # 🤖 Text → LLM, continuing the conversation (non-blocking; abandoned if the client hangs up)
+    try:
+        ai_reply = await run_until_disconnect(request, sessions.generate(conversation, user_text))
+    except llm.LLMTimeout:
+        raise HTTPException(status_code=504, detail="LLM timed out")
+    except llm.LLMError:
         raise HTTPException(status_code=500, detail="LLM failed")
+    _write_health_log(user_text, ai_reply, urgency)
 
-    ai_reply = response.json()["response"]
+    headers = {"X-Session-Id": conversation.session_id}
+    if tts.PIPER_AVAILABLE and not tts.USE_ELEVENLABS:
+        return await _speak_reply(user_text, ai_reply, audio_format, headers, standalone)
 
     # 🔊 Text → Speech (generate audio bytes)
     audio_bytes = await text_to_speech(ai_reply)
 
     if not audio_bytes:
         raise HTTPException(status_code=500, detail="TTS failed")
+    if standalone:
+        await answers.store(user_text, ai_reply, audio_bytes)
 
-    # 🎧 Return AUDIO, not JSON
-    return Response(
+    # 🎧 Return AUDIO, not JSON (ElevenLabs MP3, or Piper WAV if it won the race)
+    return TimedResponse(
         content=audio_bytes,
-        media_type="audio/wav"
+        media_type=media_type_of(audio_bytes),
+        headers=headers
+    )
+
+
+async def _speak_reply(user_text: str, ai_reply: str, audio_format: str, headers: dict, standalone: bool) -> Response:
+    """🔊 Piper audio for a complete reply, streamed sentence by sentence in the negotiated format"""
+    cached = await tts.cached_piper_audio(ai_reply)
+    if cached is not None:
+        if standalone:
+            await answers.store(user_text, ai_reply, cached)
+        content, media_type = encode_wav(cached, audio_format)
+        return TimedResponse(content=content, media_type=media_type, headers=headers)
+
+    async def remember(pcm, sample_rate):
+        # Once fully spoken: cache the audio for repeats of this reply (and question)
+        wav = await tts.remember_piper_audio(ai_reply, pcm, sample_rate)
+        if standalone:
+            await answers.store(user_text, ai_reply, wav)
+
+    audio_chunks = aspeak_sentences(
+        asentences(ai_reply), audio_format=audio_format, on_complete=remember, lookahead=tts.PIPER_LOOKAHEAD
+    )
+    try:
+        first_chunk = await audio_chunks.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=500, detail="TTS failed")
+
+    return TimedStreamingResponse(
+        _prepend(first_chunk, audio_chunks),
+        media_type=MEDIA_TYPES[audio_format],
+        headers=headers
+    )
+
+
+@app.post("/voice-chat/stream")
+async def voice_chat_stream(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    x_api_key: str = Header(...),
+    x_session_id: Optional[str] = Header(None),
+    audio_file: UploadFile = File(...)
+):
+    """Like /voice-chat, but speaks each sentence as soon as the LLM finishes it"""
+    # 🔐 API key check
+    if not verify_key(x_api_key):
+        raise HTTPException(status_code=403, detail="Invalid API key")
+
+    if not tts.PIPER_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Streaming TTS not available")
+
+    # 🎤 Speech → Text (decoded in memory, no /tmp round trip)
+    with metrics.timed("upload_read"):
+        upload_bytes = await audio_file.read()
+    user_text = await transcribe_upload(upload_bytes, audio_file.filename, audio_file.content_type)
+
+    if not user_text:
+        raise HTTPException(status_code=400, detail="Could not transcribe audio")
+
+    # 🚨 Emergencies skip the LLM entirely
+    with metrics.timed("urgency"):
+        urgency = get_urgency_assessment(user_text)["level"]
+    if urgency == "emergency":
+        return await emergency_fast_path(user_text, background_tasks, x_session_id)
+
+    # 🤖 LLM tokens → sentences → 🔊 Piper PCM
+    conversation = await sessions.load(x_session_id, owner=x_api_key)
+    audio_format = negotiate_format(request.headers.get("accept"))
+    sentences = aiter_sentences(sessions.stream_tokens(conversation, user_text))
+    audio_chunks = aspeak_sentences(_logged_sentences(sentences, user_text, urgency), audio_format=audio_format)
+
+    # Pull the first chunk before committing to a 200 so LLM/TTS
+    # failures still surface as a proper error status
+    try:
+        first_chunk = await audio_chunks.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=500, detail="TTS failed")
+    except llm.LLMTimeout:
+        raise HTTPException(status_code=504, detail="LLM timed out")
+    except llm.LLMError:
+        raise HTTPException(status_code=500, detail="LLM failed")
+
+    # 🎧 Chunked WAV/Opus/MP3; Starlette stops the generator (and the
+    # Ollama request under it) if the client disconnects mid-stream
+    return TimedStreamingResponse(
+        _prepend(first_chunk, audio_chunks),
+        media_type=MEDIA_TYPES[audio_format],
+        headers={"X-Session-Id": conversation.session_id}
     )
+
+
+@app.websocket("/ws/voice")
+async def voice_ws(websocket: WebSocket):
+    """Full-duplex voice: stream 16 kHz PCM in, get transcripts and reply audio back"""
+    # 🔐 Browsers can't set headers on a WebSocket, so the key may also come as ?api_key=
+    api_key = websocket.headers.get("x-api-key") or websocket.query_params.get("api_key")
+    if not api_key or not verify_key(api_key):
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    conversation = await sessions.load(websocket.query_params.get("session_id"), owner=api_key)
+    await VoiceSession(websocket, conversation, on_emergency=_follow_up_emergency, on_turn=_write_health_log).run()
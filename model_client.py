@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+import struct
+import weakref
+from typing import List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from inference import InferenceRejected, QueueFull, AdmissionTimeout, PRIORITY_NORMAL
+
+load_dotenv()
+
+# When set, Whisper/Piper run in model_server.py behind this Unix socket and
+# this process is a thin client; unset, models load in-process as before
+SOCKET_PATH = os.getenv("MODEL_SERVER_SOCKET") or None
+MODEL_SERVER_TIMEOUT = float(os.getenv("MODEL_SERVER_TIMEOUT", "60"))
+
+# ---------------- FRAMING ----------------
+# Every message is: header length, payload length (network order), a JSON
+# header, then raw bytes (float32 samples, PCM or WAV)
+_LENGTHS = struct.Struct("!II")
+
+
+class ModelServerError(Exception):
+    """The model server failed the request"""
+
+
+def enabled() -> bool:
+    return SOCKET_PATH is not None
+
+
+def encode_message(header: dict, payload: bytes = b"") -> bytes:
+    encoded = json.dumps(header).encode()
+    return _LENGTHS.pack(len(encoded), len(payload)) + encoded + payload
+
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[dict, bytes]:
+    header_length, payload_length = _LENGTHS.unpack(await reader.readexactly(_LENGTHS.size))
+    header = json.loads(await reader.readexactly(header_length))
+    payload = await reader.readexactly(payload_length) if payload_length else b""
+    return header, payload
+
+
+# ---------------- CONNECTION POOL ----------------
+# Idle connections per event loop; each carries one request at a time
+_idle: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, list]" = weakref.WeakKeyDictionary()
+
+
+async def _request(header: dict, payload: bytes = b"", timeout: float = MODEL_SERVER_TIMEOUT) -> Tuple[dict, bytes]:
+    idle = _idle.setdefault(asyncio.get_running_loop(), [])
+    while True:
+        pooled = bool(idle)
+        try:
+            reader, writer = idle.pop() if pooled else await asyncio.open_unix_connection(SOCKET_PATH)
+        except OSError as e:
+            raise InferenceRejected(f"Model server unavailable: {e}")
+
+        try:
+            writer.write(encode_message(header, payload))
+            await writer.drain()
+            reply, data = await asyncio.wait_for(read_message(reader), timeout)
+        except BaseException as e:
+            # A half-read reply would poison the connection for the next caller
+            writer.close()
+            if isinstance(e, asyncio.TimeoutError):
+                raise ModelServerError(f"Model server did not answer within {timeout:g}s")
+            if isinstance(e, (OSError, asyncio.IncompleteReadError)):
+                if pooled:
+                    continue  # went stale while idle (e.g. the server restarted); retry on a new one
+                raise InferenceRejected(f"Model server connection lost: {e}")
+            raise
+        idle.append((reader, writer))
+        break
+
+    if not reply.get("ok"):
+        status = reply.get("status")
+        if status == QueueFull.status_code:
+            raise QueueFull(reply["error"], reply.get("retry_after", 1))
+        if status == AdmissionTimeout.status_code:
+            raise AdmissionTimeout(reply["error"], reply.get("retry_after", 1))
+        raise ModelServerError(reply.get("error", "model server error"))
+    return reply, data
+
+
+async def aclose():
+    """Close idle connections for the running loop (call on app shutdown)"""
+    for _, writer in _idle.pop(asyncio.get_running_loop(), []):
+        writer.close()
+
+
+# ---------------- OPERATIONS ----------------
+async def transcribe(audio: np.ndarray, priority: int = PRIORITY_NORMAL) -> str:
+    """Transcribe 16 kHz mono float32 audio"""
+    reply, _ = await _request(
+        {"op": "transcribe", "priority": priority},
+        np.ascontiguousarray(audio, dtype=np.float32).tobytes()
+    )
+    return reply["text"]
+
+
+async def transcribe_file(
+    data: bytes,
+    filename: Optional[str] = None,
+    content_type: Optional[str] = None,
+    priority: int = PRIORITY_NORMAL
+) -> str:
+    """Transcribe an upload this process couldn't decode (mp3, ogg...)"""
+    reply, _ = await _request(
+        {"op": "transcribe_file", "filename": filename, "content_type": content_type, "priority": priority},
+        data
+    )
+    return reply["text"]
+
+
+async def synthesize(text: str, priority: int = PRIORITY_NORMAL) -> Optional[bytes]:
+    """Piper WAV bytes for text, or None if synthesis failed"""
+    _, data = await _request({"op": "synthesize", "text": text, "priority": priority})
+    return data or None
+
+
+async def synthesize_pcm(text: str, priority: int = PRIORITY_NORMAL) -> List[Tuple[bytes, int]]:
+    """Piper 16-bit PCM for one sentence, as [(pcm, sample_rate)]"""
+    reply, data = await _request({"op": "synthesize_pcm", "text": text, "priority": priority})
+    return [(data, reply["sample_rate"])] if data else []
+
+
+async def health(timeout: float = 2) -> dict:
+    reply, _ = await _request({"op": "health"}, timeout=timeout)
+    return reply
+
+
+async def wait_until_ready(poll_seconds: float = 0.5):
+    """Block until the model server has loaded and warmed its models"""
+    while True:
+        try:
+            state = await health()
+            if state.get("warm"):
+                return state
+            if state.get("warm_up_error"):
+                raise ModelServerError(f"Model server warm-up failed: {state['warm_up_error']}")
+        except InferenceRejected:
+            pass  # not listening yet
+        await asyncio.sleep(poll_seconds)
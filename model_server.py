@@ -0,0 +1,158 @@
+"""Inference sidecar: one process owns Whisper and Piper for every API worker.
+
+    python model_server.py --socket /tmp/voice-models.sock
+    MODEL_SERVER_SOCKET=/tmp/voice-models.sock uvicorn main:app --workers 4
+
+With `uvicorn --workers N` each worker would otherwise load its own Whisper
+model and PiperVoice, and N CTranslate2/onnxruntime thread pools would fight
+over the same cores. Here the models are loaded once, all STT/TTS runs on
+this process's single inference pool (so admission control, priorities and
+Whisper micro-batching span every worker), and the workers talk to it over
+a Unix domain socket using model_client's framing.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+DEFAULT_SOCKET = os.getenv("MODEL_SERVER_SOCKET") or "/tmp/voice-models.sock"
+# This process runs the models itself: blank the variable before stt/tts read
+# it so they load Whisper/Piper here instead of routing back to this socket
+os.environ["MODEL_SERVER_SOCKET"] = ""
+
+import inference
+import stt
+import tts
+from model_client import encode_message, read_message
+
+state = {"warm": False, "warm_up_error": None, "requests": 0}
+
+
+# ---------------- OPERATIONS ----------------
+async def _transcribe(header: dict, payload: bytes):
+    audio = np.frombuffer(payload, dtype=np.float32)
+    return {"text": await stt.transcribe_array(audio, header.get("priority", inference.PRIORITY_NORMAL))}, b""
+
+
+async def _transcribe_file(header: dict, payload: bytes):
+    text = await inference.pool.run(
+        stt.speech_to_text_from_bytes, payload, header.get("filename"), header.get("content_type"),
+        priority=header.get("priority", inference.PRIORITY_NORMAL)
+    )
+    return {"text": text}, b""
+
+
+async def _synthesize(header: dict, payload: bytes):
+    audio = await inference.pool.run(
+        tts.text_to_speech_piper, header["text"], priority=header.get("priority", inference.PRIORITY_NORMAL)
+    )
+    return {}, audio or b""
+
+
+async def _synthesize_pcm(header: dict, payload: bytes):
+    chunks = await tts.piper_pcm(header["text"], priority=header.get("priority", inference.PRIORITY_NORMAL))
+    if not chunks:
+        return {"sample_rate": tts.PIPER_SAMPLE_RATE}, b""
+    return {"sample_rate": chunks[0][1]}, b"".join(pcm for pcm, _ in chunks)
+
+
+async def _health(header: dict, payload: bytes):
+    return {
+        **state,
+        "whisper_loaded": stt.model is not None,
+        "piper_loaded": tts.piper_voice is not None,
+        "running": inference.pool.running,
+        "queued": inference.pool.queued,
+        "queue_size": inference.pool.queue_size,
+        "saturated": inference.pool.saturated
+    }, b""
+
+
+OPERATIONS = {
+    "transcribe": _transcribe,
+    "transcribe_file": _transcribe_file,
+    "synthesize": _synthesize,
+    "synthesize_pcm": _synthesize_pcm,
+    "health": _health
+}
+
+
+# ---------------- SERVER ----------------
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Serve requests from one API worker connection, one at a time"""
+    try:
+        while True:
+            try:
+                header, payload = await read_message(reader)
+            except asyncio.IncompleteReadError:
+                return  # worker closed the connection
+
+            operation = OPERATIONS.get(header.get("op"))
+            try:
+                if operation is None:
+                    raise ValueError(f"Unknown operation {header.get('op')!r}")
+                reply, data = await operation(header, payload)
+                reply["ok"] = True
+            except inference.InferenceRejected as e:
+                reply, data = {"ok": False, "status": e.status_code, "error": e.detail, "retry_after": e.retry_after}, b""
+            except Exception as e:
+                reply, data = {"ok": False, "status": 500, "error": str(e)}, b""
+
+            state["requests"] += 1
+            writer.write(encode_message(reply, data))
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def warm_up():
+    """Load Whisper and Piper in parallel and run a dummy inference on each"""
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(asyncio.to_thread(stt.warm_up), asyncio.to_thread(tts.warm_up))
+    except Exception as e:
+        state["warm_up_error"] = str(e)
+        print(f"❌ Model server warm-up failed: {e}")
+        return
+    state["warm"] = True
+    print(f"✅ Models warm in {time.perf_counter() - start:.1f}s")
+
+
+async def serve(path: str):
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle_connection, path=path)
+    os.chmod(path, 0o660)
+    print(f"🧠 Model server listening on {path}")
+
+    warming = asyncio.create_task(warm_up())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        warming.cancel()
+        inference.pool.shutdown()
+        if tts.piper_processes is not None:
+            tts.piper_processes.shutdown()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.socket))
+    except KeyboardInterrupt:
+        print("\n🛑 Stopped")
+
+
+if __name__ == "__main__":
+    main()
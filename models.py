@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, JSON, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -21,6 +21,7 @@ class User(Base):
     appointments = relationship("Appointment", back_populates="user")
     medications = relationship("Medication", back_populates="user")
     health_logs = relationship("HealthLog", back_populates="user")
+    clinical_notes = relationship("ClinicalNote", back_populates="user")
 
 class Appointment(Base):
     __tablename__ = "appointments"
@@ -38,6 +39,15 @@ class Appointment(Base):
     # Relationships
     user = relationship("User", back_populates="appointments")
 
+    __table_args__ = (
+        # Appointments still to be reminded, in (time, id) order for the reminder
+        # sweep; partial, so reminded ones (nearly all of them) aren't in it
+        Index(
+            "ix_appointments_reminder_due", "reminder_sent", "status", "appointment_datetime", "id",
+            sqlite_where=text("reminder_sent = 0"), postgresql_where=text("reminder_sent = false")
+        ),
+    )
+
 class Medication(Base):
     __tablename__ = "medications"
 
@@ -49,6 +59,9 @@ class Medication(Base):
     start_date = Column(DateTime)
     end_date = Column(DateTime, nullable=True)
     reminder_time = Column(String)  # e.g., "08:00,14:00,20:00"
+    reminder_timezone = Column(String, default="UTC")  # IANA name the reminder times are in
+    # Next reminder in UTC, kept current from the columns above (see reminders.py); None if there is none
+    next_fire_at = Column(DateTime(timezone=True), nullable=True, index=True)
     refill_alert = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -69,6 +82,38 @@ class HealthLog(Base):
     # Relationships
     user = relationship("User", back_populates="health_logs")
 
+    __table_args__ = (
+        # A user's logs of one type in time order, without a scan
+        Index("ix_health_logs_user_type_created", "user_id", "log_type", "created_at"),
+    )
+
+class HealthMetric(Base):
+    """One numeric reading pulled out of a HealthLog's data when it is written"""
+    __tablename__ = "health_metrics"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    metric = Column(String, nullable=False)  # heart_rate, blood_pressure_systolic, etc.
+    value = Column(Float, nullable=False)
+    recorded_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_health_metrics_user_metric_recorded", "user_id", "metric", "recorded_at"),
+    )
+
+class HealthMetricRollup(Base):
+    """min/max/sum/count of a user's metric per hour or day, updated as readings arrive"""
+    __tablename__ = "health_metric_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    metric = Column(String, primary_key=True)
+    period = Column(String, primary_key=True)  # hour, day
+    bucket_start = Column(DateTime, primary_key=True)
+    count = Column(Integer, nullable=False)
+    total = Column(Float, nullable=False)
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+
 class ClinicalNote(Base):
     __tablename__ = "clinical_notes"
 
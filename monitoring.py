@@ -0,0 +1,191 @@
+"""Remote monitoring storage: typed readings and hourly/daily rollups of HealthLog data.
+
+Every HealthLog write also stores the numeric values in its data as
+HealthMetric rows, and folds them into HealthMetricRollup (count, sum, min
+and max per user, metric and hour/day) with one upsert per bucket, in the
+same transaction. Trends and threshold alerts read those buckets, so a
+week's trend is at most seven rows however many years of logs there are.
+
+Logs written through the ORM are picked up by a flush listener; the
+write-behind BatchWriter takes derived_statements() as its hook.
+"""
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import HealthLog, HealthMetric, HealthMetricRollup
+
+PERIODS = ("hour", "day")
+
+# (low, high) limits per metric; None means no limit on that side
+ALERT_THRESHOLDS = {
+    "heart_rate": (50, 120),
+    "blood_pressure_systolic": (90, 180),
+    "blood_pressure_diastolic": (None, 120),
+    "blood_sugar": (70, 250),
+    "oxygen_saturation": (92, None)
+}
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+_BLOOD_PRESSURE = re.compile(r"(\d{2,3})\s*/\s*(\d{2,3})(?:\s*mmhg)?", re.IGNORECASE)
+
+
+class HealthLogIn(BaseModel):
+    log_type: str
+    data: dict
+    notes: Optional[str] = None
+
+
+# ---------------- EXTRACTION ----------------
+def extract_metrics(data) -> Dict[str, float]:
+    """Numeric readings in a log's data: numbers, numeric strings and "140/90" blood pressures"""
+    if not isinstance(data, dict):
+        return {}
+    readings = {}
+    for key, value in data.items():
+        if isinstance(value, bool):
+            continue
+        if isinstance(value, (int, float)):
+            readings[key] = float(value)
+        elif isinstance(value, str):
+            value = value.strip()
+            if _NUMBER.fullmatch(value):
+                readings[key] = float(value)
+            elif pressure := _BLOOD_PRESSURE.fullmatch(value):
+                readings[f"{key}_systolic"] = float(pressure[1])
+                readings[f"{key}_diastolic"] = float(pressure[2])
+    return readings
+
+
+def bucket_start(moment: datetime, period: str) -> datetime:
+    if period == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def metric_rows(logs: Iterable[dict]) -> List[dict]:
+    """HealthMetric rows for HealthLog column values; logs without a user are skipped"""
+    rows = []
+    for log in logs:
+        if log.get("user_id") is None:
+            continue
+        recorded_at = log.get("created_at") or datetime.utcnow()
+        for metric, value in extract_metrics(log.get("data")).items():
+            rows.append({"user_id": log["user_id"], "metric": metric, "value": value, "recorded_at": recorded_at})
+    return rows
+
+
+def rollup_rows(readings: List[dict]) -> List[dict]:
+    """readings folded into one row per (user, metric, period, bucket)"""
+    buckets = {}
+    for reading in readings:
+        for period in PERIODS:
+            key = (reading["user_id"], reading["metric"], period, bucket_start(reading["recorded_at"], period))
+            value = reading["value"]
+            rollup = buckets.get(key)
+            if rollup is None:
+                buckets[key] = {
+                    "user_id": key[0], "metric": key[1], "period": period, "bucket_start": key[3],
+                    "count": 1, "total": value, "min": value, "max": value
+                }
+            else:
+                rollup["count"] += 1
+                rollup["total"] += value
+                rollup["min"] = min(rollup["min"], value)
+                rollup["max"] = max(rollup["max"], value)
+    return list(buckets.values())
+
+
+def _upsert_rollups(dialect: str):
+    # Rows must have unique keys: Postgres won't update one row twice in a statement
+    sqlite = dialect == "sqlite"
+    statement = (sqlite_insert if sqlite else postgresql_insert)(HealthMetricRollup)
+    excluded = statement.excluded
+    smaller, larger = (func.min, func.max) if sqlite else (func.least, func.greatest)
+    return statement.on_conflict_do_update(
+        index_elements=["user_id", "metric", "period", "bucket_start"],
+        set_={
+            "count": HealthMetricRollup.count + excluded["count"],
+            "total": HealthMetricRollup.total + excluded["total"],
+            "min": smaller(HealthMetricRollup.min, excluded["min"]),
+            "max": larger(HealthMetricRollup.max, excluded["max"])
+        }
+    )
+
+
+def derived_statements(logs: List[dict], dialect: str) -> list:
+    """(statement, params) executemany pairs that store the readings in logs and update their rollups"""
+    readings = metric_rows(logs)
+    if not readings:
+        return []
+    return [(insert(HealthMetric), readings), (_upsert_rollups(dialect), rollup_rows(readings))]
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flushed_logs(session, flush_context):
+    logs = [
+        {"user_id": obj.user_id, "data": obj.data, "created_at": obj.created_at}
+        for obj in session.new if isinstance(obj, HealthLog)
+    ]
+    if not logs:
+        return
+    connection = session.connection()
+    for statement, params in derived_statements(logs, connection.dialect.name):
+        connection.execute(statement, params)
+
+
+# ---------------- QUERIES ----------------
+async def rollups(
+    db: AsyncSession, user_id: int, metric: str, period: str = "day", since: Optional[datetime] = None
+) -> List[HealthMetricRollup]:
+    query = select(HealthMetricRollup).where(
+        HealthMetricRollup.user_id == user_id,
+        HealthMetricRollup.metric == metric,
+        HealthMetricRollup.period == period
+    )
+    if since is not None:
+        query = query.where(HealthMetricRollup.bucket_start >= since)
+    return list((await db.execute(query.order_by(HealthMetricRollup.bucket_start))).scalars())
+
+
+async def trend(db: AsyncSession, user_id: int, metric: str, days: int = 7, now: Optional[datetime] = None) -> dict:
+    """Daily averages of metric over the last days, and how much the average moved"""
+    since = bucket_start(now or datetime.utcnow(), "day") - timedelta(days=days - 1)
+    points = [
+        {
+            "date": rollup.bucket_start.date().isoformat(),
+            "avg": round(rollup.total / rollup.count, 2),
+            "min": rollup.min,
+            "max": rollup.max,
+            "count": rollup.count
+        }
+        for rollup in await rollups(db, user_id, metric, "day", since)
+    ]
+    change = round(points[-1]["avg"] - points[0]["avg"], 2) if len(points) > 1 else None
+    return {"metric": metric, "days": points, "change": change}
+
+
+async def check_thresholds(db: AsyncSession, user_id: int, now: Optional[datetime] = None) -> List[dict]:
+    """Metrics whose reading today went outside ALERT_THRESHOLDS, from today's daily buckets"""
+    today = bucket_start(now or datetime.utcnow(), "day")
+    query = select(HealthMetricRollup).where(
+        HealthMetricRollup.user_id == user_id,
+        HealthMetricRollup.period == "day",
+        HealthMetricRollup.bucket_start == today,
+        HealthMetricRollup.metric.in_(ALERT_THRESHOLDS)
+    )
+    alerts = []
+    for rollup in (await db.execute(query)).scalars():
+        low, high = ALERT_THRESHOLDS[rollup.metric]
+        if low is not None and rollup.min < low:
+            alerts.append({"metric": rollup.metric, "value": rollup.min, "limit": low, "direction": "low"})
+        if high is not None and rollup.max > high:
+            alerts.append({"metric": rollup.metric, "value": rollup.max, "limit": high, "direction": "high"})
+    return sorted(alerts, key=lambda alert: alert["metric"])
@@ -0,0 +1,103 @@
+"""Piper in worker processes, so the sentences of a long reply render in parallel.
+
+One PiperVoice renders a reply serially on one core. With PIPER_PROCESSES > 0
+each worker process loads its own voice once, sentences are synthesized
+across them, and the PCM is stitched back together in order with a short
+crossfade at every join. Kept free of the API's modules so spawned workers
+import nothing but Piper.
+"""
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from audio import crossfade_join
+
+load_dotenv()
+
+# ---------------- CONFIG ----------------
+# 0 keeps Piper in process (one voice, used from the inference threads)
+PIPER_PROCESSES = int(os.getenv("PIPER_PROCESSES", "0"))
+# Overlap between consecutive sentences; hides the click of a hard cut
+PIPER_CROSSFADE_MS = float(os.getenv("PIPER_CROSSFADE_MS", "15"))
+
+# ---------------- WORKER PROCESS ----------------
+_voice = None  # this worker's PiperVoice
+
+
+def load_piper_voice(model: str):
+    from piper import PiperVoice
+    return PiperVoice.load(model)
+
+
+def _init_worker(load_voice: Callable[[], object]):
+    global _voice
+    _voice = load_voice()
+
+
+def _synthesize(text: str) -> Tuple[bytes, Optional[int]]:
+    """(16-bit PCM, sample rate) for one sentence, in a worker process"""
+    pcm = []
+    sample_rate = None
+    for chunk in _voice.synthesize(text):
+        pcm.append(chunk.audio_int16_bytes)
+        sample_rate = chunk.sample_rate
+    return b"".join(pcm), sample_rate
+
+
+# ---------------- POOL ----------------
+class PiperProcessPool:
+    """A process pool whose workers each hold a loaded voice.
+
+    Processes are spawned (not forked: the API process has onnxruntime and
+    event loop threads) on first use; warm_up() starts them ahead of time.
+    """
+
+    def __init__(self, processes: int, load_voice: Callable[[], object], crossfade_ms: float = PIPER_CROSSFADE_MS):
+        self.processes = max(1, processes)
+        self.load_voice = load_voice
+        self.crossfade_ms = crossfade_ms
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.load_voice,)
+                )
+            return self._executor
+
+    def synthesize(self, sentences: List[str]) -> Optional[Tuple[bytes, int]]:
+        """(PCM, sample rate) for sentences, rendered in parallel and joined in order"""
+        results = [(pcm, rate) for pcm, rate in self.executor.map(_synthesize, sentences) if rate is not None]
+        if not results:
+            return None
+        sample_rate = results[0][1]
+        return crossfade_join([pcm for pcm, _ in results], sample_rate, self.crossfade_ms), sample_rate
+
+    def warm_up(self):
+        """Start every worker and load its voice, so the first reply isn't slow"""
+        self.synthesize(["Hello."] * self.processes)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+def enabled() -> bool:
+    return PIPER_PROCESSES > 0
+
+
+def create_pool(model: str) -> PiperProcessPool:
+    return PiperProcessPool(PIPER_PROCESSES, functools.partial(load_piper_voice, model))
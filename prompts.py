@@ -1,4 +1,5 @@
 # Healthcare Voice AI - Safety Guardrails and Prompts
+from urgency import UrgencyMatcher, UrgencyStream
 
 HEALTHCARE_DISCLAIMER = """
 ⚠️ MEDICAL DISCLAIMER: I am an AI assistant, not a doctor. I cannot diagnose, prescribe medication, or provide medical treatment. All information is for educational purposes only. Please consult a qualified healthcare professional for medical advice, diagnosis, or treatment.
@@ -8,6 +9,16 @@ EMERGENCY_WARNING = """
 🚨 EMERGENCY: If you are experiencing a medical emergency (chest pain, difficulty breathing, severe bleeding, etc.), call emergency services immediately (911 in US, 112 in Europe, 108 in India) or go to the nearest emergency room. Do not wait for a response.
 """
 
+MEDIUM_URGENCY_RESPONSE = "These symptoms should be evaluated by a healthcare provider within 24-48 hours. Please consult your doctor."
+
+LOW_URGENCY_RESPONSE = "These symptoms may be minor, but monitor them closely. If they persist or worsen, consult a healthcare provider."
+
+FALLBACK_REPLY = "Sorry, I didn't understand that."
+
+# Spoken as-is when a transcript is flagged as an emergency, without waiting for the LLM
+EMERGENCY_AUDIO_RESPONSE = f"""{EMERGENCY_WARNING}
+What you describe may require immediate medical attention. Please seek emergency care right away or contact emergency services."""
+
 # Emergency Detection Keywords
 EMERGENCY_KEYWORDS = [
     "chest pain", "heart attack", "shortness of breath", "can't breathe",
@@ -15,6 +26,12 @@ EMERGENCY_KEYWORDS = [
     "confusion", "dizziness", "fainting", "allergic reaction", "anaphylaxis"
 ]
 
+# Medium urgency indicators
+MEDIUM_URGENCY_INDICATORS = ["persistent", "severe", "worsening", "high fever", "vomiting"]
+
+# One compiled, word-bounded, negation-aware matcher for both lists
+URGENCY_MATCHER = UrgencyMatcher(EMERGENCY_KEYWORDS, MEDIUM_URGENCY_INDICATORS)
+
 # Main LLM Prompt Template
 MAIN_HEALTHCARE_PROMPT = f"""
 {HEALTHCARE_DISCLAIMER}
@@ -44,35 +61,55 @@ Context: {{context}}
 Respond empathetically, clearly, and safely.
 """
 
+# Sent as Ollama's system prompt on a conversation's first turn only; later
+# turns reuse the returned context, so it must not vary per request
+HEALTH_SYSTEM_PROMPT = """You are a helpful and responsible AI assistant.
+
+Health rules:
+- You may give general health information and precautions
+- You may give home-care and lifestyle advice
+- Do NOT diagnose diseases
+- Always advise consulting a doctor if symptoms persist or worsen"""
+
 def get_emergency_response(symptoms: str) -> str:
     """Generate emergency response"""
     return f"{EMERGENCY_WARNING}\n\nBased on your description of '{symptoms}', this sounds like it may require immediate medical attention. Please seek emergency care right away or contact emergency services."
 
 def get_urgency_assessment(symptoms: str) -> dict:
     """Assess symptom urgency"""
-    symptoms_lower = symptoms.lower()
-
-    # Check for emergency keywords
-    for keyword in EMERGENCY_KEYWORDS:
-        if keyword in symptoms_lower:
-            return {
-                "level": "emergency",
-                "response": get_emergency_response(symptoms),
-                "action": "escalate_immediately"
-            }
-
-    # Medium urgency indicators
-    medium_indicators = ["persistent", "severe", "worsening", "high fever", "vomiting"]
-    if any(indicator in symptoms_lower for indicator in medium_indicators):
+    level = URGENCY_MATCHER.level(symptoms)
+
+    if level == "emergency":
+        return {
+            "level": "emergency",
+            "response": get_emergency_response(symptoms),
+            "action": "escalate_immediately"
+        }
+
+    if level == "medium":
         return {
             "level": "medium",
-            "response": "These symptoms should be evaluated by a healthcare provider within 24-48 hours. Please consult your doctor.",
+            "response": MEDIUM_URGENCY_RESPONSE,
             "action": "schedule_appointment"
         }
 
     # Default to low urgency
     return {
         "level": "low",
-        "response": "These symptoms may be minor, but monitor them closely. If they persist or worsen, consult a healthcare provider.",
+        "response": LOW_URGENCY_RESPONSE,
         "action": "monitor_symptoms"
     }
+
+def urgency_stream() -> UrgencyStream:
+    """Incremental urgency detector to feed partial transcripts into"""
+    return UrgencyStream(URGENCY_MATCHER)
+
+# Fixed replies that are spoken word for word; pre-synthesized at startup
+CANNED_RESPONSES = [
+    HEALTHCARE_DISCLAIMER,
+    EMERGENCY_WARNING,
+    EMERGENCY_AUDIO_RESPONSE,
+    MEDIUM_URGENCY_RESPONSE,
+    LOW_URGENCY_RESPONSE,
+    FALLBACK_REPLY
+]
@@ -0,0 +1,295 @@
+"""Medication reminder scheduling: parsed reminder times, next fire times and a min-heap of them.
+
+Medication.reminder_time ("08:00,14:00,20:00", wall-clock times in the
+medication's reminder_timezone) is normalized into next_fire_at, an indexed
+UTC timestamp that ORM listeners keep current whenever a medication changes.
+The reminder worker (tasks.py) loads those into a ReminderScheduler: a
+min-heap keyed on fire time, so popping a due reminder and pushing its next
+fire are both O(log n) however many schedules there are. Changes are
+applied one medication at a time (reschedule/remove); replaced heap entries
+are skipped when they surface instead of being searched for.
+"""
+import asyncio
+import heapq
+import os
+import re
+import time as _time
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from cache import REDIS_RETRY_SECONDS
+from database import get_redis
+from models import Medication
+
+load_dotenv()
+
+# ---------------- CONFIG ----------------
+# Reminders popped (and sent) per batch
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "500"))
+# A reminder more than this late (worker was down) is skipped, not sent
+REMINDER_MAX_LATE_SECONDS = int(os.getenv("REMINDER_MAX_LATE_SECONDS", "3600"))
+# Redis channel the API announces changed medication ids on
+REMINDER_CHANNEL = "reminders:changed"
+
+# Columns that decide when a medication's reminders fire
+SCHEDULE_COLUMNS = ("reminder_time", "reminder_timezone", "start_date", "end_date")
+
+# Every timezone is within this of UTC (UTC-12 to UTC+14)
+MAX_UTC_OFFSET = timedelta(hours=14)
+
+_TIME = re.compile(r"(\d{1,2}):(\d{2})")
+
+
+class Schedule(NamedTuple):
+    times: Tuple[time, ...]  # sorted local wall-clock times
+    timezone: str
+    start: Optional[datetime]  # local, naive; None means no limit
+    end: Optional[datetime]
+
+
+class Reminder(NamedTuple):
+    medication_id: int
+    fire_at: datetime  # UTC
+    next_fire_at: Optional[datetime]  # None once the course has ended
+
+
+# ---------------- PARSING ----------------
+@lru_cache(maxsize=4096)
+def parse_reminder_times(text: Optional[str]) -> Tuple[time, ...]:
+    """"08:00, 14:00,20:00" as sorted unique times; ValueError for anything that isn't HH:MM"""
+    times = set()
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        match = _TIME.fullmatch(part)
+        if match is None or int(match[1]) > 23 or int(match[2]) > 59:
+            raise ValueError(f"reminder time must be HH:MM, got {part!r}")
+        times.add(time(int(match[1]), int(match[2])))
+    return tuple(sorted(times))
+
+
+def schedule_of(medication) -> Schedule:
+    """The Schedule of a Medication (or any row with its schedule columns)"""
+    return Schedule(
+        parse_reminder_times(medication.reminder_time),
+        medication.reminder_timezone or "UTC",
+        medication.start_date,
+        medication.end_date
+    )
+
+
+def as_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands timestamps back naive; they were stored as UTC
+    if moment is None or moment.tzinfo is not None:
+        return moment
+    return moment.replace(tzinfo=timezone.utc)
+
+
+@lru_cache(maxsize=None)
+def _zone(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
+
+def next_fire(schedule: Schedule, after: datetime) -> Optional[datetime]:
+    """First reminder strictly after `after` (aware), in UTC; None if there is none"""
+    if not schedule.times:
+        return None
+    zone = _zone(schedule.timezone)
+    day: date = after.astimezone(zone).date()
+    if schedule.start is not None:
+        day = max(day, schedule.start.date())
+    # Every day has every time, so today or tomorrow has the answer
+    for _ in range(2):
+        for moment in schedule.times:
+            local = datetime.combine(day, moment)
+            if schedule.start is not None and local < schedule.start:
+                continue
+            if schedule.end is not None and local > schedule.end:
+                return None
+            fire_at = local.replace(tzinfo=zone).astimezone(timezone.utc)
+            if fire_at > after:
+                return fire_at
+        day += timedelta(days=1)
+    return None
+
+
+# ---------------- SCHEDULER ----------------
+class ReminderScheduler:
+    """Upcoming reminders of many medications, earliest first"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int]] = []  # (fire timestamp, medication id)
+        self._fire_at: Dict[int, float] = {}  # the live entry of each medication
+        self._schedules: Dict[int, Schedule] = {}
+
+    def __len__(self) -> int:
+        return len(self._fire_at)
+
+    def load(self, rows: Iterable[Tuple[int, Schedule, Optional[datetime]]], now: datetime):
+        """Replace everything with (medication id, schedule, stored next fire) rows in O(n)"""
+        self._heap, self._fire_at, self._schedules = [], {}, {}
+        for medication_id, schedule, fire_at in rows:
+            fire_at = as_utc(fire_at) or next_fire(schedule, now)
+            if fire_at is None:
+                continue
+            self._schedules[medication_id] = schedule
+            self._fire_at[medication_id] = fire_at.timestamp()
+            self._heap.append((fire_at.timestamp(), medication_id))
+        heapq.heapify(self._heap)
+
+    def reschedule(self, medication_id: int, schedule: Schedule, now: datetime) -> Optional[datetime]:
+        """Apply a changed (or new) medication; returns its next fire"""
+        fire_at = next_fire(schedule, now)
+        if fire_at is None:
+            self.remove(medication_id)
+            return None
+        self._schedules[medication_id] = schedule
+        self._push(medication_id, fire_at.timestamp())
+        return fire_at
+
+    def remove(self, medication_id: int):
+        # Its heap entry stays behind and is dropped when it surfaces
+        self._fire_at.pop(medication_id, None)
+        self._schedules.pop(medication_id, None)
+
+    def _push(self, medication_id: int, timestamp: float):
+        self._fire_at[medication_id] = timestamp
+        heapq.heappush(self._heap, (timestamp, medication_id))
+        # Rebuild once replaced entries outnumber live ones
+        if len(self._heap) > 2 * len(self._fire_at) + 1024:
+            self._heap = [(t, m) for m, t in self._fire_at.items()]
+            heapq.heapify(self._heap)
+
+    def _drop_stale(self):
+        heap = self._heap
+        while heap and self._fire_at.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def next_fire_at(self) -> Optional[datetime]:
+        self._drop_stale()
+        if not self._heap:
+            return None
+        return datetime.fromtimestamp(self._heap[0][0], timezone.utc)
+
+    def pop_due(
+        self, now: datetime, limit: int = REMINDER_BATCH_SIZE, max_late: float = REMINDER_MAX_LATE_SECONDS
+    ) -> Tuple[List[Reminder], List[Reminder]]:
+        """Up to `limit` reminders due by now, each rescheduled to its next fire.
+
+        Returns (due, missed): missed ones were more than max_late seconds
+        overdue and should be recorded but not sent.
+        """
+        due, missed = [], []
+        cutoff = now.timestamp()
+        while len(due) + len(missed) < limit:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > cutoff:
+                break
+            timestamp, medication_id = heapq.heappop(self._heap)
+            following = next_fire(self._schedules[medication_id], now)
+            if following is None:
+                self.remove(medication_id)
+            else:
+                self._push(medication_id, following.timestamp())
+            reminder = Reminder(medication_id, datetime.fromtimestamp(timestamp, timezone.utc), following)
+            (missed if cutoff - timestamp > max_late else due).append(reminder)
+        return due, missed
+
+
+# ---------------- CLOCKS ----------------
+class SystemClock:
+    def now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+
+class SimulatedClock:
+    """A clock for tests and benchmarks: sleep() moves time forward instead of waiting"""
+
+    def __init__(self, start: datetime):
+        self.current = start
+
+    def now(self) -> datetime:
+        return self.current
+
+    def advance(self, seconds: float):
+        self.current += timedelta(seconds=seconds)
+
+    async def sleep(self, seconds: float):
+        self.advance(seconds)
+        await asyncio.sleep(0)
+
+
+# ---------------- CHANGE TRACKING ----------------
+# What next_fire_at is computed from on writes; tests swap in a SimulatedClock
+clock = SystemClock()
+
+
+@event.listens_for(Medication, "before_insert")
+@event.listens_for(Medication, "before_update")
+def _normalize_schedule(mapper, connection, target):
+    state = inspect(target)
+    if state.pending or any(state.attrs[column].history.has_changes() for column in SCHEDULE_COLUMNS):
+        target.next_fire_at = next_fire(schedule_of(target), clock.now())
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    changed = [
+        obj.id for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, Medication) and obj.id is not None
+    ]
+    if changed:
+        session.info.setdefault("changed_medications", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _announce_changes(session):
+    changed = session.info.pop("changed_medications", None)
+    if changed:
+        publish_changes_soon(changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changes(session):
+    session.info.pop("changed_medications", None)
+
+
+_redis_down_until = 0.0
+# Announcements running on a thread; the loop only keeps weak references
+_announcing: Set[asyncio.Future] = set()
+
+
+def publish_changes_soon(medication_ids: Iterable[int]):
+    """publish_changes() for ORM events, which may fire on the event loop
+    under an AsyncSession: there the Redis publish runs on a thread"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        publish_changes(medication_ids)
+        return
+    future = loop.run_in_executor(None, publish_changes, list(medication_ids))
+    _announcing.add(future)
+    future.add_done_callback(_announcing.discard)
+
+
+def publish_changes(medication_ids: Iterable[int]):
+    """Tell reminder workers to reload these medications (best effort; they also resync)"""
+    global _redis_down_until
+    client = get_redis()
+    if client is None or _time.monotonic() < _redis_down_until:
+        return
+    try:
+        client.publish(REMINDER_CHANNEL, ",".join(str(i) for i in medication_ids))
+    except Exception as e:
+        print(f"⚠️ Reminder change not announced ({e}); workers pick it up on their next resync")
+        _redis_down_until = _time.monotonic() + REDIS_RETRY_SECONDS
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import AsyncIterator, Optional
+
+from dotenv import load_dotenv
+
+import llm
+from cache import content_key
+from database import get_redis
+from prompts import HEALTH_SYSTEM_PROMPT
+
+load_dotenv()
+
+# ---------------- CONFIG ----------------
+# Idle conversations are forgotten after this long
+SESSION_TTL = int(os.getenv("SESSION_TTL", "1800"))
+# Past this many context tokens the conversation restarts from the system
+# prompt, before it overflows the model's context window
+SESSION_MAX_CONTEXT_TOKENS = int(os.getenv("SESSION_MAX_CONTEXT_TOKENS", "3072"))
+# Conversations kept in process when Redis is unavailable
+SESSION_MEMORY_MAX = int(os.getenv("SESSION_MEMORY_MAX", "1024"))
+REDIS_RETRY_SECONDS = 30
+
+
+class Conversation:
+    """One user's chat with the LLM, carried between turns as Ollama's context.
+
+    The first turn sends the system prompt; every later turn sends only the
+    new transcript plus the context Ollama returned, so its prefill cost no
+    longer includes the (long) system prompt or earlier turns.
+    """
+
+    def __init__(self, session_id: str, key: str, context: Optional[list] = None, turns: int = 0):
+        self.session_id = session_id
+        self.key = key
+        self.context = context
+        self.turns = turns
+
+    def llm_options(self) -> dict:
+        if self.context:
+            return {"context": self.context, "on_context": self.update}
+        return {"system": HEALTH_SYSTEM_PROMPT, "on_context": self.update}
+
+    def update(self, context: list):
+        self.turns += 1
+        self.context = context if len(context) <= SESSION_MAX_CONTEXT_TOKENS else None
+
+    def dumps(self) -> str:
+        return json.dumps({"context": self.context, "turns": self.turns})
+
+
+# ---------------- STORE ----------------
+# Redis so any API worker can continue a conversation; an in-process LRU
+# when Redis is missing or down
+_memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (json, expires_at)
+_memory_lock = threading.Lock()
+_redis_down_until = 0.0
+
+
+def _redis_key(key: str) -> str:
+    return f"session:{key}"
+
+
+def _redis():
+    if time.monotonic() < _redis_down_until:
+        return None
+    return get_redis()
+
+
+def _redis_failed(e: Exception):
+    global _redis_down_until
+    print(f"sessions: Redis unavailable ({e}) - keeping conversations in memory")
+    _redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+
+def _read(key: str) -> Optional[str]:
+    client = _redis()
+    if client is not None:
+        try:
+            value = client.get(_redis_key(key))
+            return value.decode() if value is not None else None
+        except Exception as e:
+            _redis_failed(e)
+    with _memory_lock:
+        entry = _memory.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        _memory.move_to_end(key)
+        return entry[0]
+
+
+def _write(key: str, value: str):
+    client = _redis()
+    if client is not None:
+        try:
+            client.set(_redis_key(key), value, ex=SESSION_TTL)
+            return
+        except Exception as e:
+            _redis_failed(e)
+    with _memory_lock:
+        _memory[key] = (value, time.monotonic() + SESSION_TTL)
+        _memory.move_to_end(key)
+        while len(_memory) > SESSION_MEMORY_MAX:
+            _memory.popitem(last=False)
+
+
+async def load(session_id: Optional[str], owner: str) -> Conversation:
+    """The conversation for session_id, or a new one if it is unknown or missing.
+
+    Sessions are keyed by owner (the API key) too, so a leaked session id
+    can't be used to read another caller's conversation.
+    """
+    if not session_id:
+        session_id = uuid.uuid4().hex
+        return Conversation(session_id, content_key(owner, session_id))
+    key = content_key(owner, session_id)
+    stored = await asyncio.to_thread(_read, key)
+    if stored is None:
+        return Conversation(session_id, key)
+    data = json.loads(stored)
+    return Conversation(session_id, key, data.get("context"), data.get("turns", 0))
+
+
+async def save(conversation: Conversation):
+    await asyncio.to_thread(_write, conversation.key, conversation.dumps())
+
+
+# ---------------- LLM CALLS ----------------
+async def generate(conversation: Conversation, user_text: str) -> str:
+    """llm.generate for the next turn of conversation, saving the new context"""
+    reply = await llm.generate(user_text, **conversation.llm_options())
+    await save(conversation)
+    return reply
+
+
+async def stream_tokens(conversation: Conversation, user_text: str) -> AsyncIterator[str]:
+    """llm.stream_tokens for the next turn; the context is saved once the reply is complete"""
+    async with aclosing(llm.stream_tokens(user_text, **conversation.llm_options())) as tokens:
+        async for token in tokens:
+            yield token
+    await save(conversation)
@@ -0,0 +1,225 @@
+import asyncio
+import re
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional
+
+import tts
+from audio import StreamEncoder
+from inference import PRIORITY_NORMAL
+
+# Sentences shorter than this are merged with the next one so Piper
+# isn't called for fragments like "Yes." or list numbering
+MIN_SENTENCE_CHARS = 20
+
+# A run of terminators (plus closing quotes/brackets) followed by whitespace,
+# or a blank line between paragraphs
+_BOUNDARY = re.compile(r"[.!?]+[\"')\]]*\s+|\n\s*\n")
+
+_ABBREVIATIONS = {
+    "dr", "mr", "mrs", "ms", "st", "vs", "etc", "approx", "e.g", "i.e", "mg", "ml"
+}
+
+
+def _ends_with_abbreviation(text: str) -> bool:
+    """True if the '.' ending text belongs to an abbreviation or a list number"""
+    if not text.endswith("."):
+        return False
+    words = text[:-1].split()
+    if not words:
+        return True
+    word = words[-1].lower().lstrip("(\"'")
+    return word in _ABBREVIATIONS or word.isdigit() or len(word) == 1
+
+
+class SentenceSplitter:
+    """Incrementally re-chunk an LLM token stream into complete sentences"""
+
+    def __init__(self, min_chars: int = MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ""
+        self.scan_from = 0
+
+    def feed(self, token: str) -> List[str]:
+        """Add a token; return any sentences it completed"""
+        self.buffer += token
+        sentences = []
+
+        while True:
+            match = _BOUNDARY.search(self.buffer, self.scan_from)
+            if match is None:
+                break
+            self.scan_from = match.end()
+
+            sentence = self.buffer[:match.end()].strip()
+            terminator_end = len(self.buffer[:match.end()].rstrip())
+            if len(sentence) < self.min_chars or _ends_with_abbreviation(self.buffer[:terminator_end]):
+                continue
+
+            sentences.append(sentence)
+            self.buffer = self.buffer[match.end():]
+            self.scan_from = 0
+
+        return sentences
+
+    def flush(self) -> List[str]:
+        """Return whatever is left once the stream has ended"""
+        tail = self.buffer.strip()
+        self.buffer = ""
+        self.scan_from = 0
+        return [tail] if tail else []
+
+
+def iter_sentences(tokens: Iterable[str], min_chars: int = MIN_SENTENCE_CHARS) -> Iterator[str]:
+    """Re-chunk an LLM token stream into complete sentences"""
+    splitter = SentenceSplitter(min_chars)
+    for token in tokens:
+        yield from splitter.feed(token)
+    yield from splitter.flush()
+
+
+async def aiter_sentences(tokens: AsyncIterable[str], min_chars: int = MIN_SENTENCE_CHARS) -> AsyncIterator[str]:
+    """Async version of iter_sentences for the pooled LLM client"""
+    splitter = SentenceSplitter(min_chars)
+    async for token in tokens:
+        for sentence in splitter.feed(token):
+            yield sentence
+    for sentence in splitter.flush():
+        yield sentence
+
+
+# ---------------- SPEECH TEXT ----------------
+# Piper reads "mg" as "em gee" and "3-4" as "three minus four"; health
+# answers are full of both, so they are spelled out before synthesis
+_SPOKEN_ABBREVIATIONS = [
+    (re.compile(r"\bDr\.(?=\s)"), "Doctor"),
+    (re.compile(r"\be\.g\.(?=\s|,|$)", re.I), "for example"),
+    (re.compile(r"\bi\.e\.(?=\s|,|$)", re.I), "that is"),
+    (re.compile(r"\betc\.(?=\s|$)", re.I), "et cetera"),
+    (re.compile(r"\bapprox\.(?=\s)", re.I), "approximately"),
+    (re.compile(r"\bvs\.?(?=\s)", re.I), "versus"),
+    (re.compile(r"\bBP\b"), "blood pressure"),
+    (re.compile(r"\b24/7\b"), "twenty four seven")
+]
+# Units only count after a number, so "g" or "L" elsewhere is left alone
+_UNITS = {
+    "mg": ("milligram", "milligrams"),
+    "mcg": ("microgram", "micrograms"),
+    "µg": ("microgram", "micrograms"),
+    "g": ("gram", "grams"),
+    "kg": ("kilogram", "kilograms"),
+    "lb": ("pound", "pounds"),
+    "lbs": ("pound", "pounds"),
+    "ml": ("milliliter", "milliliters"),
+    "mL": ("milliliter", "milliliters"),
+    "l": ("liter", "liters"),
+    "L": ("liter", "liters"),
+    "oz": ("ounce", "ounces"),
+    "cm": ("centimeter", "centimeters"),
+    "mm": ("millimeter", "millimeters"),
+    "mmHg": ("millimeter of mercury", "millimeters of mercury"),
+    "mg/dL": ("milligram per deciliter", "milligrams per deciliter"),
+    "mmol/L": ("millimole per liter", "millimoles per liter"),
+    "bpm": ("beat per minute", "beats per minute"),
+    "IU": ("international unit", "international units"),
+    "kcal": ("kilocalorie", "kilocalories"),
+    "hr": ("hour", "hours"),
+    "hrs": ("hour", "hours"),
+    "min": ("minute", "minutes"),
+    "mins": ("minute", "minutes"),
+    "°F": ("degree Fahrenheit", "degrees Fahrenheit"),
+    "°C": ("degree Celsius", "degrees Celsius"),
+    "%": ("percent", "percent")
+}
+_NUMBER = r"\d+(?:[.,]\d+)*"
+_UNIT = re.compile(
+    rf"({_NUMBER})\s?("
+    + "|".join(re.escape(unit) for unit in sorted(_UNITS, key=len, reverse=True))
+    + r")(?!\w)"
+)
+_BLOOD_PRESSURE = re.compile(r"\b(\d{2,3})/(\d{2,3})(?=\s?mmHg)")
+_RANGE = re.compile(rf"\b({_NUMBER})\s?[-–]\s?(?={_NUMBER})")
+_PER = re.compile(r"\s?/\s?(day|week|hour|minute|night)\b")
+_TIMES = re.compile(rf"\b({_NUMBER})\s?x\b")
+
+
+def _spoken_unit(match: "re.Match") -> str:
+    number, unit = match.groups()
+    singular, plural = _UNITS[unit]
+    return f"{number} {singular if number == '1' else plural}"
+
+
+def normalize_for_speech(text: str) -> str:
+    """Spell out units, ranges and abbreviations common in health answers, for Piper"""
+    for pattern, spoken in _SPOKEN_ABBREVIATIONS:
+        text = pattern.sub(spoken, text)
+    text = _BLOOD_PRESSURE.sub(r"\1 over \2", text)
+    text = _RANGE.sub(r"\1 to ", text)
+    text = _UNIT.sub(_spoken_unit, text)
+    text = _TIMES.sub(r"\1 times", text)
+    return _PER.sub(r" per \1", text)
+
+
+def speech_sentences(text: str) -> List[str]:
+    """A complete reply as normalized sentences, ready for Piper"""
+    return [normalize_for_speech(sentence) for sentence in iter_sentences([text])]
+
+
+async def asentences(text: str) -> AsyncIterator[str]:
+    """The sentences of an already complete reply, for aspeak_sentences"""
+    for sentence in iter_sentences([text]):
+        yield sentence
+
+
+async def _synthesized(sentences: AsyncIterable[str], priority: int, lookahead: int) -> AsyncIterator[list]:
+    """Piper PCM chunks for each sentence in order, with up to lookahead sentences in flight"""
+    in_flight = deque()
+    try:
+        async for sentence in sentences:
+            in_flight.append(asyncio.ensure_future(tts.piper_pcm(normalize_for_speech(sentence), priority=priority)))
+            if len(in_flight) >= lookahead:
+                yield await in_flight.popleft()
+        while in_flight:
+            yield await in_flight.popleft()
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+async def aspeak_sentences(
+    sentences: AsyncIterable[str],
+    priority: int = PRIORITY_NORMAL,
+    audio_format: str = "wav",
+    on_complete: Optional[Callable[[List[bytes], int], Awaitable[None]]] = None,
+    lookahead: int = 1
+) -> AsyncIterator[bytes]:
+    """Synthesize each sentence with Piper as soon as it is complete; Piper runs on the inference pool.
+
+    Audio is encoded as it comes (chunked WAV, Ogg/Opus or MP3). If given,
+    on_complete gets the raw PCM chunks and sample rate once the whole
+    reply has been spoken, e.g. to cache it. A lookahead above 1 lets the
+    next sentences synthesize in parallel while one is being sent; only
+    worth it when the sentences are all known up front (a complete reply),
+    as a live token stream would hold the first one back.
+    """
+    encoder = StreamEncoder(audio_format)
+    spoken: List[bytes] = []
+
+    async with aclosing(_synthesized(sentences, priority, max(1, lookahead))) as synthesized:
+        async for chunks in synthesized:
+            for pcm, sample_rate in chunks:
+                if on_complete is not None:
+                    spoken.append(pcm)
+                if audio_format == "wav":
+                    data = encoder.feed(pcm, sample_rate)
+                else:
+                    # Opus/MP3 encoding is CPU work; keep it off the event loop
+                    data = await asyncio.to_thread(encoder.feed, pcm, sample_rate)
+                if data:
+                    yield data
+
+    tail = encoder.close() if audio_format == "wav" else await asyncio.to_thread(encoder.close)
+    if tail:
+        yield tail
+    if on_complete is not None and encoder.sample_rate is not None:
+        await on_complete(spoken, encoder.sample_rate)
@@ -1,47 +1,211 @@
+import asyncio
+import bisect
+import importlib.util
 import os
+import tempfile
+import threading
+from typing import Callable, List, Optional, Set, Tuple, Union
+import numpy as np
 from dotenv import load_dotenv
 
+import inference
+import metrics
+import model_client
+from audio import decode_audio
+from inference import PRIORITY_NORMAL
+
 load_dotenv()
 
 SAMPLE_RATE = 16000
 
-# Check if STT libraries are available
-try:
-    from faster_whisper import WhisperModel
-    # CPU + low RAM optimized
-    model = WhisperModel(
-        "tiny",
-        device="cpu",
-        compute_type="int8"
-    )
-    WHISPER_AVAILABLE = True
-except ImportError:
-    WHISPER_AVAILABLE = False
-    print("Faster Whisper not available - using mock STT")
-    model = None
-
-def record_audio(duration=5, filename="temp.wav"):
-    import sounddevice as sd
-    import numpy as np
-    import wavio
-    print("🎤 Recording...")
-    audio = sd.rec(
-        int(duration * SAMPLE_RATE),
-        samplerate=SAMPLE_RATE,
-        channels=1,
-        dtype="int16"
-    )
-    sd.wait()
-    wavio.write(filename, audio, SAMPLE_RATE, sampwidth=2)
-    print("✅ Recording finished")
-    return filename
+# Micro-batching of concurrent requests; a window of 0 disables it
+STT_BATCH_WINDOW_MS = float(os.getenv("STT_BATCH_WINDOW_MS", "25"))
+STT_MAX_BATCH = int(os.getenv("STT_MAX_BATCH", "8"))
+# Whisper's context is 30 s; longer clips are transcribed on their own
+MAX_BATCH_CLIP_SAMPLES = 30 * SAMPLE_RATE
 
-# Used by FastAPI (audio file upload)
-def speech_to_text(audio_path: str) -> str:
-    segments, _ = model.transcribe(audio_path)
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "tiny")
+
+# faster-whisper (and CTranslate2 under it) is imported and the model built
+# on first use or at API startup, not when this module is imported
+WHISPER_AVAILABLE = importlib.util.find_spec("faster_whisper") is not None or model_client.enabled()
+if not WHISPER_AVAILABLE:
+    print("⚠️ faster-whisper not installed and no MODEL_SERVER_SOCKET set - speech-to-text requests will fail")
+
+model = None
+batched_model = None
+_model_lock = threading.Lock()
+
+def load_model():
+    """Build the Whisper model (and its batched pipeline) once, thread-safely"""
+    global model, batched_model
+    with _model_lock:
+        if model is None:
+            from faster_whisper import WhisperModel
+            # CPU + low RAM optimized
+            loaded = WhisperModel(
+                WHISPER_MODEL,
+                device="cpu",
+                compute_type="int8"
+            )
+            try:
+                from faster_whisper import BatchedInferencePipeline
+                batched_model = BatchedInferencePipeline(model=loaded)
+            except ImportError:
+                batched_model = None
+            model = loaded
+    return model
+
+def warm_up():
+    """Load the model and run a dummy transcription so the first request isn't slow"""
+    if not WHISPER_AVAILABLE or model_client.enabled():
+        return
+    load_model()
+    speech_to_text(np.zeros(SAMPLE_RATE, dtype=np.float32))
+
+# Accepts a file path or a 16 kHz mono float32 array
+def speech_to_text(audio: Union[str, np.ndarray]) -> str:
+    segments, _ = (model or load_model()).transcribe(audio)
     return " ".join(segment.text for segment in segments)
 
-# Used by real-time mic mode
-def speech_to_text_from_mic(duration=10) -> str:
-    audio_path = record_audio(duration)
-    return speech_to_text(audio_path)
+# Used by FastAPI (audio file upload)
+def speech_to_text_from_bytes(data: bytes, filename: Optional[str] = None, content_type: Optional[str] = None) -> str:
+    audio = decode_audio(data, content_type)
+    if audio is not None:
+        return speech_to_text(audio)
+
+    # Exotic codecs (mp3, m4a, ogg...) go through faster-whisper's own decoder,
+    # which wants a real file. Unique name so concurrent uploads can't collide.
+    suffix = os.path.splitext(filename or "")[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+        f.write(data)
+        f.flush()
+        return speech_to_text(f.name)
+
+# ---------------- BATCHED STT ----------------
+def transcribe_batch(audios: List[np.ndarray]) -> List[str]:
+    """Transcribe several utterances in one batched faster-whisper pass.
+
+    The clips are laid end to end and handed to BatchedInferencePipeline as
+    explicit clip_timestamps, so each becomes one row of the batch; the
+    returned segments are mapped back to their clip by timestamp.
+    """
+    batch = [i for i, audio in enumerate(audios) if 0 < len(audio) <= MAX_BATCH_CLIP_SAMPLES]
+    if WHISPER_AVAILABLE and model is None:
+        load_model()
+    if batched_model is None or len(batch) < 2:
+        return [speech_to_text(audio) for audio in audios]
+
+    texts = [""] * len(audios)
+    for i, audio in enumerate(audios):
+        if len(audio) > MAX_BATCH_CLIP_SAMPLES:
+            texts[i] = speech_to_text(audio)
+
+    offsets = []
+    clips = []
+    position = 0
+    for i in batch:
+        offsets.append(position / SAMPLE_RATE)
+        clips.append({"start": position / SAMPLE_RATE, "end": (position + len(audios[i])) / SAMPLE_RATE})
+        position += len(audios[i])
+
+    segments, _ = batched_model.transcribe(
+        np.concatenate([audios[i] for i in batch]),
+        clip_timestamps=clips,
+        batch_size=len(batch),
+        without_timestamps=True
+    )
+
+    parts = [[] for _ in batch]
+    for segment in segments:
+        midpoint = (segment.start + segment.end) / 2
+        parts[bisect.bisect_right(offsets, midpoint) - 1].append(segment.text)
+    for slot, i in enumerate(batch):
+        texts[i] = " ".join(parts[slot])
+    return texts
+
+
+class BatchedTranscriber:
+    """Collect concurrent transcriptions for a short window and run them as one batch"""
+
+    def __init__(
+        self,
+        window_ms: float = STT_BATCH_WINDOW_MS,
+        max_batch: int = STT_MAX_BATCH,
+        transcribe_fn: Callable[[List[np.ndarray]], List[str]] = transcribe_batch
+    ):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.transcribe_fn = transcribe_fn
+        self._pending: List[Tuple[np.ndarray, asyncio.Future, int]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks; running batches live here
+        self._running: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.requests = 0
+
+    async def transcribe(self, audio: np.ndarray, priority: int = PRIORITY_NORMAL) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((audio, future, priority))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.requests += len(batch)
+        # The batch inherits the most urgent priority of its members
+        priority = min(item[2] for item in batch)
+        try:
+            texts = await inference.pool.run(self.transcribe_fn, [item[0] for item in batch], priority=priority)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), text in zip(batch, texts):
+            if not future.done():
+                future.set_result(text)
+
+
+batcher = BatchedTranscriber()
+
+
+async def transcribe_array(audio: np.ndarray, priority: int = PRIORITY_NORMAL) -> str:
+    """Async STT for decoded 16 kHz audio: on the model server if there is one, else micro-batched locally"""
+    if model_client.enabled():
+        return await model_client.transcribe(audio, priority)
+    if batcher.window > 0:
+        return await batcher.transcribe(audio, priority)
+    return await inference.pool.run(speech_to_text, audio, priority=priority)
+
+
+async def transcribe_upload(
+    data: bytes,
+    filename: Optional[str] = None,
+    content_type: Optional[str] = None,
+    priority: int = PRIORITY_NORMAL
+) -> str:
+    """Async STT for API uploads, decoded in memory where possible"""
+    with metrics.timed("stt", backend="faster-whisper", model=WHISPER_MODEL):
+        audio = decode_audio(data, content_type)
+        if audio is not None:
+            return await transcribe_array(audio, priority)
+        if model_client.enabled():
+            return await model_client.transcribe_file(data, filename, content_type, priority)
+        return await inference.pool.run(speech_to_text_from_bytes, data, filename, content_type, priority=priority)
@@ -0,0 +1,430 @@
+"""Background worker: medication and appointment reminders.
+
+    python tasks.py                 # both
+    python tasks.py appointments    # appointment sweep only; run on as many nodes as needed
+
+Loads every medication with an upcoming reminder (via the indexed
+next_fire_at) into a reminders.ReminderScheduler, sleeps until the earliest
+one, then pops everything due in batches: one query for the batch's names
+and phone numbers, the messages sent concurrently, and one bulk UPDATE of
+the batch's next_fire_at. Medications changed through the API are announced
+on Redis and re-read one by one; without Redis the worker re-reads all of
+them every REMINDER_RESYNC_SECONDS. Run a single medication worker:
+medication reminders are not claimed, so two would both send them.
+
+Appointment reminders are swept every APPOINTMENT_SWEEP_SECONDS: due
+appointments are streamed from a partial index in keyset pages, and each
+page is claimed with one conditional UPDATE ... SET reminder_sent that only
+flips rows still unsent, so sweepers on several nodes never both send one.
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Iterable, List, NamedTuple, Optional
+
+import httpx
+from dotenv import load_dotenv
+from sqlalchemy import and_, bindparam, or_, select, tuple_, update
+
+import database
+import reminders
+from models import Appointment, Medication, User
+from reminders import MAX_UTC_OFFSET, REMINDER_BATCH_SIZE, Reminder, ReminderScheduler, SystemClock, schedule_of
+
+load_dotenv()
+
+# ---------------- CONFIG ----------------
+# Full re-read of the medications when change announcements can't be received
+REMINDER_RESYNC_SECONDS = int(os.getenv("REMINDER_RESYNC_SECONDS", "300"))
+# Upper bound on one sleep, so a missed announcement is never waited on for long
+REMINDER_MAX_SLEEP_SECONDS = 60
+REMINDER_SEND_CONCURRENCY = int(os.getenv("REMINDER_SEND_CONCURRENCY", "20"))
+# A reminder SMS that failed is retried after this, then after twice as
+# long each time, until it is REMINDER_MAX_LATE_SECONDS late
+REMINDER_RETRY_SECONDS = int(os.getenv("REMINDER_RETRY_SECONDS", "30"))
+
+# Appointments are reminded this long ahead
+APPOINTMENT_REMINDER_HOURS = float(os.getenv("APPOINTMENT_REMINDER_HOURS", "24"))
+APPOINTMENT_SWEEP_SECONDS = int(os.getenv("APPOINTMENT_SWEEP_SECONDS", "60"))
+# Appointments read, claimed and sent per round trip
+APPOINTMENT_BATCH_SIZE = int(os.getenv("APPOINTMENT_BATCH_SIZE", "1000"))
+
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+TWILIO_FROM_NUMBER = os.getenv("TWILIO_FROM_NUMBER")
+TWILIO_URL = "https://api.twilio.com/2010-04-01/Accounts/{sid}/Messages.json"
+
+
+# ---------------- SENDING ----------------
+def reminder_text(name: str, dosage: Optional[str]) -> str:
+    return f"💊 Time to take your {name}{f' ({dosage})' if dosage else ''}."
+
+
+async def send_sms(messages: List[dict]) -> List[dict]:
+    """Send {"to", "body"} messages by Twilio SMS, or print them when Twilio isn't configured.
+
+    Returns the messages that failed and are worth retrying.
+    """
+    if not (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_FROM_NUMBER):
+        for message in messages:
+            print(f"{message['to'] or '(no phone)'}: {message['body']}")
+        return []
+
+    limit = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+    url = TWILIO_URL.format(sid=TWILIO_ACCOUNT_SID)
+    failed = []
+    async with httpx.AsyncClient(auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN), timeout=10) as client:
+        async def send(message):
+            async with limit:
+                try:
+                    response = await client.post(
+                        url, data={"To": message["to"], "From": TWILIO_FROM_NUMBER, "Body": message["body"]}
+                    )
+                    response.raise_for_status()
+                except httpx.HTTPError as e:
+                    print(f"❌ Reminder SMS to {message['to']} failed: {e}")
+                    failed.append(message)
+
+        await asyncio.gather(*(send(m) for m in messages if m["to"]))
+    return failed
+
+
+# ---------------- WORKER ----------------
+class FailedReminder(NamedTuple):
+    message: dict
+    first_failed: datetime
+    retry_at: datetime
+    tries: int
+
+
+class ReminderWorker:
+    """Fires medication reminders on time, in batches"""
+
+    def __init__(
+        self,
+        session_factory=None,
+        send: Callable[[List[dict]], Awaitable[List[dict]]] = send_sms,
+        clock=None,
+        batch_size: int = REMINDER_BATCH_SIZE
+    ):
+        # An async_sessionmaker; defaults to the app's database
+        self.session_factory = session_factory or database.get_async_sessionmaker()
+        self.send = send
+        self.clock = clock or SystemClock()
+        self.batch_size = batch_size
+        self.scheduler = ReminderScheduler()
+        self.changed = set()
+        self.subscribed = False
+        self._wake: Optional[asyncio.Event] = None
+        self.sent = 0
+        self.missed = 0
+        self.failed = 0
+        self._retrying: List[FailedReminder] = []
+
+    # ---------------- SCHEDULES ----------------
+    def _query(self):
+        return select(
+            Medication.id, Medication.reminder_time, Medication.reminder_timezone,
+            Medication.start_date, Medication.end_date, Medication.next_fire_at
+        )
+
+    def _schedules(self, rows):
+        for row in rows:
+            try:
+                yield row.id, schedule_of(row), row.next_fire_at
+            except (ValueError, KeyError) as e:
+                print(f"⚠️ Medication {row.id}: unusable reminder schedule ({e})")
+
+    async def load(self):
+        """Read every medication with an upcoming reminder"""
+        # Rows from before next_fire_at existed are scheduled from their times
+        # until their first reminder stores it. end_date is wall clock in each
+        # row's reminder_timezone, so the query only drops courses that have
+        # ended in every zone; next_fire() compares the rest in their own zone
+        now = self.clock.now()
+        unscheduled = and_(
+            Medication.next_fire_at.is_(None),
+            Medication.reminder_time.is_not(None),
+            Medication.reminder_time != "",
+            or_(Medication.end_date.is_(None), Medication.end_date > (now - MAX_UTC_OFFSET).replace(tzinfo=None))
+        )
+        async with self.session_factory() as db:
+            result = await db.stream(self._query().where(or_(Medication.next_fire_at.is_not(None), unscheduled)))
+            rows = [row async for row in result]
+        self.scheduler.load(self._schedules(rows), now)
+
+    async def refresh(self, medication_ids: Iterable[int]):
+        """Re-read changed medications; deleted ones are dropped"""
+        medication_ids = set(medication_ids)
+        async with self.session_factory() as db:
+            rows = (await db.execute(self._query().where(Medication.id.in_(medication_ids)))).all()
+        found = set()
+        for medication_id, schedule, _ in self._schedules(rows):
+            found.add(medication_id)
+            self.scheduler.reschedule(medication_id, schedule, self.clock.now())
+        for medication_id in medication_ids - found:
+            self.scheduler.remove(medication_id)
+
+    def medications_changed(self, medication_ids: Iterable[int]):
+        self.changed.update(medication_ids)
+        if self._wake is not None:
+            self._wake.set()
+
+    # ---------------- FIRING ----------------
+    async def run_once(self) -> int:
+        """Send one batch of due reminders; returns how many were popped"""
+        await self._retry()
+        due, missed = self.scheduler.pop_due(self.clock.now(), self.batch_size)
+        if not due and not missed:
+            return 0
+        if due:
+            messages = await self._messages(due)
+            failed = await self.send(messages)
+            self._failed(failed)
+            self.sent += len(messages) - len(failed)
+        if missed:
+            print(f"⚠️ Skipped {len(missed)} reminders more than {reminders.REMINDER_MAX_LATE_SECONDS}s late")
+        await self._store(due + missed)
+        self.missed += len(missed)
+        return len(due) + len(missed)
+
+    def _failed(self, messages: List[dict], earlier: Optional[dict] = None):
+        now = self.clock.now()
+        for message in messages:
+            previous = (earlier or {}).get(message["medication_id"])
+            first_failed, tries = (previous.first_failed, previous.tries + 1) if previous else (now, 1)
+            retry_at = now + timedelta(seconds=REMINDER_RETRY_SECONDS * 2 ** (tries - 1))
+            self._retrying.append(FailedReminder(message, first_failed, retry_at, tries))
+
+    async def _retry(self):
+        """Resend failed reminders that are due another try; give up once they are too late"""
+        now = self.clock.now()
+        due, waiting, expired = {}, [], 0
+        for failed in self._retrying:
+            if (now - failed.first_failed).total_seconds() > reminders.REMINDER_MAX_LATE_SECONDS:
+                expired += 1
+            elif failed.retry_at <= now:
+                due[failed.message["medication_id"]] = failed
+            else:
+                waiting.append(failed)
+        self._retrying = waiting
+        if expired:
+            print(f"❌ Gave up on {expired} reminder SMS after {reminders.REMINDER_MAX_LATE_SECONDS}s of failures")
+            self.failed += expired
+        if due:
+            failed = await self.send([f.message for f in due.values()])
+            self._failed(failed, earlier=due)
+            self.sent += len(due) - len(failed)
+
+    def _next_retry(self) -> Optional[datetime]:
+        return min((f.retry_at for f in self._retrying), default=None)
+
+    async def _messages(self, due: List[Reminder]) -> List[dict]:
+        query = (
+            select(Medication.id, Medication.name, Medication.dosage, User.phone)
+            .outerjoin(User, User.id == Medication.user_id)
+            .where(Medication.id.in_([r.medication_id for r in due]))
+        )
+        async with self.session_factory() as db:
+            rows = (await db.execute(query)).all()
+        return [
+            {"medication_id": row.id, "to": row.phone, "body": reminder_text(row.name, row.dosage)}
+            for row in rows
+        ]
+
+    async def _store(self, fired: List[Reminder]):
+        # One executemany UPDATE for the batch; Core, so the ORM listeners
+        # don't announce the worker's own writes as changes
+        table = Medication.__table__
+        statement = update(table).where(table.c.id == bindparam("b_id")).values(next_fire_at=bindparam("b_next"))
+        async with self.session_factory() as db:
+            await db.execute(statement, [{"b_id": r.medication_id, "b_next": r.next_fire_at} for r in fired])
+            await db.commit()
+
+    async def _sleep(self, seconds: float):
+        sleeping = asyncio.ensure_future(self.clock.sleep(seconds))
+        woken = asyncio.ensure_future(self._wake.wait())
+        try:
+            await asyncio.wait({sleeping, woken}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sleeping.cancel()
+            woken.cancel()
+        self._wake.clear()
+
+    async def run(self, until=None):
+        """Fire reminders until cancelled (or until the clock passes `until`)"""
+        self._wake = asyncio.Event()
+        await self.load()
+        print(f"💊 Reminder worker: {len(self.scheduler)} medications scheduled")
+        resynced = self.clock.now()
+        while until is None or self.clock.now() < until:
+            if self.changed:
+                changed, self.changed = self.changed, set()
+                await self.refresh(changed)
+            if not self.subscribed and (self.clock.now() - resynced).total_seconds() >= REMINDER_RESYNC_SECONDS:
+                await self.load()
+                resynced = self.clock.now()
+            if await self.run_once() >= self.batch_size:
+                continue
+            deadline = min(filter(None, (self.scheduler.next_fire_at(), self._next_retry())), default=None)
+            delay = REMINDER_MAX_SLEEP_SECONDS
+            if deadline is not None:
+                delay = min(max((deadline - self.clock.now()).total_seconds(), 0), delay)
+            await self._sleep(delay)
+
+    # ---------------- CHANGE FEED ----------------
+    def subscribe(self, loop: asyncio.AbstractEventLoop):
+        """Follow the API's change announcements on a background thread"""
+        client = database.get_redis()
+        if client is None:
+            return
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(reminders.REMINDER_CHANNEL)
+        except Exception as e:
+            print(f"⚠️ Redis unavailable ({e}) - re-reading medications every {REMINDER_RESYNC_SECONDS}s")
+            return
+        self.subscribed = True
+
+        def listen():
+            try:
+                for message in pubsub.listen():
+                    ids = {int(i) for i in message["data"].decode().split(",") if i}
+                    loop.call_soon_threadsafe(self.medications_changed, ids)
+            except Exception as e:
+                print(f"⚠️ Lost Redis change feed ({e}) - falling back to resyncs")
+                self.subscribed = False
+
+        threading.Thread(target=listen, daemon=True, name="reminder-changes").start()
+
+
+# ---------------- APPOINTMENTS ----------------
+def appointment_text(doctor_name: str, specialty: Optional[str], moment: datetime) -> str:
+    with_whom = f"{doctor_name} ({specialty})" if specialty else doctor_name
+    return f"📅 Reminder: your appointment with {with_whom} is on {moment:%b %d at %H:%M}."
+
+
+def _due_page(now: datetime, after: tuple, limit: int):
+    # Keyset page over ix_appointments_reminder_due: rows after the last one
+    # seen, so every page costs the same however far into the window it is
+    return (
+        select(
+            Appointment.id, Appointment.appointment_datetime, Appointment.doctor_name,
+            Appointment.specialty, User.phone
+        )
+        .outerjoin(User, User.id == Appointment.user_id)
+        .where(
+            # Written as "= false" so it matches the partial index's predicate
+            Appointment.reminder_sent == False,
+            Appointment.status == "scheduled",
+            tuple_(Appointment.appointment_datetime, Appointment.id) > tuple_(*after),
+            Appointment.appointment_datetime <= now + timedelta(hours=APPOINTMENT_REMINDER_HOURS)
+        )
+        .order_by(Appointment.appointment_datetime, Appointment.id)
+        .limit(limit)
+        # Postgres: sweepers on other nodes skip this page instead of waiting for it
+        .with_for_update(of=Appointment, skip_locked=True)
+    )
+
+
+def _claim(ids: List[int]):
+    # Only rows still unsent flip, and only those come back: the claim
+    table = Appointment.__table__
+    return (
+        update(table)
+        .where(table.c.id.in_(ids), table.c.reminder_sent == False, table.c.status == "scheduled")
+        .values(reminder_sent=True)
+        .returning(table.c.id)
+    )
+
+
+async def sweep_appointments(
+    session_factory,
+    send: Callable[[List[dict]], Awaitable[List[dict]]] = send_sms,
+    now: Optional[datetime] = None,
+    batch_size: int = APPOINTMENT_BATCH_SIZE
+) -> dict:
+    """Remind everyone with an appointment in the next APPOINTMENT_REMINDER_HOURS; returns counts.
+
+    Safe to run on several nodes at once: each appointment is sent by the
+    sweeper whose UPDATE claimed it. A failed send is un-claimed for the next
+    sweep; a crash between claim and send loses that page's reminders.
+    """
+    now = now or datetime.utcnow()
+    after = (now, 0)
+    counts = {"seen": 0, "claimed": 0, "failed": 0}
+    while True:
+        async with session_factory() as db:
+            page = (await db.execute(_due_page(now, after, batch_size))).all()
+            if not page:
+                break
+            claimed = set((await db.execute(_claim([row.id for row in page]))).scalars())
+            await db.commit()
+        after = (page[-1].appointment_datetime, page[-1].id)
+
+        messages = [
+            {
+                "appointment_id": row.id,
+                "to": row.phone,
+                "body": appointment_text(row.doctor_name, row.specialty, row.appointment_datetime)
+            }
+            for row in page if row.id in claimed
+        ]
+        failed = (await send(messages)) if messages else []
+        if failed:
+            table = Appointment.__table__
+            async with session_factory() as db:
+                await db.execute(
+                    update(table).where(table.c.id.in_([m["appointment_id"] for m in failed])).values(reminder_sent=False)
+                )
+                await db.commit()
+
+        counts["seen"] += len(page)
+        counts["claimed"] += len(claimed)
+        counts["failed"] += len(failed)
+        if len(page) < batch_size:
+            break
+    return counts
+
+
+async def sweep_appointments_forever(session_factory):
+    while True:
+        try:
+            counts = await sweep_appointments(session_factory)
+            if counts["claimed"]:
+                print(f"📅 Appointment reminders: {counts['claimed'] - counts['failed']} sent, {counts['failed']} failed")
+        except Exception as e:
+            print(f"❌ Appointment sweep failed: {e}")
+        await asyncio.sleep(APPOINTMENT_SWEEP_SECONDS)
+
+
+async def main(jobs):
+    session_factory = database.get_async_sessionmaker()
+    if session_factory is None:
+        raise SystemExit("Database not available")
+    runs = []
+    if "appointments" in jobs:
+        runs.append(sweep_appointments_forever(session_factory))
+    if "medications" in jobs:
+        worker = ReminderWorker(session_factory)
+        worker.subscribe(asyncio.get_running_loop())
+        runs.append(worker.run())
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*runs)
+    finally:
+        if "medications" in jobs:
+            print(f"👋 Sent {worker.sent} medication reminders ({worker.failed} failed) in {time.perf_counter() - start:.0f}s")
+        await database.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Medication and appointment reminder worker")
+    parser.add_argument("jobs", nargs="*", choices=("medications", "appointments"), help="default: both")
+    try:
+        asyncio.run(main(parser.parse_args().jobs or ("medications", "appointments")))
+    except KeyboardInterrupt:
+        pass
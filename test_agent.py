@@ -0,0 +1,108 @@
+import asyncio
+import wave
+
+import numpy as np
+import pytest
+
+import agent
+import tts
+from vad import SAMPLE_RATE, EnergyEndpointer
+
+
+def tone(seconds, amplitude=0.3):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+async def blocks(audio, block=480, pace=0.0):
+    """audio as a microphone would deliver it, pace seconds apart"""
+    for start in range(0, len(audio), block):
+        yield audio[start:start + block]
+        await asyncio.sleep(pace)
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    """Whisper, Ollama and Piper stand-ins; every sentence is 0.5 s (SAMPLE_RATE bytes) of audio"""
+    heard = iter(["How much water should I drink?", "What about coffee?"])
+    synthesized = []
+
+    async def fake_transcribe(audio, priority=None):
+        return next(heard)
+
+    async def fake_stream_tokens(prompt, **kwargs):
+        for token in ["About eight glasses a day. ", "Sip it through the day. ", "Ask a doctor if unsure."]:
+            yield token
+
+    async def fake_piper_pcm(text, priority=None):
+        synthesized.append(text)
+        return [(b"\x01\x00" * (SAMPLE_RATE // 2), SAMPLE_RATE)]
+
+    monkeypatch.setattr(agent.stt, "transcribe_array", fake_transcribe)
+    monkeypatch.setattr(agent.llm, "stream_tokens", fake_stream_tokens)
+    monkeypatch.setattr(tts, "PIPER_AVAILABLE", True)
+    monkeypatch.setattr(tts, "piper_pcm", fake_piper_pcm)
+    return synthesized
+
+def test_turns_run_headless(fakes):
+    """Test utterances from a file-like source are answered in order, each sentence spoken into the sink"""
+    audio = np.concatenate([silence(0.3), tone(0.6), silence(1.0), tone(0.6), silence(1.0)])
+    sink = agent.WavSink()
+    runner = agent.Agent(blocks(audio), sink, EnergyEndpointer(silence_ms=300))
+    asyncio.run(runner.run())
+
+    assert runner.transcripts == ["How much water should I drink?", "What about coffee?"]
+    assert len(fakes) == 6
+    assert len(sink.played) == 6 * SAMPLE_RATE
+    assert runner.interruptions == 0
+
+def test_barge_in_cancels_reply(fakes):
+    """Test speaking over a reply stops its playback and generation, and the new turn is answered"""
+    # Blocks arrive 3x faster than real time; the reply plays in real time
+    audio = np.concatenate([silence(0.3), tone(0.6), silence(0.9), tone(0.6), silence(1.0)])
+    sink = agent.WavSink(realtime=True)
+    runner = agent.Agent(blocks(audio, pace=0.01), sink, EnergyEndpointer(silence_ms=300))
+    asyncio.run(runner.run())
+
+    assert runner.interruptions == 1 and sink.stops == 1
+    assert runner.transcripts == ["How much water should I drink?", "What about coffee?"]
+    # The first reply was cut short, the second one played in full
+    assert 3 * SAMPLE_RATE <= len(sink.played) < 6 * SAMPLE_RATE
+
+def test_emergency_with_mp3_clip_is_spoken_by_piper(fakes, monkeypatch):
+    """Test an emergency turn still plays audio when the canned clip is MP3"""
+    async def fake_transcribe(audio, priority=None):
+        return "I think I'm having a heart attack"
+
+    monkeypatch.setattr(agent.stt, "transcribe_array", fake_transcribe)
+    monkeypatch.setitem(tts.canned_audio, agent.EMERGENCY_AUDIO_RESPONSE, b"ID3 mp3 emergency clip")
+    audio = np.concatenate([silence(0.3), tone(0.6), silence(1.0)])
+    sink = agent.WavSink()
+    runner = agent.Agent(blocks(audio), sink, EnergyEndpointer(silence_ms=300))
+    asyncio.run(runner.run())
+
+    assert len(fakes) == 1 and "911" in fakes[0]
+    assert len(sink.played) == SAMPLE_RATE
+
+def test_wav_file_utterance_reaches_stt(fakes, monkeypatch, tmp_path):
+    """Test a recording played through file_blocks reaches STT as one float32 utterance"""
+    heard = []
+
+    async def fake_transcribe(audio, priority=None):
+        heard.append(audio)
+        return "How much water should I drink?"
+
+    monkeypatch.setattr(agent.stt, "transcribe_array", fake_transcribe)
+    path = tmp_path / "speech.wav"
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes((np.concatenate([silence(1.0), tone(0.8), silence(1.0)]) * 32767).astype("<i2").tobytes())
+
+    runner = agent.Agent(agent.file_blocks(str(path), realtime=False), agent.WavSink(), EnergyEndpointer())
+    asyncio.run(runner.run())
+    assert len(heard) == 1 and heard[0].dtype == np.float32
+    assert 0.8 * SAMPLE_RATE <= len(heard[0]) <= 1.8 * SAMPLE_RATE
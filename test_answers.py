@@ -0,0 +1,87 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import answers
+import main
+import sessions
+import tts
+from cache import TieredCache
+from prompts import EMERGENCY_AUDIO_RESPONSE
+
+
+def test_normalize_question():
+    """Test case, punctuation and filler words don't change the key"""
+    assert answers.normalize_question("Um, how much WATER should I drink?") == "how much water should i drink"
+    assert answers.normalize_question("So uh how much water should I drink, please") == "how much water should i drink"
+    assert answers.normalize_question("Well, I don't feel well.") == "i dont feel well"
+    assert answers.answer_key("How much water should I drink?") == answers.answer_key("how much water should i drink")
+    assert answers.answer_key("How much water should I drink?") != answers.answer_key("How much salt should I eat?")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def noop():
+        return None
+
+    cache = TieredCache("answer", max_bytes=1 << 20, ttl=60)
+    cache.redis = None
+    monkeypatch.setattr(answers, "ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(answers, "answer_cache", cache)
+    monkeypatch.setattr(sessions, "get_redis", lambda: None)
+    monkeypatch.setattr(main, "verify_key", lambda key: True)
+    monkeypatch.setattr(tts, "prewarm", lambda texts: noop())
+    with TestClient(main.app) as client:
+        yield client
+
+def ask(client, monkeypatch, text, session_id=None):
+    async def fake_transcribe(*args, **kwargs):
+        return text
+    monkeypatch.setattr(main, "transcribe_upload", fake_transcribe)
+
+    headers = {"x-api-key": "test"}
+    if session_id:
+        headers["x-session-id"] = session_id
+    with open("input.wav", "rb") as f:
+        return client.post("/voice-chat", headers=headers, files={"audio_file": f})
+
+def test_repeated_question_skips_llm_and_tts(client, monkeypatch):
+    """Test a rephrased repeat is answered from the cache, and follow-up turns are not"""
+    calls = []
+
+    async def fake_generate(prompt, **kwargs):
+        calls.append(prompt)
+        kwargs["on_context"]([1, 2, 3])
+        return f"Answer {len(calls)}"
+
+    async def fake_tts(text, **kwargs):
+        return f"audio:{text}".encode()
+
+    monkeypatch.setattr(main.llm, "generate", fake_generate)
+    monkeypatch.setattr(main, "text_to_speech", fake_tts)
+    logged = []
+    monkeypatch.setattr(main.health_logs, "add", logged.append)
+
+    first = ask(client, monkeypatch, "How much water should I drink?")
+    repeat = ask(client, monkeypatch, "Um, how much water should I drink")
+    follow_up = ask(client, monkeypatch, "How much water should I drink?", first.headers["x-session-id"])
+
+    assert first.content == repeat.content == b"audio:Answer 1"
+    assert repeat.headers["x-answer-cache"] == "hit"
+    assert "x-answer-cache" not in follow_up.headers
+    assert follow_up.content == b"audio:Answer 2"
+    assert len(calls) == 2
+    # Cache hits are logged like any other turn
+    assert [row["data"]["ai_response"] for row in logged] == ["Answer 1", "Answer 1", "Answer 2"]
+
+def test_emergency_bypasses_answer_cache(client, monkeypatch):
+    """Test an emergency transcript never gets a cached answer"""
+    text = "I have chest pain"
+    monkeypatch.setitem(tts.canned_audio, EMERGENCY_AUDIO_RESPONSE, b"RIFF emergency clip")
+    monkeypatch.setattr(main, "_follow_up_emergency", lambda user_text: None)
+
+    async def cached_answer(user_text):
+        raise AssertionError("emergencies must not consult the answer cache")
+
+    monkeypatch.setattr(answers, "lookup", cached_answer)
+    response = ask(client, monkeypatch, text)
+    assert response.content == b"RIFF emergency clip"
@@ -0,0 +1,105 @@
+import io
+import wave
+
+import numpy as np
+
+from audio import StreamEncoder, crossfade_join, decode_audio, decode_wav, encode_wav, negotiate_format
+
+
+def make_wav(samples: np.ndarray, sample_rate: int = 16000, channels: int = 1) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(samples.dtype.itemsize)
+        wf.setframerate(sample_rate)
+        wf.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+def test_decode_int16_wav():
+    """Test 16-bit PCM decodes to normalized float32"""
+    samples = np.array([0, 16384, -16384, 32767, -32768], dtype=np.int16)
+    audio = decode_wav(make_wav(samples))
+    assert audio.dtype == np.float32
+    np.testing.assert_allclose(audio, samples / 32768, atol=1e-6)
+
+def test_decode_input_wav_fixture():
+    """Test the repo's input.wav matches the wave module's reading"""
+    with open("input.wav", "rb") as f:
+        data = f.read()
+    with wave.open("input.wav") as wf:
+        expected = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16) / 32768
+    np.testing.assert_allclose(decode_wav(data), expected, atol=1e-6)
+
+def test_stereo_is_downmixed_and_resampled():
+    """Test stereo 8 kHz comes out mono at 16 kHz"""
+    stereo = np.tile(np.array([[1000, 3000]], dtype=np.int16), (8000, 1))
+    audio = decode_wav(make_wav(stereo, sample_rate=8000, channels=2))
+    assert len(audio) == 16000
+    np.testing.assert_allclose(audio, 2000 / 32768, atol=1e-6)
+
+def test_float32_wav_is_zero_copy():
+    """Test 16 kHz mono float WAV is a view over the upload bytes"""
+    samples = np.linspace(-1, 1, 160, dtype=np.float32)
+    data = make_wav(samples.view(np.int32))
+    # Patch the format tag from PCM (1) to IEEE float (3)
+    data = data[:20] + (3).to_bytes(2, "little") + data[22:]
+    audio = decode_wav(data)
+    assert not audio.flags.owndata
+    np.testing.assert_array_equal(audio, samples)
+
+def test_non_wav_falls_back():
+    """Test compressed uploads are left for the file-path decoder"""
+    assert decode_audio(b"ID3\x04\x00fake mp3", "audio/mpeg") is None
+
+def test_raw_pcm_content_type():
+    """Test headerless L16 uploads decode without a WAV header"""
+    audio = decode_audio(np.array([16384, -16384], dtype=np.int16).tobytes(), "audio/L16; rate=16000")
+    np.testing.assert_allclose(audio, [0.5, -0.5])
+
+def test_negotiate_format():
+    """Test Accept picks the highest-q format we can encode, defaulting to WAV"""
+    assert negotiate_format(None) == "wav"
+    assert negotiate_format("*/*") == "wav"
+    assert negotiate_format("audio/ogg; codecs=opus") == "ogg"
+    assert negotiate_format("audio/wav;q=0.5, audio/mpeg") == "mp3"
+    assert negotiate_format("audio/ogg;q=0.2, audio/wav;q=0.8") == "wav"
+
+def test_stream_encoder_opus_round_trip():
+    """Test Opus chunks encoded as they arrive decode to the whole reply"""
+    import soundfile
+
+    pcm = (np.sin(np.arange(22050 * 3) * 0.05) * 8000).astype(np.int16).tobytes()
+    encoder = StreamEncoder("ogg")
+    chunks = [encoder.feed(pcm[i:i + 22050], 22050) for i in range(0, len(pcm), 22050)]
+    encoded = b"".join(chunks) + encoder.close()
+
+    assert encoded[:4] == b"OggS" and chunks[0]
+    assert len(encoded) < len(pcm) / 5
+    audio, sample_rate = soundfile.read(io.BytesIO(encoded), dtype="int16")
+    assert sample_rate == 24000
+    assert abs(len(audio) / sample_rate - 3.0) < 0.05
+
+def test_stream_encoder_mp3_has_no_empty_header_frame():
+    """Test streamed MP3 starts with an audio frame, not a Xing frame left unfilled"""
+    pcm = (np.sin(np.arange(22050 * 2) * 0.05) * 8000).astype(np.int16).tobytes()
+    encoder = StreamEncoder("mp3")
+    encoded = encoder.feed(pcm, 22050) + encoder.close()
+    assert encoded[:2] == b"\xff\xf3"
+    assert b"Xing" not in encoded[:256] and b"Info" not in encoded[:256]
+
+def test_encode_wav_passes_wav_through():
+    """Test re-encoding a cached WAV as WAV returns it untouched"""
+    wav = make_wav(np.zeros(100, dtype=np.int16), 22050)
+    assert encode_wav(wav, "wav") == (wav, "audio/wav")
+    content, media_type = encode_wav(wav, "ogg")
+    assert content[:4] == b"OggS" and media_type.startswith("audio/ogg")
+
+def test_crossfade_join_overlaps_chunks():
+    """Test sentences are joined with a linear crossfade instead of a hard cut"""
+    first = np.full(100, 1000, dtype=np.int16).tobytes()
+    second = np.full(100, -1000, dtype=np.int16).tobytes()
+    joined = np.frombuffer(crossfade_join([first, second], 1000, crossfade_ms=10), dtype=np.int16)
+    assert len(joined) == 190
+    assert joined[89] == 1000 and joined[100] == -1000
+    assert np.all(np.diff(joined[89:101]) <= 0)
+    assert crossfade_join([first, second], 1000, crossfade_ms=0) == first + second
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import auth
+from cache import TieredCache
+from models import Base, User
+
+
+@pytest.fixture
+def user_cache(monkeypatch):
+    cache = TieredCache("auth-test", max_bytes=1 << 20, ttl=60)
+    cache.redis = None
+    monkeypatch.setattr(auth, "user_cache", cache)
+    return cache
+
+async def open_db(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        db.add(User(email="patient@example.com", hashed_password="x", full_name="Pat", phone="+1"))
+        await db.commit()
+    return engine, session_factory
+
+class NoDatabase:
+    async def execute(self, *args, **kwargs):
+        raise AssertionError("cache hit must not query the database")
+
+def test_user_lookup_is_cached_until_user_changes(tmp_path, user_cache):
+    """Test repeat requests skip the users query, and deactivating the user invalidates the entry"""
+    token = auth.create_access_token({"sub": "patient@example.com"})
+
+    async def scenario():
+        engine, session_factory = await open_db(tmp_path / "users.db")
+        async with session_factory() as db:
+            first = await auth.get_current_user(token, db)
+        second = await auth.get_current_user(token, NoDatabase())
+        assert (first.id, second.id) == (1, 1) and second.full_name == "Pat"
+        assert second.hashed_password is None
+
+        async with session_factory() as db:
+            user = await db.get(User, 1)
+            user.is_active = False
+            await db.commit()
+        assert user_cache.stats()["entries"] == 0
+        async with session_factory() as db:
+            with pytest.raises(HTTPException) as rejected:
+                await auth.get_current_user(token, db)
+        await engine.dispose()
+        return rejected.value.status_code
+
+    assert asyncio.run(scenario()) == 401
+
+def test_read_racing_a_commit_is_not_cached(tmp_path, user_cache):
+    """Test a user read just before a deactivation commits isn't cached, and bulk updates invalidate too"""
+    token = auth.create_access_token({"sub": "patient@example.com"})
+
+    class RacingDatabase:
+        # The deactivation commits after the users query ran, before its row is cached
+        def __init__(self, db, session_factory):
+            self.db, self.session_factory = db, session_factory
+
+        async def execute(self, *args, **kwargs):
+            result = await self.db.execute(*args, **kwargs)
+            async with self.session_factory() as other:
+                (await other.get(User, 1)).is_active = False
+                await other.commit()
+            return result
+
+    async def scenario():
+        engine, session_factory = await open_db(tmp_path / "users.db")
+        async with session_factory() as db:
+            raced = await auth.get_current_user(token, RacingDatabase(db, session_factory))
+        entries_after_race = user_cache.stats()["entries"]
+        async with session_factory() as db:
+            with pytest.raises(HTTPException):
+                await auth.get_current_user(token, db)
+
+        async with session_factory() as db:
+            await db.execute(update(User).values(is_active=True))
+            await db.commit()
+            cached_before_bulk = user_cache.stats()["entries"]
+            await auth.get_current_user(token, db)
+            await db.execute(update(User).values(is_active=False))
+            await db.commit()
+        entries_after_bulk = user_cache.stats()["entries"]
+        await engine.dispose()
+        return raced, entries_after_race, cached_before_bulk, entries_after_bulk
+
+    raced, entries_after_race, cached_before_bulk, entries_after_bulk = asyncio.run(scenario())
+    assert raced.is_active and entries_after_race == 0
+    assert cached_before_bulk == 0 and entries_after_bulk == 0
+
+def test_password_check_runs_off_event_loop(tmp_path, user_cache, monkeypatch):
+    """Test login verifies the password on the bcrypt pool and caches the user for the next request"""
+    checked_on = []
+
+    def fake_verify(plain, hashed):
+        checked_on.append(threading.current_thread().name)
+        return plain == "secret"
+
+    monkeypatch.setattr(auth, "verify_password", fake_verify)
+
+    async def scenario():
+        engine, session_factory = await open_db(tmp_path / "users.db")
+        async with session_factory() as db:
+            wrong = await auth.aauthenticate_user(db, "patient@example.com", "guess")
+            right = await auth.aauthenticate_user(db, "patient@example.com", "secret")
+        await engine.dispose()
+        return wrong, right
+
+    wrong, right = asyncio.run(scenario())
+    assert wrong is False and right.email == "patient@example.com"
+    assert all(name.startswith("bcrypt") for name in checked_on) and len(checked_on) == 2
+    assert user_cache.stats()["entries"] == 1
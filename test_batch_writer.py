@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import database
+from batch_writer import BatchWriter
+from models import Base, HealthLog
+
+
+def row(n):
+    return {"user_id": None, "log_type": "voice_interaction", "data": {"turn": n}, "created_at": datetime.utcnow()}
+
+async def open_db(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return engine, async_sessionmaker(engine, expire_on_commit=False), statements
+
+async def stored(session_factory):
+    async with session_factory() as db:
+        return (await db.execute(select(func.count()).select_from(HealthLog))).scalar()
+
+def test_async_url_picks_async_driver():
+    """Test the async engine uses asyncpg for Postgres and aiosqlite for SQLite"""
+    assert database.async_url("postgresql://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert database.async_url("postgresql+psycopg2://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert database.async_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    assert database.engine_options("sqlite://") == {}
+    assert database.engine_options("postgresql://db/app")["pool_pre_ping"] is True
+
+def test_full_batches_are_written_as_multi_row_inserts(tmp_path):
+    """Test reaching the batch size flushes right away, one INSERT per batch"""
+    async def scenario():
+        engine, session_factory, statements = await open_db(tmp_path / "logs.db")
+        writer = BatchWriter(HealthLog, batch_size=3, flush_seconds=60, session_factory=session_factory)
+        writer.start()
+        for n in range(7):
+            writer.add(row(n))
+        statements.clear()
+        await asyncio.sleep(0.2)
+        inserts = [s for s in statements if s.startswith("INSERT")]
+        count = await stored(session_factory)
+        await writer.close()
+        await engine.dispose()
+        return inserts, count, writer
+
+    inserts, count, writer = asyncio.run(scenario())
+    assert count == 7 and writer.written == 7
+    assert len(inserts) == 3
+
+def test_partial_batch_is_written_after_interval(tmp_path):
+    """Test a lone row still reaches the database within the flush interval"""
+    async def scenario():
+        engine, session_factory, _ = await open_db(tmp_path / "logs.db")
+        writer = BatchWriter(HealthLog, batch_size=100, flush_seconds=0.05, session_factory=session_factory)
+        writer.start()
+        writer.add(row(0))
+        assert await stored(session_factory) == 0
+        await asyncio.sleep(0.3)
+        count = await stored(session_factory)
+        await writer.close()
+        await engine.dispose()
+        return count
+
+    assert asyncio.run(scenario()) == 1
+
+def test_failed_rows_are_retried_and_bounded(tmp_path):
+    """Test rows survive a failed flush, and the buffer drops the oldest past its limit"""
+    def broken():
+        raise RuntimeError("database down")
+
+    async def scenario():
+        engine, session_factory, _ = await open_db(tmp_path / "logs.db")
+        writer = BatchWriter(HealthLog, batch_size=2, max_buffer=5, session_factory=broken)
+        for n in range(8):
+            writer.add(row(n))
+        await writer.flush()
+        assert writer.failures == 1 and writer.buffered == 5 and writer.dropped == 3
+
+        writer.session_factory = session_factory
+        await writer.close()
+        async with session_factory() as db:
+            turns = (await db.execute(select(HealthLog.data))).scalars().all()
+        await engine.dispose()
+        return turns, writer
+
+    turns, writer = asyncio.run(scenario())
+    assert [t["turn"] for t in turns] == [3, 4, 5, 6, 7]
+    assert writer.written == 5 and writer.buffered == 0
+
+def test_rejected_row_does_not_block_the_rest(tmp_path):
+    """Test a row the database rejects is dropped on its own and the rows around it are written"""
+    async def scenario():
+        engine, session_factory, _ = await open_db(tmp_path / "logs.db")
+        writer = BatchWriter(HealthLog, batch_size=4, session_factory=session_factory)
+        for n in range(9):
+            writer.add(row(n))
+        writer.add({**row(9), "data": {"turn": {9}}})  # a set won't serialize to JSON
+        writer.add(row(10))
+        await writer.flush()
+        async with session_factory() as db:
+            turns = (await db.execute(select(HealthLog.data))).scalars().all()
+        await engine.dispose()
+        return turns, writer
+
+    turns, writer = asyncio.run(scenario())
+    assert sorted(t["turn"] for t in turns) == [0, 1, 2, 3, 4, 5, 6, 7, 8, 10]
+    assert writer.rejected == 1 and writer.buffered == 0 and writer.written == 10
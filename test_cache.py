@@ -0,0 +1,116 @@
+import asyncio
+
+import tts
+from cache import TieredCache, content_key, normalize_text
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def scan_iter(self, match, count=None):
+        return [key for key in list(self.data) if key.startswith(match.rstrip("*"))]
+
+class BrokenRedis:
+    def get(self, key):
+        raise ConnectionError("redis is down")
+
+    setex = get
+
+def test_key_ignores_whitespace_differences():
+    """Test equivalent text maps to the same content key"""
+    assert content_key(normalize_text("  Stay\n hydrated. "), "voice", "piper", 22050) == \
+        content_key(normalize_text("Stay hydrated."), "voice", "piper", 22050)
+    assert content_key("Stay hydrated.", "voice", "piper", 22050) != \
+        content_key("Stay hydrated.", "voice", "elevenlabs", 22050)
+
+def test_lru_evicts_by_byte_budget():
+    """Test least recently used entries go first once over budget"""
+    cache = TieredCache("test", max_bytes=400, ttl=60, redis_client=FakeRedis())
+    cache.redis = None
+    cache.set("a", b"x" * 100)
+    cache.set("b", b"x" * 100)
+    cache.set("c", b"x" * 100)
+    cache.get("a")
+    cache.set("d", b"x" * 100)
+    cache.set("e", b"x" * 100)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.bytes <= 400
+    assert cache.evictions == 1
+
+def test_redis_tier_refills_memory():
+    """Test a memory miss is served from Redis and promoted"""
+    redis = FakeRedis()
+    writer = TieredCache("test", max_bytes=1000, ttl=60, redis_client=redis)
+    writer.set("k", b"audio")
+
+    reader = TieredCache("test", max_bytes=1000, ttl=60, redis_client=redis)
+    assert reader.get("k") == b"audio"
+    assert reader.get("k") == b"audio"
+    assert (reader.redis_hits, reader.memory_hits) == (1, 1)
+
+def test_ttl_expires_memory_entries():
+    """Test expired entries are not served"""
+    cache = TieredCache("test", max_bytes=1000, ttl=60)
+    cache.redis = None
+    cache.set("k", b"audio", ttl=-1)
+    assert cache.get("k") is None
+
+def test_broken_redis_degrades_to_memory():
+    """Test Redis errors fall back to memory-only caching"""
+    cache = TieredCache("test", max_bytes=1000, ttl=60, redis_client=BrokenRedis())
+    cache.set("k", b"audio")
+    assert cache.get("k") == b"audio"
+    assert cache.get("missing") is None
+
+def test_delete_soon_hides_key_until_redis_delete_finishes():
+    """Test a key deleted from the event loop reads as a miss, and can't be re-cached, until Redis forgets it"""
+    redis = FakeRedis()
+    cache = TieredCache("test", max_bytes=1 << 20, ttl=60, redis_client=redis)
+
+    async def scenario():
+        cache.set("user", b"old")
+        cache.set("other", b"x")
+        read_at = cache.deletions
+        cache.delete_soon("user")
+        during = await cache.aget("user")
+        await cache.aset("user", b"stale", unless_deleted_since=read_at)
+        await asyncio.gather(*cache._background)
+        after = (await cache.aget("user"), await cache.aget("other"))
+        cache.delete_soon()
+        await asyncio.gather(*cache._background)
+        return during, after
+
+    during, after = asyncio.run(scenario())
+    assert during is None and after == (None, b"x")
+    assert redis.data == {}
+
+def test_text_to_speech_hits_cache(monkeypatch):
+    """Test repeated replies are synthesized once"""
+    calls = []
+
+    def fake_piper(text):
+        calls.append(text)
+        return b"RIFF fake wav"
+
+    monkeypatch.setattr(tts, "USE_ELEVENLABS", False)
+    monkeypatch.setattr(tts, "text_to_speech_piper", fake_piper)
+    monkeypatch.setattr(tts, "audio_cache", TieredCache("tts-test", max_bytes=1000, ttl=60, redis_client=FakeRedis()))
+
+    async def speak_twice():
+        return [await tts.text_to_speech("Sorry, I didn't understand that.") for _ in range(2)]
+
+    assert asyncio.run(speak_twice()) == [b"RIFF fake wav"] * 2
+    assert calls == ["Sorry, I didn't understand that."]
+    assert tts.cache_stats()["memory_hits"] == 1
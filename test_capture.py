@@ -0,0 +1,69 @@
+import wave
+
+import numpy as np
+
+from capture import WavFileSource
+from vad import SAMPLE_RATE, EnergyEndpointer, RingBuffer
+
+
+def tone(seconds, amplitude=0.3):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+def noise(seconds, level=0.03, seed=0):
+    return (np.random.default_rng(seed).standard_normal(int(seconds * SAMPLE_RATE)) * level).astype(np.float32)
+
+def write_wav(path, audio):
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes((audio * 32767).astype("<i2").tobytes())
+
+def test_ring_buffer_wraps_and_drops_oldest():
+    """Test the ring hands out samples in order across the wrap and overwrites unread ones when full"""
+    ring = RingBuffer(5)
+    ring.write(np.arange(3, dtype=np.float32))
+    assert ring.read(2).tolist() == [0, 1]
+    ring.write(np.arange(3, 7, dtype=np.float32))
+    assert ring.read().tolist() == [2, 3, 4, 5, 6]
+    ring.write(np.arange(7, 15, dtype=np.float32))
+    assert ring.overruns == 3
+    assert ring.read().tolist() == [10, 11, 12, 13, 14]
+    assert ring.last(2).tolist() == [13, 14]
+
+def test_turn_ends_within_hangover(tmp_path):
+    """Test a turn ends a few hundred ms after speech stops, not seconds later"""
+    path = tmp_path / "turn.wav"
+    write_wav(path, np.concatenate([np.zeros(SAMPLE_RATE // 2, np.float32), tone(1.0), np.zeros(5 * SAMPLE_RATE, np.float32)]))
+
+    endpointer = EnergyEndpointer(silence_ms=300)
+    heard = 0
+    for block in WavFileSource(str(path)):
+        heard += len(block)
+        if any(event == "end" for event, _ in endpointer.feed(block)):
+            break
+    speech_end = 1.5 * SAMPLE_RATE
+    assert speech_end < heard <= speech_end + 0.4 * SAMPLE_RATE
+
+def test_steady_noise_is_not_speech():
+    """Test background noise above the fixed threshold is learned as the floor, and speech over it still ends"""
+    endpointer = EnergyEndpointer(silence_ms=300)
+    audio = np.concatenate([noise(1.0), tone(0.5) + noise(0.5, seed=1), noise(1.0, seed=2)])
+
+    events = []
+    for i in range(0, len(audio), 480):
+        events.extend(endpointer.feed(audio[i:i + 480]))
+
+    assert [event for event, _ in events] == ["start", "end"]
+    assert 0.5 * SAMPLE_RATE <= len(events[1][1]) <= 1.1 * SAMPLE_RATE
+
+def test_speech_from_the_first_frame_is_not_learned_as_noise():
+    """Test a user who talks straight away is still heard, in one chunk or in mic blocks"""
+    audio = np.concatenate([tone(0.8), np.zeros(SAMPLE_RATE, np.float32)])
+    for block in (len(audio), 480):
+        endpointer = EnergyEndpointer(silence_ms=300)
+        events = []
+        for i in range(0, len(audio), block):
+            events.extend(endpointer.feed(audio[i:i + block]))
+        assert [event for event, _ in events] == ["start", "end"]
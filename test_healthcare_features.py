@@ -1,5 +1,5 @@
 import pytest
-from prompts import get_urgency_assessment, HEALTHCARE_DISCLAIMER, EMERGENCY_KEYWORDS
+from prompts import get_urgency_assessment, urgency_stream, HEALTHCARE_DISCLAIMER, EMERGENCY_KEYWORDS
 from main import get_user_context, log_health_interaction
 from models import User, HealthLog
 from database import get_db
@@ -29,6 +29,62 @@ def test_urgency_assessment():
     medium_result = get_urgency_assessment("I have persistent vomiting")
     assert medium_result["level"] == "medium"
 
+def test_urgency_word_boundaries():
+    """Test keywords only match whole words"""
+    assert get_urgency_assessment("I had heatstroke last summer")["level"] == "low"
+    assert get_urgency_assessment("I think I am having a stroke")["level"] == "emergency"
+    assert get_urgency_assessment("My CHEST  PAIN is back")["level"] == "emergency"
+    assert get_urgency_assessment("I cant breathe properly")["level"] == "emergency"
+    assert get_urgency_assessment("I can’t breathe")["level"] == "emergency"
+
+def test_urgency_inflected_keywords():
+    """Test plurals and other word forms of keywords still escalate"""
+    assert get_urgency_assessment("I keep having seizures")["level"] == "emergency"
+    assert get_urgency_assessment("I have chest pains")["level"] == "emergency"
+    assert get_urgency_assessment("he had two strokes")["level"] == "emergency"
+
+def test_urgency_negation():
+    """Test negated symptoms do not escalate"""
+    assert get_urgency_assessment("No chest pain, just a mild cough")["level"] == "low"
+    assert get_urgency_assessment("I don't have a high fever")["level"] == "low"
+    assert get_urgency_assessment("The cough is not worsening")["level"] == "low"
+    # Negation ends at the clause boundary
+    assert get_urgency_assessment("No fever, but I have chest pain")["level"] == "emergency"
+    assert get_urgency_assessment("no headache but severe bleeding")["level"] == "emergency"
+    assert get_urgency_assessment("She is not responsive and unconscious")["level"] == "emergency"
+    # Only a negation right before the symptom counts, and questions never negate
+    assert get_urgency_assessment("I have never had chest pain like this before")["level"] == "emergency"
+    assert get_urgency_assessment("I never felt such chest pain")["level"] == "emergency"
+    assert get_urgency_assessment("there is no way this isnt a heart attack")["level"] == "emergency"
+    assert get_urgency_assessment("Is this not a stroke?")["level"] == "emergency"
+
+def test_urgency_precedence():
+    """Test emergency keywords win over medium indicators"""
+    assert get_urgency_assessment("persistent vomiting and fainting")["level"] == "emergency"
+    assert get_urgency_assessment("high fever since yesterday")["level"] == "emergency"
+
+def test_streaming_urgency_fires_on_partials():
+    """Test escalation fires before the utterance is finished"""
+    stream = urgency_stream()
+    assert stream.feed("My husband says he has") == "low"
+    assert stream.feed("really bad chest", final=False) == "low"
+    assert stream.feed("really bad chest pain", final=False) == "emergency"
+    assert stream.escalated
+    assert stream.keyword == "chest pain"
+
+def test_streaming_urgency_across_segments():
+    """Test a keyword split across final segments is still found"""
+    stream = urgency_stream()
+    stream.feed("Since this morning I have had shortness")
+    assert stream.feed("of breath when walking") == "emergency"
+
+def test_streaming_urgency_respects_negation_context():
+    """Test negation in an earlier segment applies to the next one"""
+    stream = urgency_stream()
+    stream.feed("I do not have")
+    assert stream.feed("chest pain, only a sore throat") == "low"
+    assert stream.feed("and it is getting worse, persistent really") == "medium"
+
 def test_healthcare_disclaimer():
     """Test that disclaimer is always present"""
     assert "not a doctor" in HEALTHCARE_DISCLAIMER.lower()
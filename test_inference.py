@@ -0,0 +1,97 @@
+import asyncio
+import threading
+
+import pytest
+
+from inference import (
+    InferencePool, QueueFull, AdmissionTimeout, PRIORITY_EMERGENCY, PRIORITY_NORMAL
+)
+
+
+async def hold_worker(pool, release: threading.Event):
+    """Occupy a worker until release is set"""
+    return await pool.run(release.wait)
+
+def test_queue_full_rejects_fast():
+    """Test requests beyond the admission queue are rejected immediately"""
+    async def scenario():
+        pool = InferencePool(workers=1, queue_size=1, max_wait=5)
+        release = threading.Event()
+        running = asyncio.create_task(hold_worker(pool, release))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.create_task(pool.run(lambda: "queued"))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(QueueFull):
+            await pool.run(lambda: "rejected")
+
+        release.set()
+        assert await waiting == "queued"
+        await running
+        pool.shutdown()
+
+    asyncio.run(scenario())
+
+def test_admission_timeout():
+    """Test waiting longer than max_wait is rejected with 503"""
+    async def scenario():
+        pool = InferencePool(workers=1, queue_size=4, max_wait=0.05)
+        release = threading.Event()
+        running = asyncio.create_task(hold_worker(pool, release))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(AdmissionTimeout) as exc:
+            await pool.run(lambda: None)
+        assert exc.value.status_code == 503
+        assert pool.queued == 0
+
+        release.set()
+        await running
+        pool.shutdown()
+
+    asyncio.run(scenario())
+
+def test_emergency_jumps_queue():
+    """Test emergency work runs before earlier normal work, even with a full queue"""
+    async def scenario():
+        pool = InferencePool(workers=1, queue_size=1, max_wait=5)
+        release = threading.Event()
+        order = []
+        running = asyncio.create_task(hold_worker(pool, release))
+        await asyncio.sleep(0.01)
+
+        normal = asyncio.create_task(pool.run(order.append, "normal", priority=PRIORITY_NORMAL))
+        await asyncio.sleep(0.01)
+        emergency = asyncio.create_task(pool.run(order.append, "emergency", priority=PRIORITY_EMERGENCY))
+        await asyncio.sleep(0.01)
+
+        release.set()
+        await asyncio.gather(running, normal, emergency)
+        assert order == ["emergency", "normal"]
+        assert pool.running == 0
+        pool.shutdown()
+
+    asyncio.run(scenario())
+
+def test_cancelled_caller_keeps_slot_until_job_finishes():
+    """Test a cancelled run holds its worker until the thread is actually done"""
+    async def scenario():
+        pool = InferencePool(workers=1, queue_size=4, max_wait=5)
+        release = threading.Event()
+        running = asyncio.create_task(hold_worker(pool, release))
+        await asyncio.sleep(0.01)
+        running.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await running
+        assert pool.running == 1
+
+        waiting = asyncio.create_task(pool.run(lambda: "next"))
+        await asyncio.sleep(0.01)
+        assert not waiting.done() and pool.queued == 1
+
+        release.set()
+        assert await waiting == "next"
+        assert pool.running == 0
+        pool.shutdown()
+
+    asyncio.run(scenario())
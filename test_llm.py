@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import llm
+
+
+def use_transport(monkeypatch, handler):
+    """Route the pooled client through an in-process handler"""
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm, "get_client", lambda: client)
+    monkeypatch.setattr(llm, "LLM_RETRY_BACKOFF", 0.0)
+
+def test_generate_retries_server_errors(monkeypatch):
+    """Test transient 5xx responses are retried"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"response": "Drink water.", "done": True})
+
+    use_transport(monkeypatch, handler)
+    assert asyncio.run(llm.generate("hi", retries=2)) == "Drink water."
+    assert len(calls) == 3
+
+def test_generate_does_not_retry_client_errors(monkeypatch):
+    """Test 4xx responses fail immediately"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(404)
+
+    use_transport(monkeypatch, handler)
+    with pytest.raises(llm.LLMError):
+        asyncio.run(llm.generate("hi", retries=2))
+    assert len(calls) == 1
+
+def test_generate_deadline(monkeypatch):
+    """Test the per-call deadline covers a slow Ollama"""
+    async def handler(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200, json={"response": "late"})
+
+    use_transport(monkeypatch, handler)
+    with pytest.raises(llm.LLMTimeout):
+        asyncio.run(llm.generate("hi", timeout=0.05))
+
+def test_stream_tokens(monkeypatch):
+    """Test NDJSON tokens are yielded in order"""
+    lines = [{"response": "Stay", "done": False}, {"response": " hydrated.", "done": False}, {"response": "", "done": True}]
+    body = b"".join(json.dumps(line).encode() + b"\n" for line in lines)
+    use_transport(monkeypatch, lambda request: httpx.Response(200, content=body))
+
+    async def collect():
+        return [token async for token in llm.stream_tokens("hi")]
+
+    assert asyncio.run(collect()) == ["Stay", " hydrated."]
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import metrics
+import tts
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Test histogram output follows the Prometheus text format"""
+    histogram = metrics.Histogram("test_seconds", "Test", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, stage="stt", backend="whisper")
+
+    lines = histogram.render()
+    assert "# TYPE test_seconds histogram" in lines
+    assert 'test_seconds_bucket{backend="whisper",stage="stt",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{backend="whisper",stage="stt",le="1"} 3' in lines
+    assert 'test_seconds_bucket{backend="whisper",stage="stt",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{backend="whisper",stage="stt"} 4' in lines
+
+def test_timed_records_outcome():
+    """Test failed and cancelled stages are counted separately from successes"""
+    with metrics.timed("test_ok"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.timed("test_fail"):
+            raise ValueError
+
+    async def cancelled():
+        with metrics.timed("test_cancel"):
+            await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.create_task(cancelled())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert metrics.stage_total.value(stage="test_ok", outcome="ok") == 1
+    assert metrics.stage_total.value(stage="test_fail", outcome="error") == 1
+    assert metrics.stage_total.value(stage="test_cancel", outcome="cancelled") == 1
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "verify_key", lambda key: True)
+    monkeypatch.setattr(tts, "prewarm", lambda texts: _noop())
+    with TestClient(main.app) as client:
+        yield client
+
+async def _noop():
+    return None
+
+def test_voice_chat_stages_exposed_on_metrics(client, monkeypatch):
+    """Test a /voice-chat request shows up per stage on /metrics"""
+    async def fake_transcribe(*args, **kwargs):
+        return "How much water should I drink?"
+
+    async def fake_generate(prompt, **kwargs):
+        return "About eight glasses a day."
+
+    async def fake_tts(text, **kwargs):
+        return b"audio"
+
+    monkeypatch.setattr(main, "transcribe_upload", fake_transcribe)
+    monkeypatch.setattr(main.llm, "generate", fake_generate)
+    monkeypatch.setattr(main, "text_to_speech", fake_tts)
+
+    before = metrics.stage_seconds.count(stage="response_write", endpoint="/voice-chat")
+    with open("input.wav", "rb") as f:
+        response = client.post("/voice-chat", headers={"x-api-key": "test"}, files={"audio_file": f})
+    assert response.status_code == 200
+
+    body = client.get("/metrics").text
+    assert 'voice_stage_seconds_count{stage="upload_read"}' in body
+    assert 'voice_stage_total{outcome="ok",stage="urgency"}' in body
+    assert "inference_queued 0" in body
+    assert metrics.stage_seconds.count(stage="response_write", endpoint="/voice-chat") == before + 1
+
+def test_health_reports_readiness(client, monkeypatch):
+    """Test /health is 503 until models are loaded and warmed, 200 once they are"""
+    deadline = time.monotonic() + 5
+    while not main.app.state.models_warm and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert main.app.state.models_warm
+
+    monkeypatch.setattr(main.app.state, "models_warm", False)
+    monkeypatch.setattr(main.stt, "model", object())
+    monkeypatch.setattr(tts, "PIPER_AVAILABLE", True)
+    response = client.get("/health")
+    assert response.status_code == 503
+    assert response.json()["checks"]["models_warm"] is False
+
+    monkeypatch.setattr(main.app.state, "models_warm", True)
+    monkeypatch.setattr(main.stt, "model", None)
+    response = client.get("/health")
+    assert response.status_code == 503
+    assert response.json()["checks"]["stt_model_loaded"] is False
+
+    monkeypatch.setattr(main.stt, "model", object())
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["status"] == "healthy"
+    assert response.json()["inference"]["queued"] == 0
+
+def test_failed_warm_up_stays_unready(monkeypatch):
+    """Test a model that fails to load keeps /health at 503 with the error"""
+    def broken_warm_up():
+        raise RuntimeError("model file missing")
+
+    monkeypatch.setattr(main.stt, "warm_up", broken_warm_up)
+    monkeypatch.setattr(main.stt, "model", object())
+    monkeypatch.setattr(tts, "prewarm", lambda texts: _noop())
+    with TestClient(main.app) as client:
+        deadline = time.monotonic() + 5
+        while main.app.state.warm_up_error is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        response = client.get("/health")
+
+    assert response.status_code == 503
+    assert response.json()["warm_up_error"] == "model file missing"
@@ -0,0 +1,101 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import inference
+import model_client
+import model_server
+import stt
+import tts
+
+
+@pytest.fixture
+def socket_path(tmp_path, monkeypatch):
+    """model_server listening on a temp socket with fake Whisper/Piper"""
+    monkeypatch.setattr(stt, "speech_to_text", lambda audio: f"{len(audio)} samples")
+    monkeypatch.setattr(tts, "PIPER_AVAILABLE", True)
+    monkeypatch.setattr(tts, "piper_pcm_chunks", lambda text: iter([(b"\x01\x00" * len(text), 22050)]))
+    monkeypatch.setattr(stt, "warm_up", lambda: None)
+    monkeypatch.setattr(tts, "warm_up", lambda: None)
+    monkeypatch.setattr(inference.pool, "shutdown", lambda: None)
+    monkeypatch.setitem(model_server.state, "warm", False)
+    return str(tmp_path / "models.sock")
+
+
+async def _with_server(path, client):
+    server = asyncio.create_task(model_server.serve(path))
+    try:
+        for _ in range(100):
+            try:
+                reader, writer = await asyncio.open_unix_connection(path)
+                break
+            except OSError:
+                await asyncio.sleep(0.01)
+        writer.close()
+        return await client()
+    finally:
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+
+
+async def _call(path, header, payload=b""):
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(model_client.encode_message(header, payload))
+    await writer.drain()
+    reply = await model_client.read_message(reader)
+    writer.close()
+    return reply
+
+
+def test_server_round_trips_transcribe_and_synthesize(socket_path):
+    """Test audio and text cross the socket intact and health reports warm-up"""
+    async def client():
+        audio = np.zeros(16000, dtype=np.float32)
+        transcript, _ = await _call(socket_path, {"op": "transcribe"}, audio.tobytes())
+        speech, pcm = await _call(socket_path, {"op": "synthesize_pcm", "text": "Hello"})
+        for _ in range(100):
+            health, _ = await _call(socket_path, {"op": "health"})
+            if health["warm"]:
+                break
+            await asyncio.sleep(0.01)
+        unknown, _ = await _call(socket_path, {"op": "nope"})
+        return transcript, speech, pcm, health, unknown
+
+    transcript, speech, pcm, health, unknown = asyncio.run(_with_server(socket_path, client))
+    assert transcript == {"ok": True, "text": "16000 samples"}
+    assert speech == {"ok": True, "sample_rate": 22050}
+    assert pcm == b"\x01\x00" * 5
+    assert health["warm"] and health["queued"] == 0
+    assert unknown["ok"] is False and unknown["status"] == 500
+
+
+def test_client_maps_server_errors(tmp_path, monkeypatch):
+    """Test rejections keep their HTTP meaning on the client side, and a missing server is a 503"""
+    path = str(tmp_path / "fake.sock")
+    monkeypatch.setattr(model_client, "SOCKET_PATH", path)
+
+    async def handle(reader, writer):
+        header, _ = await model_client.read_message(reader)
+        replies = {
+            "transcribe": {"ok": False, "status": 429, "error": "queue full", "retry_after": 2},
+            "synthesize": {"ok": False, "status": 500, "error": "boom"}
+        }
+        writer.write(model_client.encode_message(replies[header["op"]]))
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        with pytest.raises(inference.InferenceRejected):
+            await model_client.health()
+
+        server = await asyncio.start_unix_server(handle, path=path)
+        async with server:
+            with pytest.raises(inference.QueueFull) as rejected:
+                await model_client.transcribe(np.zeros(10, dtype=np.float32))
+            assert rejected.value.retry_after == 2
+            with pytest.raises(model_client.ModelServerError, match="boom"):
+                await model_client.synthesize("Hi")
+        await model_client.aclose()
+
+    asyncio.run(run())
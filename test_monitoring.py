@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import monitoring
+from batch_writer import BatchWriter
+from models import Base, HealthLog, HealthMetric, HealthMetricRollup, User
+
+NOW = datetime(2024, 3, 10, 9, 30)
+
+
+def reading(minutes_ago, **data):
+    return {"user_id": 1, "log_type": "daily_check", "data": data, "created_at": NOW - timedelta(minutes=minutes_ago)}
+
+async def open_db(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        db.add(User(email="patient@example.com", hashed_password="x"))
+        await db.commit()
+    return engine, session_factory
+
+def test_extract_metrics():
+    """Test numbers, numeric strings and blood pressures become readings; text and flags don't"""
+    data = {"heart_rate": 72, "weight": "81.5", "blood_pressure": "140/90 mmHg", "mood": "tired", "dosage": "100mg", "fasting": True}
+    assert monitoring.extract_metrics(data) == {
+        "heart_rate": 72.0, "weight": 81.5, "blood_pressure_systolic": 140.0, "blood_pressure_diastolic": 90.0
+    }
+
+def test_rollups_follow_batched_writes(tmp_path):
+    """Test readings written in separate batches accumulate into the same hourly and daily buckets"""
+    async def scenario():
+        engine, session_factory = await open_db(tmp_path / "monitoring.db")
+        writer = BatchWriter(HealthLog, session_factory=session_factory, derived=monitoring.derived_statements)
+        writer.add(reading(20, heart_rate=70))
+        writer.add(reading(10, heart_rate=130, blood_pressure="120/80"))
+        await writer.flush()
+        writer.add(reading(0, heart_rate=80))
+        writer.add(reading(24 * 60, heart_rate=60))
+        await writer.flush()
+
+        async with session_factory() as db:
+            hourly = await monitoring.rollups(db, 1, "heart_rate", "hour")
+            trend = await monitoring.trend(db, 1, "heart_rate", days=7, now=NOW)
+            alerts = await monitoring.check_thresholds(db, 1, now=NOW)
+            readings = len((await db.execute(HealthMetric.__table__.select())).all())
+        await engine.dispose()
+        return hourly, trend, alerts, readings
+
+    hourly, trend, alerts, readings = asyncio.run(scenario())
+    assert readings == 6
+    assert [(r.count, r.min, r.max) for r in hourly] == [(1, 60, 60), (3, 70, 130)]
+    assert [(p["date"], p["avg"], p["count"]) for p in trend["days"]] == [("2024-03-09", 60, 1), ("2024-03-10", 93.33, 3)]
+    assert trend["change"] == 33.33
+    assert alerts == [{"metric": "heart_rate", "value": 130, "limit": 120, "direction": "high"}]
+
+def test_orm_writes_update_rollups(db):
+    """Test logs added through a regular session are rolled up too"""
+    db.add(User(id=1, email="patient@example.com"))
+    db.add(HealthLog(user_id=1, log_type="daily_check", data={"blood_sugar": 65}, created_at=NOW))
+    db.add(HealthLog(user_id=1, log_type="daily_check", data={"blood_sugar": 110}, created_at=NOW))
+    db.commit()
+
+    daily = db.query(HealthMetricRollup).filter_by(user_id=1, metric="blood_sugar", period="day").one()
+    assert (daily.count, daily.total, daily.min, daily.max) == (2, 175, 65, 110)
@@ -0,0 +1,192 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import reminders
+from models import Appointment, Base, Medication, User
+from reminders import ReminderScheduler, Schedule, SimulatedClock, next_fire, parse_reminder_times
+from tasks import ReminderWorker, sweep_appointments
+
+START = datetime(2024, 3, 9, 12, 0, tzinfo=timezone.utc)
+
+
+def schedule(times, zone="UTC", start=None, end=None):
+    return Schedule(parse_reminder_times(times), zone, start, end)
+
+def test_next_fire_across_zones_dst_and_course_end():
+    """Test reminder times are local wall-clock times, through a DST change and up to the course end"""
+    with pytest.raises(ValueError):
+        parse_reminder_times("8am")
+    assert parse_reminder_times(" 20:00,08:00, 08:00") == parse_reminder_times("08:00,20:00")
+
+    new_york = schedule("08:00,21:00", "America/New_York", end=datetime(2024, 3, 10, 12, 0))
+    # 08:00 and 21:00 EST, then 08:00 EDT the morning clocks go forward, then the course ends
+    fires = [next_fire(new_york, START)]
+    while fires[-1] is not None:
+        fires.append(next_fire(new_york, fires[-1]))
+    assert [(fire.day, fire.hour) for fire in fires[:-1]] == [(9, 13), (10, 2), (10, 12)]
+    assert next_fire(schedule("09:00", start=datetime(2024, 4, 1)), START) == datetime(2024, 4, 1, 9, tzinfo=timezone.utc)
+
+def test_scheduler_pops_in_order_and_applies_changes():
+    """Test due reminders come out earliest first, rescheduled, with changes and removals applied"""
+    scheduler = ReminderScheduler()
+    scheduler.load([(1, schedule("13:00"), None), (2, schedule("12:30"), None), (3, schedule("14:00"), None)], START)
+    scheduler.reschedule(3, schedule("12:15"), START)
+    scheduler.remove(2)
+
+    due, missed = scheduler.pop_due(START + timedelta(hours=1))
+    assert [(r.medication_id, r.fire_at.hour, r.fire_at.minute) for r in due] == [(3, 12, 15), (1, 13, 0)]
+    assert due[0].next_fire_at == datetime(2024, 3, 10, 12, 15, tzinfo=timezone.utc)
+    assert missed == [] and len(scheduler) == 2
+
+    # Over an hour past the 12:15 reminder: skipped, not sent
+    due, missed = scheduler.pop_due(datetime(2024, 3, 10, 13, 30, tzinfo=timezone.utc), max_late=3600)
+    assert [r.medication_id for r in due] == [1]
+    assert [r.medication_id for r in missed] == [3]
+    assert scheduler.next_fire_at() == datetime(2024, 3, 11, 12, 15, tzinfo=timezone.utc)
+
+def test_worker_over_a_simulated_day(tmp_path, monkeypatch):
+    """Test the worker sends each reminder once, stores the next ones and follows schedule changes"""
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'reminders.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        clock = SimulatedClock(START)
+        monkeypatch.setattr(reminders, "clock", clock)
+        async with session_factory() as db:
+            db.add(User(id=1, email="patient@example.com", phone="+15550001"))
+            db.add(Medication(id=1, user_id=1, name="Metformin", dosage="500mg", reminder_time="08:00,20:00"))
+            db.add(Medication(id=2, user_id=1, name="Lisinopril", reminder_time="09:00", reminder_timezone="Europe/Paris"))
+            db.add(Medication(id=3, user_id=1, name="Vitamin D", reminder_time=""))
+            await db.commit()
+
+        sent = []
+
+        async def send(messages):
+            sent.extend((clock.now(), m["to"], m["body"]) for m in messages)
+            return []
+
+        worker = ReminderWorker(session_factory, send=send, clock=clock, batch_size=1)
+        await worker.run(until=START + timedelta(days=1))
+        first_day = list(sent)
+
+        # Evening dose moves earlier; the worker hears about it and uses the new time
+        async with session_factory() as db:
+            medication = await db.get(Medication, 1)
+            medication.reminder_time = "08:00,18:00"
+            await db.commit()
+        worker.medications_changed([1])
+        sent.clear()
+        await worker.run(until=START + timedelta(days=2))
+
+        async with session_factory() as db:
+            stored = dict((await db.execute(select(Medication.id, Medication.next_fire_at))).all())
+        await engine.dispose()
+        return first_day, list(sent), stored
+
+    first_day, second_day, stored = asyncio.run(scenario())
+    assert [(moment.hour, body) for moment, _, body in first_day] == [
+        (20, "💊 Time to take your Metformin (500mg)."),
+        (8, "💊 Time to take your Metformin (500mg)."),
+        (8, "💊 Time to take your Lisinopril.")
+    ]
+    assert {to for _, to, _ in first_day} == {"+15550001"}
+    assert [moment.hour for moment, _, _ in second_day] == [18, 8, 8]
+    assert reminders.as_utc(stored[1]) == datetime(2024, 3, 11, 18, 0, tzinfo=timezone.utc)
+    assert reminders.as_utc(stored[2]) == datetime(2024, 3, 12, 8, 0, tzinfo=timezone.utc)
+    assert stored[3] is None
+
+def test_worker_retries_failed_reminders(tmp_path, monkeypatch):
+    """Test a reminder SMS that failed is sent again, and given up on once too late"""
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'retries.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        clock = SimulatedClock(START)
+        monkeypatch.setattr(reminders, "clock", clock)
+        async with session_factory() as db:
+            db.add(User(id=1, email="patient@example.com", phone="+15550001"))
+            db.add(Medication(id=1, user_id=1, name="Metformin", reminder_time="13:00"))
+            db.add(Medication(id=2, user_id=1, name="Lisinopril", reminder_time="15:00"))
+            await db.commit()
+
+        attempts = []
+
+        async def send(messages):
+            attempts.extend((clock.now() - START, m["medication_id"]) for m in messages)
+            # Metformin gets through on its second try; Lisinopril never does
+            return [m for m in messages if m["medication_id"] == 2 or len(attempts) == 1]
+
+        worker = ReminderWorker(session_factory, send=send, clock=clock)
+        await worker.run(until=START + timedelta(hours=5))
+        await engine.dispose()
+        return attempts, worker
+
+    attempts, worker = asyncio.run(scenario())
+    seconds = [(int(moment.total_seconds()), medication_id) for moment, medication_id in attempts]
+    assert seconds[:2] == [(3600, 1), (3630, 1)]
+    # Lisinopril is retried after 30s, then twice as long each time, then given up on
+    assert [moment - 10800 for moment, medication_id in seconds if medication_id == 2] == [0, 30, 90, 210, 450, 930, 1890]
+    assert worker.sent == 1 and worker.failed == 1
+
+def test_worker_loads_course_ending_later_today_in_its_zone(tmp_path):
+    """Test an unscheduled course is compared with now in its own timezone, not UTC"""
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'ending.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            # 10:00 in Los Angeles is still ahead at 12:00 UTC (04:00 there); no next_fire_at stored yet
+            await conn.execute(insert(Medication.__table__), [{
+                "id": 1, "user_id": 1, "name": "Amoxicillin", "reminder_time": "08:00",
+                "reminder_timezone": "America/Los_Angeles", "end_date": datetime(2024, 3, 9, 10, 0)
+            }])
+        worker = ReminderWorker(async_sessionmaker(engine), send=None, clock=SimulatedClock(START))
+        await worker.load()
+        await engine.dispose()
+        return worker.scheduler.next_fire_at()
+
+    assert asyncio.run(scenario()) == datetime(2024, 3, 9, 16, 0, tzinfo=timezone.utc)
+
+def test_parallel_appointment_sweeps_send_each_reminder_once(tmp_path):
+    """Test concurrent sweeps split the due appointments between them, and a failed send is retried"""
+    now = datetime(2024, 3, 9, 12, 0)
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'appointments.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as db:
+            db.add(User(id=1, email="patient@example.com", phone="+15550001"))
+            for minutes in range(0, 24 * 60, 30):
+                db.add(Appointment(user_id=1, doctor_name="Dr. Smith", appointment_datetime=now + timedelta(minutes=minutes + 1)))
+            db.add(Appointment(user_id=1, doctor_name="Dr. Later", appointment_datetime=now + timedelta(days=2)))
+            db.add(Appointment(user_id=1, doctor_name="Dr. Gone", appointment_datetime=now + timedelta(hours=1), status="cancelled"))
+            db.add(Appointment(user_id=1, doctor_name="Dr. Done", appointment_datetime=now + timedelta(hours=1), reminder_sent=True))
+            await db.commit()
+
+        sent = []
+        flaky = {"failures": 1}
+
+        async def send(messages):
+            await asyncio.sleep(0)
+            failed = messages[:flaky["failures"]]
+            flaky["failures"] -= len(failed)
+            sent.extend(m["appointment_id"] for m in messages[len(failed):])
+            return failed
+
+        counts = await asyncio.gather(*(sweep_appointments(session_factory, send, now=now, batch_size=5) for _ in range(3)))
+        retry = await sweep_appointments(session_factory, send, now=now, batch_size=5)
+        await engine.dispose()
+        return sent, counts, retry
+
+    sent, counts, retry = asyncio.run(scenario())
+    assert len(sent) == len(set(sent)) == 48
+    # The failed one is un-claimed, then re-claimed by a sweep still behind it or by the retry
+    assert sum(c["claimed"] for c in (*counts, retry)) == 49
+    assert sum(c["failed"] for c in (*counts, retry)) == 1
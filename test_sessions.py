@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import llm
+import main
+import sessions
+import tts
+from prompts import HEALTH_SYSTEM_PROMPT
+
+
+@pytest.fixture(autouse=True)
+def memory_store(monkeypatch):
+    """Keep conversations in process; no Redis in tests"""
+    monkeypatch.setattr(sessions, "get_redis", lambda: None)
+    monkeypatch.setattr(sessions, "_memory", sessions.OrderedDict())
+
+def test_later_turns_send_context_not_system_prompt(monkeypatch):
+    """Test only the first turn carries the system prompt; later turns resume from Ollama's context"""
+    payloads = []
+
+    def handler(request):
+        payload = json.loads(request.content)
+        payloads.append(payload)
+        context = (payload.get("context") or []) + [len(payloads)] * 3
+        return httpx.Response(200, json={"response": f"Reply {len(payloads)}", "done": True, "context": context})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm, "get_client", lambda: client)
+
+    async def conversation():
+        first = await sessions.load(None, owner="key")
+        await sessions.generate(first, "I have a headache")
+        resumed = await sessions.load(first.session_id, owner="key")
+        await sessions.generate(resumed, "It started this morning")
+        stranger = await sessions.load(first.session_id, owner="other key")
+        return resumed, stranger
+
+    resumed, stranger = asyncio.run(conversation())
+    assert payloads[0]["system"] == HEALTH_SYSTEM_PROMPT and "context" not in payloads[0]
+    assert payloads[1]["prompt"] == "It started this morning"
+    assert payloads[1]["context"] == [1, 1, 1] and "system" not in payloads[1]
+    assert all(p["keep_alive"] == llm.OLLAMA_KEEP_ALIVE for p in payloads)
+    assert resumed.turns == 2 and resumed.context == [1, 1, 1, 2, 2, 2]
+    assert stranger.context is None
+
+def test_oversized_context_restarts_conversation(monkeypatch):
+    """Test a context past the limit is dropped so the next turn starts fresh"""
+    monkeypatch.setattr(sessions, "SESSION_MAX_CONTEXT_TOKENS", 4)
+    conversation = sessions.Conversation("id", "key")
+    conversation.update([1, 2, 3])
+    assert conversation.llm_options()["context"] == [1, 2, 3]
+    conversation.update([1, 2, 3, 4, 5])
+    assert conversation.llm_options()["system"] == HEALTH_SYSTEM_PROMPT
+
+def test_voice_chat_returns_session_id(monkeypatch):
+    """Test /voice-chat hands out a session id and resumes the conversation when it is sent back"""
+    calls = []
+
+    async def fake_transcribe(*args, **kwargs):
+        return "How much water should I drink?"
+
+    async def fake_generate(prompt, **kwargs):
+        calls.append(kwargs)
+        kwargs["on_context"]([len(calls)])
+        return "About eight glasses a day."
+
+    async def fake_tts(text, **kwargs):
+        return b"audio"
+
+    async def noop():
+        return None
+
+    monkeypatch.setattr(main, "verify_key", lambda key: True)
+    monkeypatch.setattr(tts, "prewarm", lambda texts: noop())
+    monkeypatch.setattr(main, "transcribe_upload", fake_transcribe)
+    monkeypatch.setattr(main.llm, "generate", fake_generate)
+    monkeypatch.setattr(main, "text_to_speech", fake_tts)
+
+    with TestClient(main.app) as client, open("input.wav", "rb") as f:
+        audio = f.read()
+        first = client.post("/voice-chat", headers={"x-api-key": "test"}, files={"audio_file": audio})
+        session_id = first.headers["x-session-id"]
+        second = client.post(
+            "/voice-chat", headers={"x-api-key": "test", "x-session-id": session_id}, files={"audio_file": audio}
+        )
+
+    assert second.headers["x-session-id"] == session_id
+    assert "system" in calls[0]
+    assert calls[1]["context"] == [1]
@@ -0,0 +1,89 @@
+import struct
+
+import asyncio
+import functools
+
+import piper_pool
+import tts
+from audio import STREAMING_SIZE
+from benchmarks.bench_piper_parallel import FakeVoice
+from streaming import aspeak_sentences, asentences, iter_sentences, normalize_for_speech
+
+
+def tokens(text):
+    """Split text into word tokens the way Ollama streams them"""
+    words = text.split(" ")
+    return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+def test_sentences_split_on_terminators():
+    """Test sentences are emitted as soon as they are complete"""
+    text = "Drink plenty of water today. Rest as much as you can! Is the pain getting worse?"
+    assert list(iter_sentences(tokens(text))) == [
+        "Drink plenty of water today.",
+        "Rest as much as you can!",
+        "Is the pain getting worse?"
+    ]
+
+def test_abbreviations_and_numbers_do_not_split():
+    """Test Dr., decimals and list numbering stay inside a sentence"""
+    text = "Please see Dr. Smith about the 2.5 mg dose. Then follow these steps: 1. rest well."
+    assert list(iter_sentences(tokens(text))) == [
+        "Please see Dr. Smith about the 2.5 mg dose.",
+        "Then follow these steps: 1. rest well."
+    ]
+
+def test_short_sentences_are_merged():
+    """Test fragments below the minimum length join the next sentence"""
+    assert list(iter_sentences(tokens("Yes. You should rest for a couple of days."))) == [
+        "Yes. You should rest for a couple of days."
+    ]
+
+def test_streaming_wav_header(monkeypatch):
+    """Test a streamed reply starts with a header declaring PCM with unknown length"""
+    async def fake_piper_pcm(text, priority):
+        return [(b"\x00\x00" * 10, 22050)]
+
+    monkeypatch.setattr(tts, "piper_pcm", fake_piper_pcm)
+
+    async def speak():
+        return b"".join([chunk async for chunk in aspeak_sentences(asentences("Drink water through the day."))])
+
+    header = asyncio.run(speak())[:44]
+    assert header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+    channels, sample_rate = struct.unpack("<HI", header[22:28])
+    assert (channels, sample_rate) == (1, 22050)
+    assert struct.unpack("<I", header[40:44])[0] == STREAMING_SIZE
+
+def test_normalize_for_speech():
+    """Test units, ranges and abbreviations are spelled out only where Piper would misread them"""
+    assert normalize_for_speech("Take 500 mg, e.g. with food.") == "Take 500 milligrams, for example with food."
+    assert normalize_for_speech("Drink 2-3 L/day.") == "Drink 2 to 3 liters per day."
+    assert normalize_for_speech("1 g of salt, 30% less") == "1 gram of salt, 30 percent less"
+    assert normalize_for_speech("BP over 140/90 mmHg") == "blood pressure over 140 over 90 millimeters of mercury"
+    assert normalize_for_speech("Plan A or plan B") == "Plan A or plan B"
+
+def test_lookahead_keeps_sentence_order(monkeypatch):
+    """Test sentences synthesized in parallel are still streamed in reply order"""
+    async def fake_piper_pcm(text, priority):
+        # Later sentences finish first
+        await asyncio.sleep(0.05 / len(text))
+        return [(text.encode(), 22050)]
+
+    monkeypatch.setattr(tts, "piper_pcm", fake_piper_pcm)
+    reply = "Drink water through the day. Rest for a few hours. See a doctor if it gets worse."
+
+    async def speak():
+        return b"".join([chunk async for chunk in aspeak_sentences(asentences(reply), lookahead=3)])
+
+    audio = asyncio.run(speak())
+    assert audio[44:] == b"".join(sentence.encode() for sentence in iter_sentences([reply]))
+
+def test_process_pool_stitches_sentences_in_order():
+    """Test worker processes each synthesize a sentence and the PCM comes back in order"""
+    pool = piper_pool.PiperProcessPool(2, functools.partial(FakeVoice, 0), crossfade_ms=0)
+    try:
+        pcm, sample_rate = pool.synthesize(["One.", "Three words here."])
+    finally:
+        pool.shutdown()
+    assert sample_rate == 22050
+    assert len(pcm) == sum(2 * int(22050 * 0.06 * len(text)) for text in ("One.", "Three words here."))
@@ -0,0 +1,64 @@
+import asyncio
+
+import numpy as np
+
+from stt import BatchedTranscriber
+
+
+def test_concurrent_requests_share_a_batch():
+    """Test requests inside the window are transcribed together and answered individually"""
+    batches = []
+
+    def fake_batch(audios):
+        batches.append(len(audios))
+        return [f"clip of {len(audio)} samples" for audio in audios]
+
+    async def scenario():
+        batcher = BatchedTranscriber(window_ms=20, max_batch=8, transcribe_fn=fake_batch)
+        clips = [np.zeros(n, dtype=np.float32) for n in (100, 200, 300)]
+        return await asyncio.gather(*(batcher.transcribe(clip) for clip in clips))
+
+    assert asyncio.run(scenario()) == ["clip of 100 samples", "clip of 200 samples", "clip of 300 samples"]
+    assert batches == [3]
+
+def test_full_batch_flushes_early():
+    """Test reaching max_batch flushes without waiting for the window"""
+    batches = []
+
+    def fake_batch(audios):
+        batches.append(len(audios))
+        return ["ok"] * len(audios)
+
+    async def scenario():
+        batcher = BatchedTranscriber(window_ms=10_000, max_batch=2, transcribe_fn=fake_batch)
+        clip = np.zeros(10, dtype=np.float32)
+        return await asyncio.wait_for(asyncio.gather(batcher.transcribe(clip), batcher.transcribe(clip)), 1)
+
+    assert asyncio.run(scenario()) == ["ok", "ok"]
+    assert batches == [2]
+
+def test_batch_errors_reach_every_caller():
+    """Test a failed batch fails each waiting request"""
+    def broken_batch(audios):
+        raise RuntimeError("decoder crashed")
+
+    async def scenario():
+        batcher = BatchedTranscriber(window_ms=5, transcribe_fn=broken_batch)
+        clip = np.zeros(10, dtype=np.float32)
+        return await asyncio.gather(batcher.transcribe(clip), batcher.transcribe(clip), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+def test_running_batches_are_held_until_done():
+    """Test a flushed batch's task is referenced by the batcher until it finishes"""
+    async def scenario():
+        batcher = BatchedTranscriber(window_ms=10_000, max_batch=1, transcribe_fn=lambda audios: ["ok"] * len(audios))
+        request = asyncio.ensure_future(batcher.transcribe(np.zeros(10, dtype=np.float32)))
+        await asyncio.sleep(0)
+        held = len(batcher._running)
+        text = await request
+        await asyncio.sleep(0)
+        return held, text, len(batcher._running)
+
+    assert asyncio.run(scenario()) == (1, "ok", 0)
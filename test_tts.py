@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import pytest
+
+import tts
+from benchmarks.stubs import start_stub_elevenlabs
+from cache import TieredCache
+
+
+@pytest.fixture
+def router(monkeypatch):
+    """ElevenLabs and a fake Piper, each on a fresh cache and fresh latency stats"""
+    cache = TieredCache("tts-test", max_bytes=1 << 20, ttl=60)
+    cache.redis = None
+    monkeypatch.setattr(tts, "audio_cache", cache)
+    monkeypatch.setattr(tts, "backend_stats", {"elevenlabs": tts.BackendStats(), "piper": tts.BackendStats()})
+    monkeypatch.setattr(tts, "USE_ELEVENLABS", True)
+    monkeypatch.setattr(tts, "PIPER_AVAILABLE", True)
+    monkeypatch.setattr(tts, "TTS_HEDGE_DELAY", 0.05)
+    piper_calls = []
+
+    async def fake_piper(text, priority):
+        piper_calls.append(text)
+        await asyncio.sleep(0.05)
+        return b"RIFF" + text.encode()
+
+    monkeypatch.setattr(tts, "_piper_wav", fake_piper)
+    servers = []
+
+    def elevenlabs(latency):
+        server, url = start_stub_elevenlabs(latency=latency, seconds_per_char=0)
+        servers.append(server)
+        monkeypatch.setattr(tts, "ELEVENLABS_URL", url)
+
+    yield elevenlabs, piper_calls
+    for server in servers:
+        server.shutdown()
+
+
+def test_slow_remote_is_hedged_with_piper(router):
+    """Test Piper answers when ElevenLabs is slower than the hedge delay, without waiting for it"""
+    elevenlabs, piper_calls = router
+    elevenlabs(latency=2.0)
+
+    start = time.perf_counter()
+    audio = asyncio.run(tts.text_to_speech("Stay hydrated."))
+    assert audio == b"RIFFStay hydrated."
+    assert time.perf_counter() - start < 1.0
+    assert piper_calls == ["Stay hydrated."]
+
+
+def test_fast_remote_wins_without_hedge(router, monkeypatch):
+    """Test a quick ElevenLabs reply is used and Piper is never started"""
+    elevenlabs, piper_calls = router
+    elevenlabs(latency=0)
+    monkeypatch.setattr(tts, "TTS_HEDGE_DELAY", 2.0)
+
+    audio = asyncio.run(tts.text_to_speech("Stay hydrated."))
+    assert audio.startswith(b"ID3")
+    assert piper_calls == []
+    assert tts.backend_stats["elevenlabs"].outcomes[-1] is True
+
+
+def test_failing_remote_is_skipped_then_probed(router, monkeypatch):
+    """Test a failing ElevenLabs falls back at once, then is skipped until the probe interval passes"""
+    _, piper_calls = router
+    monkeypatch.setattr(tts, "ELEVENLABS_URL", "http://127.0.0.1:9/v1/text-to-speech")
+    monkeypatch.setattr(tts, "TTS_HEDGE_DELAY", 5.0)
+
+    async def ask(count):
+        return [await tts.text_to_speech(f"Reply {i}.") for i in range(count)]
+
+    start = time.perf_counter()
+    replies = asyncio.run(ask(tts.TTS_MIN_SAMPLES + 2))
+    assert all(reply.startswith(b"RIFF") for reply in replies)
+    assert time.perf_counter() - start < 5.0
+    stats = tts.backend_stats["elevenlabs"]
+    assert len(stats.outcomes) == tts.TTS_MIN_SAMPLES and not stats.healthy()
+
+    stats.last_attempt -= tts.TTS_PROBE_INTERVAL
+    asyncio.run(tts.text_to_speech("One more."))
+    assert len(stats.outcomes) == tts.TTS_MIN_SAMPLES + 1
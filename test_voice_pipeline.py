@@ -0,0 +1,167 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import model_client
+import tts
+from cache import TieredCache
+from prompts import EMERGENCY_AUDIO_RESPONSE
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "verify_key", lambda key: True)
+    monkeypatch.setattr(tts, "prewarm", lambda texts: _noop())
+    with TestClient(main.app) as client:
+        yield client
+
+async def _noop():
+    return None
+
+def transcribe_as(monkeypatch, text):
+    async def fake_transcribe(*args, **kwargs):
+        return text
+    monkeypatch.setattr(main, "transcribe_upload", fake_transcribe)
+
+def post_audio(client, path="/voice-chat"):
+    with open("input.wav", "rb") as f:
+        return client.post(path, headers={"x-api-key": "test"}, files={"audio_file": ("input.wav", f, "audio/wav")})
+
+def test_emergency_skips_llm(client, monkeypatch):
+    """Test an emergency transcript gets the pre-rendered clip without an LLM round trip"""
+    transcribe_as(monkeypatch, "My father has chest pain and is sweating")
+    monkeypatch.setitem(tts.canned_audio, EMERGENCY_AUDIO_RESPONSE, b"RIFF emergency clip")
+    followed_up = []
+
+    async def fail_generate(*args, **kwargs):
+        raise AssertionError("LLM must not be on the response path")
+
+    async def fake_follow_up(user_text):
+        followed_up.append(user_text)
+
+    monkeypatch.setattr(main.llm, "generate", fail_generate)
+    monkeypatch.setattr(main, "_follow_up_emergency", fake_follow_up)
+
+    for path in ("/voice-chat", "/voice-chat/stream"):
+        monkeypatch.setattr(tts, "PIPER_AVAILABLE", True)
+        response = post_audio(client, path)
+        assert response.status_code == 200
+        assert response.content == b"RIFF emergency clip"
+        assert response.headers["x-urgency-level"] == "emergency"
+
+    assert followed_up == ["My father has chest pain and is sweating"] * 2
+
+def test_emergency_follow_up_logs_health_log(monkeypatch):
+    """Test the background follow-up stores the LLM reply as an emergency HealthLog"""
+    import asyncio
+    logged = []
+
+    async def fake_generate(prompt, **kwargs):
+        return "Call emergency services now."
+
+    monkeypatch.setattr(main.llm, "generate", fake_generate)
+    monkeypatch.setattr(main, "_write_health_log", lambda *args: logged.append(args))
+    asyncio.run(main._follow_up_emergency("I can't breathe"))
+    assert logged == [("I can't breathe", "Call emergency services now.", "emergency")]
+
+def test_non_emergency_goes_through_llm(client, monkeypatch):
+    """Test ordinary questions still get an LLM answer"""
+    transcribe_as(monkeypatch, "How much water should I drink?")
+
+    async def fake_generate(prompt, **kwargs):
+        return "About eight glasses a day."
+
+    async def fake_tts(text, **kwargs):
+        return f"audio:{text}".encode()
+
+    logged = []
+    monkeypatch.setattr(main.llm, "generate", fake_generate)
+    monkeypatch.setattr(main, "text_to_speech", fake_tts)
+    monkeypatch.setattr(main.health_logs, "add", logged.append)
+    response = post_audio(client)
+    assert response.status_code == 200
+    assert response.content == b"audio:About eight glasses a day."
+    assert [row["data"]["ai_response"] for row in logged] == ["About eight glasses a day."]
+
+def test_streamed_reply_is_logged_once_complete(client, monkeypatch):
+    """Test /voice-chat/stream writes the whole streamed reply to the HealthLog"""
+    transcribe_as(monkeypatch, "How much water should I drink?")
+
+    async def fake_stream_tokens(conversation, user_text):
+        for token in ["About eight glasses a day. ", "More if it is hot outside."]:
+            yield token
+
+    async def fake_piper_pcm(text, **kwargs):
+        return [(b"\x10\x00" * 2205, 22050)]
+
+    logged = []
+    monkeypatch.setattr(main.sessions, "stream_tokens", fake_stream_tokens)
+    monkeypatch.setattr(tts, "PIPER_AVAILABLE", True)
+    monkeypatch.setattr(tts, "piper_pcm", fake_piper_pcm)
+    monkeypatch.setattr(main.health_logs, "add", logged.append)
+    response = post_audio(client, "/voice-chat/stream")
+    assert response.status_code == 200
+    assert [row["data"]["ai_response"] for row in logged] == ["About eight glasses a day. More if it is hot outside."]
+
+def test_model_server_failure_is_503(client, monkeypatch):
+    """Test a failed model server call is reported as unavailable, not as a crash"""
+    async def failing_transcribe(*args, **kwargs):
+        raise model_client.ModelServerError("timed out")
+
+    monkeypatch.setattr(main, "transcribe_upload", failing_transcribe)
+    for path in ("/voice-chat", "/voice-chat/stream"):
+        monkeypatch.setattr(tts, "PIPER_AVAILABLE", True)
+        response = post_audio(client, path)
+        assert response.status_code == 503
+        assert response.json() == {"detail": "Model server unavailable"}
+
+def test_elevenlabs_uses_rest_endpoint(monkeypatch):
+    """Test ElevenLabs is called over HTTP, so a local stub can stand in for it"""
+    import asyncio
+    from benchmarks.stubs import start_stub_elevenlabs
+
+    server, url = start_stub_elevenlabs(latency=0, seconds_per_char=0)
+    monkeypatch.setattr(tts, "ELEVENLABS_URL", url)
+    try:
+        audio = asyncio.run(tts.text_to_speech_elevenlabs("Stay hydrated."))
+    finally:
+        server.shutdown()
+    assert audio.startswith(b"ID3")
+
+def test_voice_chat_streams_negotiated_format(client, monkeypatch):
+    """Test Piper replies stream as Opus when asked, and a repeated reply comes from the TTS cache"""
+    transcribe_as(monkeypatch, "How much water should I drink?")
+    synthesized = []
+
+    async def fake_generate(prompt, **kwargs):
+        return "Drink about eight glasses a day. More if it is hot outside."
+
+    async def fake_piper_pcm(text, **kwargs):
+        synthesized.append(text)
+        return [(b"\x10\x00" * 22050, 22050)]
+
+    monkeypatch.setattr(main.llm, "generate", fake_generate)
+    monkeypatch.setattr(tts, "PIPER_AVAILABLE", True)
+    monkeypatch.setattr(tts, "USE_ELEVENLABS", False)
+    monkeypatch.setattr(tts, "piper_pcm", fake_piper_pcm)
+    cache = TieredCache("tts-test", max_bytes=1 << 20, ttl=60)
+    cache.redis = None
+    monkeypatch.setattr(tts, "audio_cache", cache)
+
+    def ask():
+        with open("input.wav", "rb") as f:
+            return client.post(
+                "/voice-chat",
+                headers={"x-api-key": "test", "accept": "audio/ogg"},
+                files={"audio_file": ("input.wav", f, "audio/wav")}
+            )
+
+    first = ask()
+    assert first.status_code == 200
+    assert first.headers["content-type"].startswith("audio/ogg")
+    assert first.content[:4] == b"OggS"
+    assert synthesized == ["Drink about eight glasses a day.", "More if it is hot outside."]
+
+    second = ask()
+    assert second.content[:4] == b"OggS"
+    assert len(synthesized) == 2
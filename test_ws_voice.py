@@ -0,0 +1,166 @@
+import json
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import main
+import model_client
+import tts
+import voice_session
+from prompts import EMERGENCY_AUDIO_RESPONSE
+from vad import EnergyEndpointer, SAMPLE_RATE
+
+
+def tone(seconds, amplitude=0.3):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+def to_pcm16(audio):
+    return (audio * 32767).astype("<i2").tobytes()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "verify_key", lambda key: key == "test")
+    monkeypatch.setattr(tts, "prewarm", lambda texts: _noop())
+    with TestClient(main.app) as client:
+        yield client
+
+async def _noop():
+    return None
+
+def hear(monkeypatch, text):
+    monkeypatch.setattr(voice_session.stt, "speech_to_text", lambda audio: text)
+
+def send_utterance(ws, seconds=0.6):
+    pcm = to_pcm16(np.concatenate([silence(0.3), tone(seconds), silence(1.0)]))
+    for i in range(0, len(pcm), 640):  # 20 ms frames
+        ws.send_bytes(pcm[i:i + 640])
+
+def receive_until_audio_end(ws):
+    events, audio = [], bytearray()
+    while True:
+        message = ws.receive()
+        if message.get("bytes"):
+            audio.extend(message["bytes"])
+            continue
+        event = json.loads(message["text"])
+        events.append(event)
+        if event["type"] in ("audio_end", "error"):
+            return events, bytes(audio)
+
+
+def test_endpointer_finds_utterance_boundaries():
+    """Test the endpointer emits start/end around speech and keeps the pre-roll"""
+    endpointer = EnergyEndpointer(silence_ms=300)
+    audio = np.concatenate([silence(0.5), tone(0.5), silence(0.5)])
+
+    events = []
+    for i in range(0, len(audio), 320):  # arbitrary chunk size
+        events.extend(endpointer.feed(audio[i:i + 320]))
+
+    assert [event for event, _ in events] == ["start", "end"]
+    utterance = events[1][1]
+    assert 0.5 * SAMPLE_RATE <= len(utterance) <= 1.1 * SAMPLE_RATE
+    assert not endpointer.speaking
+
+def test_ws_rejects_bad_key(client):
+    """Test a wrong API key closes the socket with a policy-violation code"""
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/ws/voice?api_key=wrong") as ws:
+            ws.receive_text()
+    assert exc.value.code == 1008
+
+def test_ws_streams_transcript_and_reply_audio(client, monkeypatch):
+    """Test one turn: speech_start, final transcript, reply text and PCM frames"""
+    hear(monkeypatch, "How much water should I drink?")
+
+    async def fake_stream_tokens(prompt, **kwargs):
+        for token in ["Drink about eight glasses ", "of water a day. ", "More if it is hot."]:
+            yield token
+
+    monkeypatch.setattr(voice_session.llm, "stream_tokens", fake_stream_tokens)
+    monkeypatch.setattr(tts, "PIPER_AVAILABLE", True)
+    monkeypatch.setattr(tts, "piper_pcm_chunks", lambda text: iter([(b"\x01\x00" * len(text), 22050)]))
+    logged = []
+    monkeypatch.setattr(main, "_write_health_log", lambda *turn: logged.append(turn))
+
+    with client.websocket_connect("/ws/voice", headers={"x-api-key": "test"}) as ws:
+        assert ws.receive_json()["type"] == "ready"
+        send_utterance(ws)
+        events, audio = receive_until_audio_end(ws)
+
+        # Same connection serves the next turn
+        send_utterance(ws)
+        next_events, _ = receive_until_audio_end(ws)
+
+    types = [event["type"] for event in events]
+    assert types[0] == "speech_start"
+    assert {"type": "final", "text": "How much water should I drink?", "urgency": "low"} in events
+    replies = [event["text"] for event in events if event["type"] == "reply"]
+    assert replies == ["Drink about eight glasses of water a day.", "More if it is hot."]
+    assert {"type": "audio_start", "format": "pcm_s16le", "sample_rate": 22050} in events
+    assert audio == b"\x01\x00" * sum(len(reply) for reply in replies)
+    assert [event["type"] for event in next_events][-1] == "audio_end"
+    assert logged[0] == ("How much water should I drink?", " ".join(replies), "low") and len(logged) == 2
+
+def test_ws_emergency_sends_canned_clip(client, monkeypatch):
+    """Test an emergency turn gets the pre-rendered clip and no LLM reply"""
+    hear(monkeypatch, "My mother has chest pain")
+    monkeypatch.setitem(tts.canned_audio, EMERGENCY_AUDIO_RESPONSE, b"RIFF emergency clip")
+    followed_up = []
+
+    async def fail_stream_tokens(*args, **kwargs):
+        raise AssertionError("LLM must not be on the response path")
+        yield
+
+    async def fake_follow_up(user_text):
+        followed_up.append(user_text)
+
+    monkeypatch.setattr(voice_session.llm, "stream_tokens", fail_stream_tokens)
+    monkeypatch.setattr(main, "_follow_up_emergency", fake_follow_up)
+
+    with client.websocket_connect("/ws/voice", headers={"x-api-key": "test"}) as ws:
+        ws.receive_json()
+        send_utterance(ws)
+        events, audio = receive_until_audio_end(ws)
+
+    assert {"type": "urgency", "level": "emergency"} in events
+    assert {"type": "audio_start", "format": "wav"} in events
+    assert audio == b"RIFF emergency clip"
+
+def test_ws_emergency_clip_format_follows_audio(client, monkeypatch):
+    """Test an ElevenLabs MP3 emergency clip is announced as mp3, not wav"""
+    hear(monkeypatch, "He is unconscious")
+    monkeypatch.setitem(tts.canned_audio, EMERGENCY_AUDIO_RESPONSE, b"ID3 mp3 emergency clip")
+
+    async def fake_follow_up(user_text):
+        pass
+
+    monkeypatch.setattr(main, "_follow_up_emergency", fake_follow_up)
+
+    with client.websocket_connect("/ws/voice", headers={"x-api-key": "test"}) as ws:
+        ws.receive_json()
+        send_utterance(ws)
+        events, audio = receive_until_audio_end(ws)
+
+    assert {"type": "audio_start", "format": "mp3"} in events
+    assert audio == b"ID3 mp3 emergency clip"
+
+def test_ws_model_server_failure_is_an_error_event(client, monkeypatch):
+    """Test a failed model server call ends the turn with an error event"""
+    async def failing_transcribe(audio, priority=None):
+        raise model_client.ModelServerError("warm-up failed")
+
+    monkeypatch.setattr(voice_session.stt, "transcribe_array", failing_transcribe)
+    with client.websocket_connect("/ws/voice", headers={"x-api-key": "test"}) as ws:
+        ws.receive_json()
+        send_utterance(ws)
+        events, _ = receive_until_audio_end(ws)
+
+    assert events[-1] == {"type": "error", "detail": "Model server unavailable"}
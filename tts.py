@@ -1,94 +1,382 @@
+import asyncio
+import importlib.util
 import os
-from typing import Optional
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import httpx
 from dotenv import load_dotenv
 
+import inference
+import llm
+import metrics
+import model_client
+import piper_pool
+from inference import PRIORITY_NORMAL
+from audio import wav_header
+from cache import TieredCache, content_key, normalize_text
+
 load_dotenv()
 
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 USE_ELEVENLABS = bool(ELEVENLABS_API_KEY)
+DEFAULT_VOICE_ID = "21m00Tcm4TlvDq8ikWAM"
+# ElevenLabs' default output is 44.1 kHz MP3
+ELEVENLABS_SAMPLE_RATE = 44100
+
+PIPER_MODEL = "en_US-lessac-medium.onnx"
+PIPER_SAMPLE_RATE = 22050
+
+# ---------------- CACHE ----------------
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+TTS_CACHE_TTL = int(os.getenv("TTS_CACHE_TTL", str(7 * 24 * 3600)))
+
+audio_cache = TieredCache("tts", max_bytes=TTS_CACHE_MAX_BYTES, ttl=TTS_CACHE_TTL)
+
+# Audio for prewarmed canned replies, held outside the LRU so it can't be evicted
+canned_audio = {}
+
+# Wall time spent synthesizing on cache misses, to estimate what hits save
+synthesis_seconds = 0.0
+synthesis_count = 0
+
+def audio_cache_key(text: str, voice_id: str, backend: str, sample_rate: int) -> str:
+    return content_key(normalize_text(text), voice_id, backend, sample_rate)
+
+def voice_identity(voice_id: str = DEFAULT_VOICE_ID) -> str:
+    """Which voice text_to_speech() speaks in, for caches holding its audio"""
+    if USE_ELEVENLABS:
+        return f"elevenlabs:{voice_id}:{ELEVENLABS_SAMPLE_RATE}"
+    return f"piper:{PIPER_MODEL}:{PIPER_SAMPLE_RATE}"
 
 # ---------------- ELEVENLABS ----------------
-try:
-    from elevenlabs import generate, set_api_key
-    ELEVENLABS_AVAILABLE = True
-except ImportError:
-    ELEVENLABS_AVAILABLE = False
-    generate = None
-    set_api_key = None
+# Called over plain HTTPS on the shared keep-alive client (no SDK), so the
+# event loop never blocks on it and a local stub can stand in via the URL
+ELEVENLABS_URL = os.getenv("ELEVENLABS_URL", "https://api.elevenlabs.io/v1/text-to-speech")
+ELEVENLABS_MODEL = "eleven_monolingual_v1"
+ELEVENLABS_TIMEOUT = float(os.getenv("ELEVENLABS_TIMEOUT", "10"))
 
-if USE_ELEVENLABS and ELEVENLABS_AVAILABLE:
-    set_api_key(ELEVENLABS_API_KEY)
+# ---------------- ROUTER CONFIG ----------------
+# If ElevenLabs hasn't answered by this percentile of its recent latencies,
+# start Piper too and use whichever finishes first
+TTS_HEDGE_PERCENTILE = float(os.getenv("TTS_HEDGE_PERCENTILE", "0.9"))
+# Hedge delay until enough latencies are known, and its floor afterwards
+TTS_HEDGE_DELAY = float(os.getenv("TTS_HEDGE_DELAY", "1.0"))
+TTS_HEDGE_MIN_DELAY = float(os.getenv("TTS_HEDGE_MIN_DELAY", "0.1"))
+# ElevenLabs' latency budget; past it, the reply is Piper's
+TTS_REMOTE_DEADLINE = float(os.getenv("TTS_REMOTE_DEADLINE", "4"))
+# Above this recent error rate ElevenLabs is skipped, apart from one probe
+# request every TTS_PROBE_INTERVAL seconds to notice it has recovered
+TTS_MAX_ERROR_RATE = float(os.getenv("TTS_MAX_ERROR_RATE", "0.5"))
+TTS_PROBE_INTERVAL = float(os.getenv("TTS_PROBE_INTERVAL", "30"))
+TTS_STATS_WINDOW = 100
+TTS_MIN_SAMPLES = 10
 
 # ---------------- PIPER ----------------
-try:
-    from piper import PiperVoice
-    PIPER_AVAILABLE = True
-except ImportError:
-    PIPER_AVAILABLE = False
-    PiperVoice = None
+# Imported and loaded on first use or at API startup, not on module import
+PIPER_AVAILABLE = importlib.util.find_spec("piper") is not None or model_client.enabled()
 
 piper_voice = None
+_piper_lock = threading.Lock()
+
+# With PIPER_PROCESSES set, replies are split into sentences rendered in
+# parallel by worker processes, each holding its own voice
+piper_processes = piper_pool.create_pool(PIPER_MODEL) if piper_pool.enabled() else None
+# Sentences of a complete reply to have in flight at once when streaming it
+PIPER_LOOKAHEAD = max(1, piper_pool.PIPER_PROCESSES)
 
 def init_piper():
     global piper_voice
-    if piper_voice is None:
-        piper_voice = PiperVoice.load("en_US-lessac-medium.onnx")
+    with _piper_lock:
+        if piper_voice is None:
+            from piper import PiperVoice
+            piper_voice = PiperVoice.load(PIPER_MODEL)
+
+def warm_up():
+    """Load the Piper voice and synthesize a word so the first request isn't slow"""
+    if not PIPER_AVAILABLE or model_client.enabled():
+        return
+    if piper_processes is not None:
+        piper_processes.warm_up()
+        return
+    for _ in piper_pcm_chunks("Hello."):
+        pass
 
 # ---------------- ELEVENLABS TTS ----------------
 async def text_to_speech_elevenlabs(
     text: str,
-    voice_id: str = "21m00Tcm4TlvDq8ikWAM"
+    voice_id: str = DEFAULT_VOICE_ID
 ) -> Optional[bytes]:
-    if not ELEVENLABS_AVAILABLE:
-        return None
-
     try:
-        audio = generate(
-            text=text,
-            voice=voice_id,
-            model="eleven_monolingual_v1"
+        response = await llm.get_client().post(
+            f"{ELEVENLABS_URL}/{voice_id}",
+            headers={"xi-api-key": ELEVENLABS_API_KEY or "", "Accept": "audio/mpeg"},
+            json={"text": text, "model_id": ELEVENLABS_MODEL},
+            timeout=ELEVENLABS_TIMEOUT
         )
-        return audio  # bytes
-    except Exception as e:
+        response.raise_for_status()
+        return response.content  # MP3 bytes
+    except httpx.HTTPError as e:
         print(f"ElevenLabs error: {e}")
         return None
 
 # ---------------- PIPER TTS ----------------
+def piper_pcm_chunks(text: str) -> Iterator[Tuple[bytes, int]]:
+    """Yield (16-bit PCM bytes, sample_rate) from Piper, one chunk per sentence"""
+    if piper_voice is None:
+        init_piper()
+    for chunk in piper_voice.synthesize(text):
+        yield chunk.audio_int16_bytes, chunk.sample_rate
+
+async def piper_pcm(text: str, priority: int = PRIORITY_NORMAL) -> List[Tuple[bytes, int]]:
+    """Uncached Piper PCM for one streamed sentence, synthesized on the inference pool"""
+    with metrics.timed("tts", backend="piper", model=PIPER_MODEL, cache="bypass"):
+        if model_client.enabled():
+            return await model_client.synthesize_pcm(text, priority)
+        if piper_processes is not None:
+            # The inference thread just waits on a worker process; admission still applies
+            result = await inference.pool.run(piper_processes.synthesize, [text], priority=priority)
+            return [result] if result else []
+        return await inference.pool.run(lambda: list(piper_pcm_chunks(text)), priority=priority)
+
 def text_to_speech_piper(text: str) -> Optional[bytes]:
     if not PIPER_AVAILABLE:
         return None
 
+    from streaming import normalize_for_speech, speech_sentences
     try:
-        init_piper()
-        audio, sample_rate = piper_voice.synthesize(text)
+        if piper_processes is not None:
+            result = piper_processes.synthesize(speech_sentences(text))
+            return pcm_to_wav([result[0]], result[1]) if result else None
 
-        # Convert to WAV bytes
-        import io
-        import soundfile as sf
+        pcm = []
+        sample_rate = None
+        for chunk, sample_rate in piper_pcm_chunks(normalize_for_speech(text)):
+            pcm.append(chunk)
 
-        buffer = io.BytesIO()
-        sf.write(buffer, audio, sample_rate, format="WAV")
-        buffer.seek(0)
-        return buffer.read()
+        if sample_rate is None:
+            return None
+        return pcm_to_wav(pcm, sample_rate)
 
     except Exception as e:
         print(f"Piper TTS error: {e}")
         return None
 
+def pcm_to_wav(pcm: List[bytes], sample_rate: int) -> bytes:
+    """One WAV from PCM chunks, in a single join (no BytesIO round trip)"""
+    return b"".join([wav_header(sample_rate, sum(len(chunk) for chunk in pcm)), *pcm])
+
+# ---------------- BACKEND STATS ----------------
+class BackendStats:
+    """Latencies and failures of a TTS backend's last `window` syntheses"""
+
+    def __init__(self, window: int = TTS_STATS_WINDOW):
+        self.latencies = deque(maxlen=window)  # successful syntheses only
+        self.outcomes = deque(maxlen=window)  # True for ok
+        self.last_attempt = 0.0
+
+    def record(self, seconds: float, ok: bool):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < TTS_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def healthy(self) -> bool:
+        return len(self.outcomes) < TTS_MIN_SAMPLES or self.error_rate <= TTS_MAX_ERROR_RATE
+
+    def snapshot(self) -> dict:
+        p50, p90 = self.percentile(0.5), self.percentile(0.9)
+        return {
+            "samples": len(self.outcomes),
+            "error_rate": round(self.error_rate, 3),
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p90_seconds": round(p90, 3) if p90 is not None else None
+        }
+
+
+backend_stats: Dict[str, BackendStats] = {"elevenlabs": BackendStats(), "piper": BackendStats()}
+
 # ---------------- MAIN TTS ----------------
+async def _cached(key: str, synthesize, backend: str, model: str) -> Optional[bytes]:
+    global synthesis_seconds, synthesis_count
+
+    start = time.perf_counter()
+    audio = await audio_cache.aget(key)
+    if audio:
+        metrics.observe_stage("tts", time.perf_counter() - start, backend=backend, model=model, cache="hit")
+        return audio
+
+    start = time.perf_counter()
+    audio = None
+    outcome = "error"
+    try:
+        audio = await synthesize()
+        outcome = "ok" if audio else "error"
+    except asyncio.CancelledError:
+        # Lost a hedged race, or the request went away: not the backend's fault
+        outcome = "cancelled"
+        raise
+    finally:
+        # Backends report failure as None, so outcome can't come from metrics.timed
+        elapsed = time.perf_counter() - start
+        metrics.observe_stage("tts", elapsed, outcome, backend=backend, model=model, cache="miss")
+        if outcome != "cancelled":
+            backend_stats[backend].record(elapsed, outcome == "ok")
+
+    if audio:
+        synthesis_seconds += elapsed
+        synthesis_count += 1
+        await audio_cache.aset(key, audio)
+    return audio
+
+async def _piper_wav(text: str, priority: int) -> Optional[bytes]:
+    if model_client.enabled():
+        return await model_client.synthesize(text, priority)
+    return await inference.pool.run(text_to_speech_piper, text, priority=priority)
+
+def _elevenlabs_audio(text: str, voice_id: str):
+    return _cached(
+        audio_cache_key(text, voice_id, "elevenlabs", ELEVENLABS_SAMPLE_RATE),
+        lambda: text_to_speech_elevenlabs(text, voice_id),
+        "elevenlabs", voice_id
+    )
+
+def _piper_audio(text: str, priority: int):
+    # Piper is CPU-bound; run it on the inference pool (or the model server), off the event loop
+    return _cached(piper_cache_key(text), lambda: _piper_wav(text, priority), "piper", PIPER_MODEL)
+
+def hedge_delay() -> float:
+    """How long ElevenLabs gets on its own before Piper is started alongside it"""
+    observed = backend_stats["elevenlabs"].percentile(TTS_HEDGE_PERCENTILE)
+    if observed is None:
+        return min(TTS_HEDGE_DELAY, TTS_REMOTE_DEADLINE)
+    return min(max(observed, TTS_HEDGE_MIN_DELAY), TTS_REMOTE_DEADLINE)
+
+def _use_remote() -> bool:
+    """Whether to try ElevenLabs: yes while it is healthy, else only as a periodic probe"""
+    stats = backend_stats["elevenlabs"]
+    now = time.monotonic()
+    if stats.healthy() or now - stats.last_attempt >= TTS_PROBE_INTERVAL:
+        stats.last_attempt = now
+        return True
+    return False
+
+def _audio_or_none(task: "asyncio.Task") -> Optional[bytes]:
+    if task.cancelled() or task.exception() is not None:
+        return None
+    return task.result()
+
+async def _race(text: str, voice_id: str, priority: int) -> Optional[bytes]:
+    """ElevenLabs within its deadline, hedged with Piper once it is slower than usual.
+
+    Whichever backend returns audio first wins and the other is cancelled.
+    A failed ElevenLabs call starts Piper straight away rather than waiting
+    out the hedge delay.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + TTS_REMOTE_DEADLINE
+    remote = asyncio.ensure_future(_elevenlabs_audio(text, voice_id))
+    local = None
+    try:
+        await asyncio.wait({remote}, timeout=hedge_delay())
+        if remote.done():
+            audio = _audio_or_none(remote)
+            if audio or not PIPER_AVAILABLE:
+                return audio
+        elif not PIPER_AVAILABLE:
+            await asyncio.wait({remote}, timeout=max(0.0, deadline - loop.time()))
+            return _audio_or_none(remote) if remote.done() else None
+
+        local = asyncio.ensure_future(_piper_audio(text, priority))
+        pending = {local} if remote.done() else {remote, local}
+        while pending:
+            timeout = None if remote.done() else max(0.0, deadline - loop.time())
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # Over budget: give up on ElevenLabs and count it as a failure
+                remote.cancel()
+                pending.discard(remote)
+                backend_stats["elevenlabs"].record(TTS_REMOTE_DEADLINE, False)
+                metrics.observe_stage("tts", TTS_REMOTE_DEADLINE, "timeout", backend="elevenlabs", model=voice_id, cache="miss")
+                continue
+            for task in done:
+                audio = _audio_or_none(task)
+                if audio:
+                    return audio
+        if local.exception() is not None:
+            # Both failed; surface Piper's error (e.g. a full inference queue is a 429)
+            raise local.exception()
+        return None
+    finally:
+        for task in (remote, local):
+            if task is not None and not task.done():
+                task.cancel()
+
 async def text_to_speech(
     text: str,
-    voice_id: str = "21m00Tcm4TlvDq8ikWAM"
+    voice_id: str = DEFAULT_VOICE_ID,
+    priority: int = PRIORITY_NORMAL
 ) -> Optional[bytes]:
 
-    if USE_ELEVENLABS and ELEVENLABS_AVAILABLE:
-        audio = await text_to_speech_elevenlabs(text, voice_id)
-        if audio:
-            return audio
+    if USE_ELEVENLABS and (not PIPER_AVAILABLE or _use_remote()):
+        return await _race(text, voice_id, priority)
+
+    return await _piper_audio(text, priority)
+
+def piper_cache_key(text: str) -> str:
+    return audio_cache_key(text, PIPER_MODEL, "piper", PIPER_SAMPLE_RATE)
+
+async def cached_piper_audio(text: str) -> Optional[bytes]:
+    """Piper WAV for text if it is cached (or canned); never synthesizes"""
+    audio = canned_audio.get(text)
+    if audio is None:
+        start = time.perf_counter()
+        audio = await audio_cache.aget(piper_cache_key(text))
+        if audio is not None:
+            metrics.observe_stage("tts", time.perf_counter() - start, backend="piper", model=PIPER_MODEL, cache="hit")
+    return audio
+
+async def remember_piper_audio(text: str, pcm: List[bytes], sample_rate: int) -> bytes:
+    """Cache streamed Piper audio as one WAV, so a repeat of text is a hit; returns the WAV"""
+    wav = pcm_to_wav(pcm, sample_rate)
+    await audio_cache.aset(piper_cache_key(text), wav)
+    return wav
+
+async def prewarm(texts: Iterable[str]):
+    """Synthesize canned replies ahead of time so they are cache hits"""
+    for text in texts:
+        try:
+            audio = await text_to_speech(text)
+            if audio:
+                canned_audio[text] = audio
+        except Exception as e:
+            print(f"TTS prewarm error: {e}")
+
+async def canned_or_synthesize(text: str, priority: int = PRIORITY_NORMAL) -> Optional[bytes]:
+    """Prewarmed audio for a canned reply, synthesizing it if prewarm hasn't finished"""
+    audio = canned_audio.get(text)
+    if audio is None:
+        audio = await text_to_speech(text, priority=priority)
+    return audio
 
-    return text_to_speech_piper(text)
+def cache_stats() -> dict:
+    stats = audio_cache.stats()
+    average = synthesis_seconds / synthesis_count if synthesis_count else 0.0
+    stats["estimated_seconds_saved"] = round(average * (stats["memory_hits"] + stats["redis_hits"]), 3)
+    return stats
 
-# ---------------- SYNC WRAPPER ----------------
-def speak(text: str) -> Optional[bytes]:
-    import asyncio
-    return asyncio.run(text_to_speech(text))
+def backend_snapshot() -> dict:
+    """Per-backend latency and error rates, plus the current hedge delay"""
+    snapshot = {name: stats.snapshot() for name, stats in backend_stats.items()}
+    snapshot["hedge_delay_seconds"] = round(hedge_delay(), 3)
+    return snapshot
@@ -0,0 +1,191 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# Ordered from least to most urgent
+LEVELS = ("low", "medium", "emergency")
+_RANK = {level: i for i, level in enumerate(LEVELS)}
+
+# Words that negate a keyword directly after them ("no chest pain", "denies
+# shortness of breath", "I don't have a high fever"). Anything looser is not
+# trusted: "I have never had chest pain like this" is an emergency, and when
+# a negation's scope is unclear a false escalation beats a missed emergency.
+# Apostrophes are stripped before matching, so "don't" is "dont" here.
+NEGATIONS = {
+    "no", "not", "without", "denies", "deny", "denied", "none",
+    "dont", "doesnt", "didnt", "wasnt", "havent", "hasnt", "hadnt"
+}
+# The only words allowed between a negation and its keyword
+NEGATION_FILLERS = {"have", "has", "had", "a", "an", "any"}
+MAX_NEGATION_FILLERS = 2
+# A question asks about a symptom rather than denying it ("Is this not a stroke?")
+SENTENCE_ENDS = {".", "!", "?"}
+
+_CLAUSE_PUNCTUATION = ".,;:!?"
+_WORD_SEPARATORS = "-\"()/"
+_END = None  # trie key marking the last word of a keyword
+
+
+class UrgencyMatch(NamedTuple):
+    keyword: str
+    level: str
+    start: int  # token index
+    end: int
+    negated: bool
+
+
+def inflections(word: str) -> List[str]:
+    """Plural and 3rd-person forms of a keyword word ("seizures", "injuries")"""
+    forms = [word + "s", word + "es"]
+    if word.endswith("y"):
+        forms.append(word[:-1] + "ies")
+    return forms
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words and clause punctuation; "Can’t" and "cant" both become "cant".
+
+    A handful of str.replace calls plus split() is several times faster than
+    a tokenizing regex, and this runs on every partial transcript.
+    """
+    text = text.lower().replace("'", "").replace("’", "")
+    for ch in _CLAUSE_PUNCTUATION:
+        if ch in text:
+            text = text.replace(ch, f" {ch} ")
+    for ch in _WORD_SEPARATORS:
+        if ch in text:
+            text = text.replace(ch, " ")
+    return text.split()
+
+
+class UrgencyMatcher:
+    """All urgency keywords compiled into one word-level trie.
+
+    Matching is a single left-to-right pass over the transcript's words,
+    following trie edges (Aho-Corasick style, over whole words), so the
+    cost grows with transcript length rather than keyword count, keywords
+    only match whole words ("stroke" does not fire on "heatstroke"), and
+    the longest keyword at a position wins ("severe bleeding" over "severe").
+    Inflected forms are edges to the same node, so "chest pains" and
+    "strokes" match without any extra work per transcript word.
+    """
+
+    def __init__(self, emergency_keywords: Iterable[str], medium_indicators: Iterable[str]):
+        self.trie: Dict = {}
+        self.max_keyword_words = 0
+
+        # Emergency last so it wins when a keyword is in both lists
+        for level, keywords in (("medium", medium_indicators), ("emergency", emergency_keywords)):
+            for keyword in keywords:
+                words = tokenize(keyword)
+                node = self.trie
+                for word in words:
+                    parent, node = node, node.setdefault(word, {})
+                    for form in inflections(word):
+                        parent.setdefault(form, node)
+                node[_END] = (level, keyword)
+                self.max_keyword_words = max(self.max_keyword_words, len(words))
+
+    @staticmethod
+    def is_negated(tokens: List[str], start: int, end: int) -> bool:
+        i = start - 1
+        while i >= 0 and start - 1 - i < MAX_NEGATION_FILLERS and tokens[i] in NEGATION_FILLERS:
+            i -= 1
+        if i < 0 or tokens[i] not in NEGATIONS:
+            return False
+        for token in tokens[end:]:
+            if token in SENTENCE_ENDS:
+                return token != "?"
+        return True
+
+    def find(self, tokens: List[str], start: int = 0) -> List[UrgencyMatch]:
+        """Every keyword occurrence starting at or after token index start"""
+        matches = []
+        trie = self.trie
+        # Most transcripts contain no keyword at all; a C-level set check rejects them
+        if trie.keys().isdisjoint(tokens[start:] if start else tokens):
+            return matches
+        n = len(tokens)
+
+        for i in range(start, n):
+            node = trie.get(tokens[i])
+            if node is None:
+                continue
+
+            hit = None
+            j = i
+            while True:
+                if _END in node:
+                    hit = (node[_END], j + 1)
+                j += 1
+                if j == n:
+                    break
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+
+            if hit is not None:
+                (level, keyword), end = hit
+                matches.append(UrgencyMatch(keyword, level, i, end, self.is_negated(tokens, i, end)))
+
+        return matches
+
+    def strongest(self, tokens: List[str], start: int = 0) -> Optional[UrgencyMatch]:
+        """The most urgent non-negated match, if any"""
+        best = None
+        for match in self.find(tokens, start):
+            if match.negated:
+                continue
+            if best is None or _RANK[match.level] > _RANK[best.level]:
+                best = match
+        return best
+
+    def level(self, text: str) -> str:
+        match = self.strongest(tokenize(text))
+        return match.level if match else "low"
+
+
+class UrgencyStream:
+    """Incremental urgency detection over partial STT results.
+
+    feed() final segments as they are committed and interim hypotheses with
+    final=False; only the words that can still take part in a new match are
+    rescanned. The level only ever goes up: once an interim hypothesis
+    fires an emergency it stays fired even if STT later revises the words,
+    because a false escalation is cheaper than a missed one.
+    """
+
+    def __init__(self, matcher: UrgencyMatcher):
+        self.matcher = matcher
+        self.tokens: List[str] = []
+        self.level = "low"
+        self.keyword: Optional[str] = None
+        self._scanned = 0
+
+    @property
+    def escalated(self) -> bool:
+        return self.level == "emergency"
+
+    def feed(self, text: str, final: bool = True) -> str:
+        """Add a segment; returns the (sticky) level so far"""
+        new_tokens = tokenize(text)
+        # A keyword that started in earlier words may complete in this segment
+        start = max(0, self._scanned - self.matcher.max_keyword_words + 1)
+
+        if final:
+            self.tokens.extend(new_tokens)
+            self._scanned = len(self.tokens)
+            tokens = self.tokens
+        else:
+            tokens = self.tokens + new_tokens
+
+        match = self.matcher.strongest(tokens, start)
+        if match and _RANK[match.level] > _RANK[self.level]:
+            self.level = match.level
+            self.keyword = match.keyword
+        return self.level
+
+    def reset(self):
+        """Start a new utterance"""
+        self.tokens = []
+        self.level = "low"
+        self.keyword = None
+        self._scanned = 0
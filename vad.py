@@ -0,0 +1,213 @@
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+
+# int16 RMS below which audio counts as silence (before the noise floor is learned)
+SILENCE_THRESHOLD = int(os.getenv("VAD_SILENCE_THRESHOLD", "500"))
+# Silence (hangover) that ends a turn
+SILENCE_MS = int(os.getenv("VAD_SILENCE_MS", "700"))
+MAX_UTTERANCE_SECONDS = float(os.getenv("VAD_MAX_UTTERANCE_SECONDS", "15"))
+MIN_SPEECH_MS = 150
+PRE_ROLL_MS = 200
+# The threshold rises to this multiple of the background noise level, so
+# a fan or hiss isn't "speech"
+NOISE_FLOOR_RATIO = float(os.getenv("VAD_NOISE_FLOOR_RATIO", "3"))
+NOISE_FLOOR_ALPHA = 0.05  # per-frame weight of new noise measurements
+# Until some frames have been heard as background, the floor is kept at or
+# below this (about -30 dBFS): someone who starts talking at once must not
+# have their own voice learned as the noise
+NOISE_FLOOR_MAX = float(os.getenv("VAD_NOISE_FLOOR_MAX", "0.03"))
+# Fricatives ("s", "f") are quiet but cross zero often; frames at least
+# WEAK_SPEECH_RATIO of the threshold with this zero-crossing rate count too
+ZCR_THRESHOLD = 0.25
+WEAK_SPEECH_RATIO = 0.5
+
+
+class RingBuffer:
+    """Preallocated float32 ring holding the most recent `capacity` samples.
+
+    write() overwrites the oldest samples once full; read() hands out the
+    unread samples in order and last() the newest ones, without allocating
+    per write. Not thread-safe on its own.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._written = 0  # total samples ever written
+        self._read = 0  # total samples ever read
+        self.overruns = 0  # samples overwritten before they were read
+
+    @property
+    def available(self) -> int:
+        return self._written - self._read
+
+    def write(self, samples: np.ndarray):
+        total = len(samples)
+        if total > self.capacity:
+            samples = samples[-self.capacity:]
+        n = len(samples)
+        start = (self._written + total - n) % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:n - first] = samples[first:]
+        self._written += total
+        if self.available > self.capacity:
+            self.overruns += self.available - self.capacity
+            self._read = self._written - self.capacity
+
+    def _copy(self, start: int, n: int) -> np.ndarray:
+        index = np.arange(start, start + n) % self.capacity
+        return self._data[index]
+
+    def read(self, n: Optional[int] = None) -> np.ndarray:
+        """Up to n (default all) unread samples, oldest first"""
+        n = self.available if n is None else min(n, self.available)
+        samples = self._copy(self._read, n)
+        self._read += n
+        return samples
+
+    def last(self, n: int) -> np.ndarray:
+        """The n most recent samples (fewer if not yet written), oldest first"""
+        n = min(n, self._written, self.capacity)
+        return self._copy(self._written - n, n)
+
+    def clear(self):
+        self._read = self._written = 0
+
+
+def frame_features(frames: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(RMS, zero-crossing rate) of every row of a (frames, samples) array in one pass"""
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frames.shape[1]
+    return rms, zcr
+
+
+class EnergyEndpointer:
+    """Energy and zero-crossing based start/end-of-speech detection.
+
+    Feed it float32 audio of any chunk size; it works in fixed 30 ms frames,
+    computing every frame's RMS and zero-crossing rate in one vectorized
+    step, against a threshold that follows the background noise. Audio goes
+    into a preallocated utterance buffer (with a short pre-roll, kept in a
+    ring, so the first syllable isn't clipped); a turn ends after silence_ms
+    of hangover. feed() returns ("start", None) and ("end", utterance) events.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = SAMPLE_RATE,
+        threshold: float = SILENCE_THRESHOLD / 32768,
+        silence_ms: int = SILENCE_MS,
+        max_seconds: float = MAX_UTTERANCE_SECONDS,
+        min_speech_ms: int = MIN_SPEECH_MS,
+        pre_roll_ms: int = PRE_ROLL_MS
+    ):
+        self.frame = sample_rate * FRAME_MS // 1000
+        self.threshold = threshold
+        self.noise_floor: Optional[float] = None
+        self._heard_background = False
+        self.silence_frames = max(1, silence_ms // FRAME_MS)
+        self.min_speech_frames = max(1, min_speech_ms // FRAME_MS)
+        self.pre_roll_frames = pre_roll_ms // FRAME_MS
+
+        self._buffer = np.zeros(int(max_seconds * sample_rate), dtype=np.float32)
+        self._length = 0
+        self._pending = np.zeros(0, dtype=np.float32)  # samples short of a full frame
+        # Pre-roll plus the frames that confirmed speech started
+        self._pre_roll = RingBuffer((self.pre_roll_frames + self.min_speech_frames) * self.frame)
+
+        self.speaking = False
+        self._voiced_frames = 0
+        self._silent_frames = 0
+
+    @property
+    def utterance(self) -> np.ndarray:
+        """View of the current utterance so far (copy it before handing it off)"""
+        return self._buffer[:self._length]
+
+    def _append(self, frame: np.ndarray) -> bool:
+        """Append to the utterance; False when the buffer is full"""
+        end = min(self._length + len(frame), len(self._buffer))
+        self._buffer[self._length:end] = frame[:end - self._length]
+        self._length = end
+        return end < len(self._buffer)
+
+    def _finish(self) -> np.ndarray:
+        utterance = self._buffer[:self._length].copy()
+        self._length = 0
+        self.speaking = False
+        self._voiced_frames = 0
+        self._silent_frames = 0
+        return utterance
+
+    def _voiced(self, frames: np.ndarray) -> np.ndarray:
+        """Which frames are speech, against a threshold that follows the noise floor"""
+        rms, zcr = frame_features(frames)
+        if not self.speaking:
+            quietest = float(rms.min())
+            if self.noise_floor is None or quietest < self.noise_floor:
+                # Drops at once to the quietest frame, so a steady hum is
+                # learned before it can pass for speech
+                self.noise_floor = quietest
+            if not self._heard_background:
+                self.noise_floor = min(self.noise_floor, NOISE_FLOOR_MAX)
+
+        threshold = max(self.threshold, (self.noise_floor or 0.0) * NOISE_FLOOR_RATIO)
+        voiced = (rms >= threshold) | ((rms >= threshold * WEAK_SPEECH_RATIO) & (zcr >= ZCR_THRESHOLD))
+
+        background = rms[~voiced]
+        if len(background) and not self.speaking:
+            # ...and rises slowly: an exponential average over the chunk's noise frames
+            weight = 1 - (1 - NOISE_FLOOR_ALPHA) ** len(background)
+            self.noise_floor += weight * (float(np.mean(background)) - self.noise_floor)
+            self._heard_background = True
+        return voiced
+
+    def feed(self, samples: np.ndarray) -> List[Tuple[str, Optional[np.ndarray]]]:
+        events = []
+        if len(self._pending):
+            samples = np.concatenate([self._pending, samples])
+
+        usable = len(samples) - len(samples) % self.frame
+        self._pending = samples[usable:].copy()
+        if usable == 0:
+            return events
+
+        frames = samples[:usable].reshape(-1, self.frame)
+        voiced = self._voiced(frames)
+
+        for frame, is_voiced in zip(frames, voiced):
+            if not self.speaking:
+                self._pre_roll.write(frame)
+                self._voiced_frames = self._voiced_frames + 1 if is_voiced else 0
+
+                if self._voiced_frames >= self.min_speech_frames:
+                    self.speaking = True
+                    self._silent_frames = 0
+                    self._append(self._pre_roll.last(self._pre_roll.capacity))
+                    self._pre_roll.clear()
+                    events.append(("start", None))
+                continue
+
+            room = self._append(frame)
+            self._silent_frames = 0 if is_voiced else self._silent_frames + 1
+            if self._silent_frames >= self.silence_frames or not room:
+                events.append(("end", self._finish()))
+
+        return events
+
+    def flush(self) -> Optional[np.ndarray]:
+        """End the current utterance now (client said it stopped talking)"""
+        if not self.speaking:
+            self._pre_roll.clear()
+            return None
+        return self._finish()
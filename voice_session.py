@@ -0,0 +1,199 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, Optional, Set
+
+import numpy as np
+from fastapi import WebSocket, WebSocketDisconnect
+
+import inference
+import llm
+import model_client
+import sessions
+import stt
+import tts
+from audio import MEDIA_TYPES, media_type_of, pcm16_to_float32
+from prompts import get_urgency_assessment, urgency_stream, EMERGENCY_AUDIO_RESPONSE
+from streaming import aiter_sentences, normalize_for_speech
+from vad import EnergyEndpointer, SAMPLE_RATE
+
+# Re-transcribe the growing utterance this often to send partial transcripts
+PARTIAL_INTERVAL_SECONDS = 1.0
+# Reply audio is sent in binary frames of at most this many bytes
+AUDIO_FRAME_BYTES = 8192
+
+
+class VoiceSession:
+    """One /ws/voice connection: a multi-turn, full-duplex voice conversation.
+
+    Client → server: binary frames of 16 kHz mono 16-bit PCM, plus an
+    optional {"type": "end_of_speech"} text message to end a turn early.
+    Server → client: JSON events (speech_start, partial, final, reply,
+    audio_start, audio_end, error) and binary reply-audio frames.
+    Speaking over a reply cancels it (barge-in). The connection is one LLM
+    conversation; reconnecting with ?session_id= from "ready" resumes it.
+    on_turn(user_text, reply, urgency) records each answered turn;
+    emergencies go to on_emergency(user_text) instead.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        conversation: sessions.Conversation,
+        on_emergency: Callable[[str], Awaitable[None]],
+        on_turn: Optional[Callable[[str, str, str], None]] = None
+    ):
+        self.ws = websocket
+        self.conversation = conversation
+        self.on_emergency = on_emergency
+        self.on_turn = on_turn
+        # Follow-ups that outlive their turn; referenced until done so they aren't collected
+        self._background: Set[asyncio.Task] = set()
+        self.endpointer = EnergyEndpointer()
+        self.urgency = urgency_stream()
+        self.emergency_sent = False
+        self.reply_task: Optional[asyncio.Task] = None
+        self.partial_task: Optional[asyncio.Task] = None
+        self._partial_mark = 0
+        self._send_lock = asyncio.Lock()
+
+    # ---------------- SENDING ----------------
+    async def send_event(self, type: str, **fields):
+        async with self._send_lock:
+            await self.ws.send_text(json.dumps({"type": type, **fields}))
+
+    async def send_audio(self, data: bytes):
+        async with self._send_lock:
+            for i in range(0, len(data), AUDIO_FRAME_BYTES):
+                await self.ws.send_bytes(data[i:i + AUDIO_FRAME_BYTES])
+
+    # ---------------- MAIN LOOP ----------------
+    async def run(self):
+        await self.send_event(
+            "ready", sample_rate=SAMPLE_RATE, format="pcm_s16le", session_id=self.conversation.session_id
+        )
+        try:
+            while True:
+                message = await self.ws.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    await self.on_audio(message["bytes"])
+                elif message.get("text"):
+                    await self.on_control(json.loads(message["text"]))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in (self.partial_task, self.reply_task):
+                if task is not None:
+                    task.cancel()
+
+    async def on_control(self, message: dict):
+        if message.get("type") == "end_of_speech":
+            utterance = self.endpointer.flush()
+            if utterance is not None:
+                self.end_turn(utterance)
+
+    async def on_audio(self, data: bytes):
+        samples = pcm16_to_float32(data[:len(data) - len(data) % 2])
+
+        for event, utterance in self.endpointer.feed(samples):
+            if event == "start":
+                # 🛑 Barge-in: the user talking over a reply cancels it
+                if self.reply_task is not None and not self.reply_task.done():
+                    self.reply_task.cancel()
+                self._partial_mark = 0
+                await self.send_event("speech_start")
+            else:
+                self.end_turn(utterance)
+
+        if self.endpointer.speaking:
+            heard = len(self.endpointer.utterance)
+            due = heard - self._partial_mark >= PARTIAL_INTERVAL_SECONDS * SAMPLE_RATE
+            if due and (self.partial_task is None or self.partial_task.done()):
+                self._partial_mark = heard
+                self.partial_task = asyncio.create_task(self.partial(self.endpointer.utterance.copy()))
+
+    def end_turn(self, utterance: np.ndarray):
+        if self.partial_task is not None:
+            self.partial_task.cancel()
+        self.reply_task = asyncio.create_task(self.respond(utterance))
+
+    # ---------------- TURN HANDLING ----------------
+    async def partial(self, audio: np.ndarray):
+        text = (await stt.transcribe_array(audio)).strip()
+        if not text:
+            return
+        await self.send_event("partial", text=text)
+
+        # 🚨 Escalate mid-utterance, before the user has finished talking
+        if self.urgency.feed(text, final=False) == "emergency" and not self.emergency_sent:
+            await self.send_emergency(text)
+
+    async def send_emergency(self, user_text: str):
+        self.emergency_sent = True
+        await self.send_event("urgency", level="emergency")
+        audio = await tts.canned_or_synthesize(EMERGENCY_AUDIO_RESPONSE, priority=inference.PRIORITY_EMERGENCY)
+        if audio:
+            # Piper WAV or, when Piper is missing, an ElevenLabs MP3
+            audio_format = "wav" if media_type_of(audio) == MEDIA_TYPES["wav"] else "mp3"
+            await self.send_event("audio_start", format=audio_format)
+            await self.send_audio(audio)
+            await self.send_event("audio_end")
+
+    async def respond(self, utterance: np.ndarray):
+        try:
+            await self._respond(utterance)
+        except asyncio.CancelledError:
+            raise
+        except inference.InferenceRejected as e:
+            await self.send_event("error", detail=e.detail)
+        except llm.LLMError:
+            await self.send_event("error", detail="LLM failed")
+        except model_client.ModelServerError:
+            await self.send_event("error", detail="Model server unavailable")
+        finally:
+            self.urgency.reset()
+
+    async def _respond(self, utterance: np.ndarray):
+        already_escalated = self.emergency_sent
+        self.emergency_sent = False
+
+        user_text = (await stt.transcribe_array(utterance)).strip()
+        if not user_text:
+            await self.send_event("error", detail="Could not transcribe audio")
+            return
+
+        self.urgency.feed(user_text, final=False)
+        level = get_urgency_assessment(user_text)["level"]
+        if self.urgency.escalated:
+            level = "emergency"
+        await self.send_event("final", text=user_text, urgency=level)
+
+        if level == "emergency":
+            if not already_escalated:
+                await self.send_emergency(user_text)
+            follow_up = asyncio.create_task(self.on_emergency(user_text))
+            self._background.add(follow_up)
+            follow_up.add_done_callback(self._background.discard)
+            return
+
+        # 🤖 LLM tokens → sentences → 🔊 PCM frames, as each sentence completes
+        audio_started = False
+        reply = []
+        async for sentence in aiter_sentences(sessions.stream_tokens(self.conversation, user_text)):
+            reply.append(sentence)
+            await self.send_event("reply", text=sentence)
+            if not tts.PIPER_AVAILABLE:
+                continue
+
+            chunks = await tts.piper_pcm(normalize_for_speech(sentence))
+            for pcm, sample_rate in chunks:
+                if not audio_started:
+                    await self.send_event("audio_start", format="pcm_s16le", sample_rate=sample_rate)
+                    audio_started = True
+                await self.send_audio(pcm)
+
+        if self.on_turn is not None:
+            self.on_turn(user_text, " ".join(reply), level)
+        if audio_started:
+            await self.send_event("audio_end")
@@ -0,0 +1,102 @@
+"""Replay a WAV file into /ws/voice as if it came from a microphone.
+
+    python ws_client.py input.wav --url ws://localhost:8000/ws/voice --api-key KEY
+
+Audio is sent in 20 ms frames at real-time pace (--fast sends as quickly as
+possible), followed by trailing silence so the server's endpointer closes
+the turn. Transcripts and reply text are printed; reply audio is written
+to --out.
+"""
+import argparse
+import asyncio
+import json
+import time
+import wave
+
+import numpy as np
+import websockets
+
+from audio import decode_wav, WHISPER_SAMPLE_RATE
+
+FRAME_MS = 20
+TRAILING_SILENCE_SECONDS = 1.5
+
+
+def load_pcm(path: str) -> bytes:
+    with open(path, "rb") as f:
+        audio = decode_wav(f.read())
+    if audio is None:
+        raise SystemExit(f"Unsupported WAV file: {path}")
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+async def send_audio(ws, pcm: bytes, fast: bool):
+    frame_bytes = WHISPER_SAMPLE_RATE * FRAME_MS // 1000 * 2
+    pcm += b"\x00" * int(TRAILING_SILENCE_SECONDS * WHISPER_SAMPLE_RATE) * 2
+    for i in range(0, len(pcm), frame_bytes):
+        await ws.send(pcm[i:i + frame_bytes])
+        if not fast:
+            await asyncio.sleep(FRAME_MS / 1000)
+
+
+async def receive_reply(ws, timeout: float):
+    """Print events until the reply audio ends; returns (audio bytes, format, sample rate)"""
+    audio = bytearray()
+    audio_format, sample_rate = None, None
+    while True:
+        message = await asyncio.wait_for(ws.recv(), timeout)
+        if isinstance(message, bytes):
+            audio.extend(message)
+            continue
+
+        event = json.loads(message)
+        if event["type"] == "audio_start":
+            audio_format, sample_rate = event["format"], event.get("sample_rate")
+        elif event["type"] == "audio_end":
+            return bytes(audio), audio_format, sample_rate
+        elif event["type"] == "error":
+            raise SystemExit(f"Server error: {event['detail']}")
+        print(f"[{time.strftime('%H:%M:%S')}] {event}")
+
+
+def write_reply(path: str, audio: bytes, audio_format: str, sample_rate: int):
+    if audio_format == "wav":
+        with open(path, "wb") as f:
+            f.write(audio)
+        return
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(audio)
+
+
+async def run(args):
+    pcm = load_pcm(args.wav)
+    async with websockets.connect(args.url, additional_headers={"x-api-key": args.api_key}) as ws:
+        print(json.loads(await ws.recv()))  # ready
+        start = time.perf_counter()
+        sender = asyncio.create_task(send_audio(ws, pcm, args.fast))
+        try:
+            audio, audio_format, sample_rate = await receive_reply(ws, args.timeout)
+        finally:
+            sender.cancel()
+
+        print(f"Reply audio: {len(audio)} bytes, {time.perf_counter() - start:.2f}s after first frame")
+        write_reply(args.out, audio, audio_format, sample_rate)
+        print(f"Saved {args.out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav", nargs="?", default="input.wav")
+    parser.add_argument("--url", default="ws://localhost:8000/ws/voice")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--out", default="reply.wav")
+    parser.add_argument("--fast", action="store_true", help="don't pace frames in real time")
+    parser.add_argument("--timeout", type=float, default=60)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()